@@ -0,0 +1,782 @@
+"""Chunked, partitioned version of the cleaning and feature steps in clean.ipynb.
+
+The notebook loads every CSV into memory. This pipeline streams the raw
+files in chunks and reproduces the notebook's ``cleaned_data.csv`` exactly:
+
+1. schema pass  - column dtypes the notebook's full-file ``read_csv`` + ``concat`` would infer
+2. stats pass   - the global statistics the notebook uses (triage modes per arrival source,
+                  5%/95% winsorization bounds, the wait_per_triage cap and median, the first
+                  valid date for the back-fill, the categorical levels), kept as value counts
+3. clean pass   - row-level cleaning and features, spilled to disk per (hospital_id, ward_code)
+4. build pass   - per partition: admission aggregates and counts, lag1/lag7 features, merge
+5. write pass   - partitions interleaved back into the notebook's (date, hospital, ward) order
+
+Peak memory is one chunk, one partition or one output month, plus value counts
+whose size is the number of distinct values per column. dtypes follow
+``read_csv(low_memory=False)`` inference.
+
+Raw tables come from the CSVs or from the Parquet store (``database/store.py``);
+the features go to ``cleaned_data.csv``, the store's ``cleaned`` table and its
+daily/weekly/monthly rollups (``database/rollups.py``).
+Reading from the store differs from the notebook in one respect: the store
+repairs BOM-mangled headers, so ``daily_metrics.csv`` keeps its real dates
+instead of having its ``ï»¿date`` column dropped and back-filled.
+
+A full run also saves a small rolling ``FeatureState`` (last 7 metrics rows
+per series plus unmatched days) so later days can be appended in time
+proportional to the new rows rather than the history.
+
+Usage::
+
+    python Data/clean.py [--source csv|store] [--dataset-dir DIR] [--output PATH] [--chunksize N]
+    python Data/clean.py --append-admissions new_admissions.csv --append-metrics new_metrics.csv
+"""
+import argparse
+import copy
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+DATA_DIR = Path(__file__).resolve().parent
+sys.path.append(str(DATA_DIR.parent))
+
+from database import dataset, rollups, store  # noqa: E402
+
+DATASET_DIR = DATA_DIR.parent / "database" / "Dataset"
+OUTPUT_PATH = DATA_DIR / "cleaned_data.csv"
+STATE_PATH = DATA_DIR / "feature_state.pkl"
+
+ADMISSION_FILES = ["admissions.csv", "main_admissions.csv"]
+METRIC_FILES = ["daily_metrics.csv", "main_daily_metrics.csv"]
+
+DROP_COLUMNS = ["ï»¿admission_id", "ï»¿date", "admission_id"]
+TRIAGE_REPLACEMENTS = {"6.5": None, "abc": None}
+WINSOR_QUANTILES = (0.05, 0.95)
+KEYS = ["date", "hospital_id", "ward_code"]
+PARTITION_KEYS = ["hospital_id", "ward_code"]
+CATEGORICAL_COLUMNS = ["arrival_source", "outcome", "sex"]
+AGG_COLUMNS = {"wait_per_triage": "mean", "age": "mean", "bed_impact_score": "mean"}
+LAG_COLUMNS = ["occupancy", "overflow", "discharges", "admission_rate_per_bed",
+               "avg_wait_minutes", "occupancy_rate"]
+LAG_DEPTH = 7
+NAT_STRINGS = {"", "NaT", "nat", "NAT", "nan", "NaN", "NAN", "now", "today"}
+
+
+# ---------------------------------------------------------------------------
+# Reading
+
+def _unify_dtype(a, b):
+    """dtype pandas ends up with when two parts of one column are combined."""
+    if a is None or a == b:
+        return b
+    if a.kind in "iuf" and b.kind in "iuf":
+        return np.result_type(a, b)
+    return np.dtype(object)
+
+
+def _with_missing(dtype):
+    """dtype of a column after concatenating it with a frame that lacks it (all NaN)."""
+    if dtype.kind in "iuf":
+        return np.result_type(dtype, np.float64)
+    return np.dtype(object)
+
+
+def infer_dtypes(paths, chunksize):
+    """Per-file dtypes, plus column order and dtypes of ``pd.concat([pd.read_csv(p) for p in paths])``.
+
+    Each file keeps its own dtypes when read (so an object column holds the
+    same mix of strings and numbers it would after the concat) and is then
+    cast to the combined dtype.
+    """
+    columns, dtypes, file_dtypes = [], {}, []
+    for i, path in enumerate(paths):
+        found = {}
+        for chunk in pd.read_csv(path, chunksize=chunksize, low_memory=False):
+            for col, dtype in chunk.dtypes.items():
+                found[col] = _unify_dtype(found.get(col), dtype)
+        file_dtypes.append(found)
+
+        for col in columns:
+            dtypes[col] = _unify_dtype(dtypes[col], found[col]) if col in found else _with_missing(dtypes[col])
+        for col, dtype in found.items():
+            if col not in dtypes:
+                columns.append(col)
+                dtypes[col] = dtype if i == 0 else _with_missing(dtype)
+    return columns, dtypes, file_dtypes
+
+
+def read_stream(paths, chunksize, columns, dtypes, file_dtypes):
+    """Yield chunks of the concatenated files with the combined column set and dtypes."""
+    for path, own in zip(paths, file_dtypes):
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=own, low_memory=False):
+            yield chunk.reindex(columns=columns).astype(dtypes)
+
+
+def existing(dataset_dir, names):
+    paths = []
+    for name in names:
+        path = Path(dataset_dir) / name
+        if path.exists():
+            paths.append(path)
+        else:
+            print(f"Skipping missing input {path}")
+    return paths
+
+
+class CsvSource:
+    """Raw CSV files read as if concatenated, with the notebook's dtypes."""
+
+    def __init__(self, paths, chunksize):
+        self.paths = paths
+        self.chunksize = chunksize
+        self.columns, self.dtypes, self.file_dtypes = infer_dtypes(paths, chunksize)
+
+    def chunks(self):
+        return read_stream(self.paths, self.chunksize, self.columns, self.dtypes, self.file_dtypes)
+
+
+class StoreSource:
+    """A table of the Parquet store, in ingest order, in chunks of ``chunksize`` rows."""
+
+    def __init__(self, name, chunksize, root=store.STORE_DIR):
+        self.chunksize = chunksize
+        self.table = store.read_arrow(name, root=root)
+        self.columns = self.table.column_names
+        self.dtypes = self.table.schema.empty_table().to_pandas().dtypes.to_dict()
+        # Nullable ints come back from Arrow as float, as they would from read_csv.
+        for field, column in zip(self.table.schema, self.table.columns):
+            if pa.types.is_integer(field.type) and column.null_count:
+                self.dtypes[field.name] = np.dtype(float)
+
+    def chunks(self):
+        for batch in self.table.to_batches(max_chunksize=self.chunksize):
+            yield batch.to_pandas().astype(self.dtypes)
+
+
+# ---------------------------------------------------------------------------
+# Exact statistics from value counts
+
+def _sorted_counts(counter, dtype):
+    items = sorted(counter.items())
+    values = np.array([value for value, _ in items], dtype=dtype)
+    counts = np.array([count for _, count in items], dtype=np.int64)
+    return values, counts
+
+
+def percentile(values, counts, q):
+    """``Series.quantile(q)`` of the multiset ``values`` x ``counts`` without materialising it.
+
+    Follows numpy's 'linear' method step by step (pandas hands np.percentile
+    ``q * 100``, which numpy divides back) so the result is bit-identical.
+    """
+    n = int(counts.sum())
+    if n == 0:
+        return np.nan
+
+    quantile = np.true_divide(np.array([q]) * 100.0, 100)
+    virtual = (n * quantile + (1 + quantile * (1 - 1 - 1)) - 1)[0]
+    cumulative = np.cumsum(counts)
+
+    def at(rank):
+        return values[np.searchsorted(cumulative, rank, side="right")]
+
+    if virtual >= n - 1:
+        return np.float64(values[-1])
+    if virtual < 0:
+        return np.float64(values[0])
+
+    previous = np.floor(virtual)
+    gamma = virtual - previous
+    a, b = at(int(previous)), at(int(previous) + 1)
+    diff = np.subtract(b, a)
+    if gamma >= 0.5:
+        return np.float64(np.subtract(b, diff * (1 - gamma)))
+    return np.float64(np.add(a, diff * gamma))
+
+
+def median(values, counts):
+    """``Series.median()`` of the multiset ``values`` x ``counts``."""
+    n = int(counts.sum())
+    if n == 0:
+        return np.nan
+    cumulative = np.cumsum(counts)
+    upper = np.float64(values[np.searchsorted(cumulative, n // 2, side="right")])
+    if n % 2:
+        return upper
+    lower = np.float64(values[np.searchsorted(cumulative, n // 2 - 1, side="right")])
+    return (lower + upper) / 2
+
+
+def _mode(counter):
+    """``Series.mode()[0]``: the most frequent value, smallest on ties."""
+    if not counter:
+        return np.nan
+    top = max(counter.values())
+    candidates = [value for value, count in counter.items() if count == top]
+    try:
+        return min(candidates)
+    except TypeError:
+        # Mixed strings and numbers cannot be sorted; pandas keeps them unsorted too.
+        return candidates[0]
+
+
+def _add_counts(counter, series):
+    for value, count in series.value_counts().items():
+        counter[value] += count
+
+
+def _key(value):
+    return None if pd.isna(value) else value
+
+
+def _first_non_null(values):
+    """Position of the first element pandas would guess a datetime format from."""
+    for i, value in enumerate(values):
+        if isinstance(value, str) and value not in NAT_STRINGS:
+            return i
+    return -1
+
+
+class StreamStats:
+    """Global statistics of one input stream (admissions or metrics), accumulated chunk by chunk."""
+
+    def __init__(self, columns, dtypes):
+        self.columns = [col for col in columns if col not in DROP_COLUMNS]
+        self.dtypes = {col: dtypes[col] for col in self.columns}
+        self.numeric = [col for col in self.columns if self.dtypes[col].kind in "iuf"]
+        self.counts = {col: Counter() for col in self.numeric}
+        self.has_triage = "triage_level" in self.columns
+        self.triage = Counter()
+        self.categories = {col: set() for col in CATEGORICAL_COLUMNS if col in self.columns}
+        self.date_format = None
+        self.first_date = pd.NaT
+
+        self.modes = {}
+        self.bounds = {}
+        self.upcast = set()
+        self.wait_cap = np.nan
+        self.wait_median = np.nan
+
+    def update(self, chunk):
+        chunk = chunk.drop(columns=[col for col in DROP_COLUMNS if col in chunk.columns])
+
+        if self.has_triage:
+            chunk["triage_level"] = chunk["triage_level"].replace(TRIAGE_REPLACEMENTS)
+            # The triage fill and wait_per_triage both depend on these three columns jointly.
+            joint = chunk.groupby(["arrival_source", "triage_level", "wait_minutes"], dropna=False, sort=False).size()
+            for key, count in joint.items():
+                self.triage[tuple(_key(v) for v in key)] += count
+
+        for col in self.numeric:
+            if col != "triage_level":
+                _add_counts(self.counts[col], chunk[col])
+
+        keyed = chunk[PARTITION_KEYS].notna().all(axis=1)
+        for col, levels in self.categories.items():
+            levels.update(chunk.loc[keyed, col].dropna().unique())
+
+        if "date" in chunk.columns and pd.isna(self.first_date):
+            self._scan_dates(chunk["date"])
+
+    def _scan_dates(self, dates):
+        if self.date_format is None and not pd.api.types.is_datetime64_any_dtype(dates):
+            first = _first_non_null(dates.to_numpy())
+            if first == -1:
+                return
+            self.date_format = pd.tseries.api.guess_datetime_format(dates.iloc[first]) or "mixed"
+        parsed = parse_dates(dates, self.date_format).dropna()
+        if len(parsed):
+            self.first_date = parsed.iloc[0]
+
+    def finalize(self):
+        """Turn the counts into the notebook's modes, bounds, cap and median."""
+        if self.has_triage:
+            per_source = {}
+            for (source, triage, _), count in self.triage.items():
+                if source is not None and triage is not None:
+                    per_source.setdefault(source, Counter())[triage] += count
+            self.modes = {source: _mode(counter) for source, counter in per_source.items()}
+
+            if "triage_level" in self.numeric:
+                filled = self.counts["triage_level"]
+                for (source, triage, _), count in self.triage.items():
+                    if source is not None:
+                        value = self.modes.get(source, np.nan) if triage is None else triage
+                        if not pd.isna(value):
+                            filled[value] += count
+
+        for col in self.numeric:
+            values, counts = _sorted_counts(self.counts[col], self.dtypes[col])
+            lower = percentile(values, counts, WINSOR_QUANTILES[0])
+            upper = percentile(values, counts, WINSOR_QUANTILES[1])
+            self.bounds[col] = (lower, upper)
+            # Clipping an int column to a fractional bound turns the whole column float.
+            if self.dtypes[col].kind in "iu" and len(values):
+                if (values.min() < lower and lower != np.floor(lower)) or \
+                        (values.max() > upper and upper != np.floor(upper)):
+                    self.upcast.add(col)
+
+        if self.has_triage:
+            self._finalize_wait_per_triage()
+
+    def _finalize_wait_per_triage(self):
+        rows = pd.DataFrame(
+            [(source, triage, wait, count) for (source, triage, wait), count in self.triage.items()],
+            columns=["arrival_source", "triage_level", "wait_minutes", "count"],
+        )
+        rows["wait_minutes"] = rows["wait_minutes"].astype(self.dtypes["wait_minutes"])
+        rows["triage_level"] = rows["triage_level"].astype(self.dtypes["triage_level"])
+        rows = clean_admissions(rows, self, features=False)
+
+        ratio = wait_per_triage(rows)
+        valid = ratio.notna()
+        counts = Counter()
+        for value, count in zip(ratio[valid], rows.loc[valid, "count"]):
+            counts[value] += count
+        values, counts = _sorted_counts(counts, float)
+        self.wait_cap = percentile(values, counts, 0.95)
+
+        capped = Counter()
+        for value, count in zip(values.clip(0, self.wait_cap), counts):
+            capped[value] += count
+        self.wait_median = median(*_sorted_counts(capped, float))
+
+
+# ---------------------------------------------------------------------------
+# Row-level cleaning (same operations as the notebook, applied per chunk)
+
+def parse_dates(dates, date_format):
+    return pd.to_datetime(dates, format=date_format, errors="coerce")
+
+
+class DateFill:
+    """Forward fill across chunk boundaries; rows before the first valid date get that date."""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.last = None
+
+    def __call__(self, dates):
+        dates = parse_dates(dates, self.stats.date_format).ffill()
+        dates = dates.fillna(self.last if self.last is not None else self.stats.first_date)
+        if len(dates):
+            self.last = dates.iloc[-1]
+        return dates
+
+
+def winsorize(chunk, stats):
+    for col in stats.numeric:
+        if col not in chunk.columns:
+            continue
+        if col in stats.upcast:
+            chunk[col] = chunk[col].astype(float)
+        lower, upper = stats.bounds[col]
+        chunk[col] = chunk[col].clip(lower=lower, upper=upper)
+    return chunk
+
+
+def wait_per_triage(admissions):
+    return admissions["wait_minutes"] / pd.to_numeric(admissions["triage_level"], errors="coerce")
+
+
+def clean_admissions(chunk, stats, date_fill=None, features=True):
+    """Drop ids, repair triage, fill dates, winsorize and derive the admission features."""
+    chunk = chunk.drop(columns=[col for col in DROP_COLUMNS if col in chunk.columns])
+    chunk["triage_level"] = chunk["triage_level"].replace(TRIAGE_REPLACEMENTS)
+
+    # groupby('arrival_source').transform(fillna(mode)) leaves rows without a source as NaN.
+    fill = chunk["arrival_source"].map(stats.modes)
+    triage = chunk["triage_level"].where(chunk["triage_level"].notna(), fill)
+    triage[chunk["arrival_source"].isna()] = np.nan
+    chunk["triage_level"] = triage
+
+    if date_fill is not None:
+        chunk["date"] = date_fill(chunk["date"])
+    chunk = winsorize(chunk, stats)
+    if not features:
+        return chunk
+
+    triage_numeric = pd.to_numeric(chunk["triage_level"], errors="coerce")
+    chunk["wait_per_triage"] = (chunk["wait_minutes"] / triage_numeric).clip(lower=0, upper=stats.wait_cap)
+    chunk["wait_per_triage"] = chunk["wait_per_triage"].fillna(stats.wait_median)
+    chunk["bed_impact_score"] = (
+        chunk["length_of_stay_days"] *
+        (1 + chunk["procedure_flag"]) *
+        (6 - triage_numeric)
+    )
+    return chunk.drop(columns=["triage_level", "wait_minutes", "length_of_stay_days", "procedure_flag"])
+
+
+def clean_metrics(chunk, stats, date_fill):
+    chunk = chunk.drop(columns=[col for col in DROP_COLUMNS if col in chunk.columns])
+    chunk["date"] = date_fill(chunk["date"])
+    return winsorize(chunk, stats)
+
+
+# ---------------------------------------------------------------------------
+# Per-partition features
+
+def aggregate_admissions(admissions, categories):
+    """Daily means and categorical counts per (date, hospital_id, ward_code)."""
+    agg = admissions.groupby(KEYS).agg(AGG_COLUMNS).reset_index()
+    for col in CATEGORICAL_COLUMNS:
+        counts = admissions.groupby(KEYS + [col], observed=True).size()
+        counts = counts.unstack(fill_value=0) if len(counts) else pd.DataFrame(index=agg.set_index(KEYS).index[:0])
+        counts = counts.reindex(columns=categories[col], fill_value=0)
+        counts.columns = [f"{col}_{c}" for c in counts.columns]
+        agg = agg.merge(counts.reset_index(), on=KEYS, how="left")
+    return agg
+
+
+def lag_features(metrics):
+    """lag1/lag7 of the operational columns for one (hospital_id, ward_code) series."""
+    metrics = metrics.sort_values("date", kind="mergesort")
+    for col in LAG_COLUMNS:
+        metrics[f"{col}_lag1"] = metrics[col].shift(1)
+        metrics[f"{col}_lag7"] = metrics[col].shift(7)
+    return metrics.drop(columns=LAG_COLUMNS).dropna()
+
+
+def build_partition(admissions, metrics, categories):
+    """Cleaned feature rows of one series, plus which count blocks picked up NaNs."""
+    agg = aggregate_admissions(admissions, categories)
+    missing_counts = {col for col in CATEGORICAL_COLUMNS
+                      if agg.filter(like=f"{col}_").isna().any().any()}
+    merged = pd.merge(agg, lag_features(metrics), on=KEYS, how="inner")
+    return merged, missing_counts
+
+
+# ---------------------------------------------------------------------------
+# Spilling and output
+
+class Spill:
+    """Append-only pickled chunks on disk, grouped by (hospital_id, ward_code)."""
+
+    def __init__(self, root, name):
+        self.root = Path(root) / name
+        self.parts = {}
+
+    def write(self, frame):
+        frame = frame.dropna(subset=PARTITION_KEYS)
+        for key, part in frame.groupby(PARTITION_KEYS, sort=False):
+            files = self.parts.setdefault(key, [])
+            part_dir = self.root / str(list(self.parts).index(key))
+            part_dir.mkdir(parents=True, exist_ok=True)
+            files.append(part_dir / f"{len(files):06d}.pkl")
+            part.to_pickle(files[-1])
+
+    def read(self, key, empty):
+        files = self.parts.get(key)
+        if not files:
+            return empty
+        return pd.concat([pd.read_pickle(f) for f in files], ignore_index=True)
+
+
+def _date_strings(dates, flags):
+    if flags["dates_only"]:
+        return dates.dt.strftime("%Y-%m-%d")
+    if not flags["subsecond"]:
+        return dates.dt.strftime("%Y-%m-%d %H:%M:%S")
+    return dates
+
+
+# ---------------------------------------------------------------------------
+# Incremental updates
+
+class FeatureState:
+    """Rolling per-series state for appending new days without recomputing history.
+
+    ``history`` holds the last ``LAG_DEPTH`` cleaned metrics rows of every
+    (hospital_id, ward_code), enough for lag1/lag7. ``pending`` (cleaned
+    admissions) and ``waiting`` (metric rows with lags) hold days still
+    waiting for the other half of the merge. Cleaning statistics
+    (winsorization bounds, triage modes, categorical levels) stay frozen at
+    the full run that built the state; rerun the full pipeline to refresh them.
+    """
+
+    def __init__(self, adm_stats, met_stats, categories, date_flags, missing_counts):
+        self.adm_stats = _frozen(adm_stats)
+        self.met_stats = _frozen(met_stats)
+        self.adm_dates = DateFill(self.adm_stats)
+        self.met_dates = DateFill(self.met_stats)
+        self.categories = categories
+        self.date_flags = date_flags
+        self.missing_counts = missing_counts
+        self.columns = None
+        self.history = self.pending = self.waiting = None
+        self._tracked = []
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        with open(path, "rb") as f:
+            return _StateUnpickler(f).load()
+
+    def save(self, path=STATE_PATH):
+        tmp_path = Path(path).with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self, f)
+        os.replace(tmp_path, path)
+
+    def track(self, admissions, metrics):
+        """Seed one series from the full run's cleaned partitions; ``finish_tracking`` combines them."""
+        metrics = metrics.sort_values("date", kind="mergesort")
+        features = lag_features(metrics)
+        if len(admissions):
+            features = features[features["date"] > admissions["date"].max()]
+        if len(metrics):
+            admissions = admissions[admissions["date"] > metrics["date"].iloc[-1]]
+        self._tracked.append((metrics.tail(LAG_DEPTH), admissions, features))
+
+    def finish_tracking(self):
+        history, pending, waiting = zip(*self._tracked)
+        self.history, self.pending, self.waiting = _stack(history), _stack(pending), _stack(waiting)
+        self._tracked = []
+
+    def update(self, admissions=None, metrics=None):
+        """Clean newly arrived raw rows and return the feature rows they complete."""
+        if admissions is not None and len(admissions):
+            admissions = clean_admissions(_conform(admissions, self.adm_stats), self.adm_stats, self.adm_dates)
+            self.pending = _stack([self.pending, admissions.dropna(subset=PARTITION_KEYS)])
+
+        if metrics is not None and len(metrics):
+            metrics = clean_metrics(_conform(metrics, self.met_stats), self.met_stats, self.met_dates)
+            self._advance(metrics.dropna(subset=PARTITION_KEYS))
+
+        rows = self._emit()
+        if rows.empty:
+            return pd.DataFrame(columns=self.columns)
+        rows = rows.sort_values(KEYS, kind="mergesort")
+        for col in self.missing_counts:
+            block = [c for c in rows.columns if c.startswith(f"{col}_")]
+            rows[block] = rows[block].astype(float)
+        rows["date"] = _date_strings(rows["date"], self.date_flags)
+        return rows if self.columns is None else rows.reindex(columns=self.columns)
+
+    def _advance(self, metrics):
+        """Lag the new metric rows against each series' history and roll the history forward."""
+        columns = list(self.history.columns)
+        combined = pd.concat([self.history, metrics[columns]], ignore_index=True)
+        # Stable sort keeps history ahead of new rows on equal dates, as in lag_features.
+        combined = combined.sort_values(PARTITION_KEYS + ["date"], kind="mergesort")
+        grouped = combined.groupby(PARTITION_KEYS, sort=False)
+        for col in LAG_COLUMNS:
+            combined[f"{col}_lag1"] = grouped[col].shift(1)
+            combined[f"{col}_lag7"] = grouped[col].shift(7)
+
+        new = combined.index >= len(self.history)
+        features = combined[new].drop(columns=LAG_COLUMNS).dropna()
+        self.waiting = _stack([self.waiting, features])
+        self.history = combined.loc[grouped.cumcount(ascending=False) < LAG_DEPTH, columns].reset_index(drop=True)
+
+    def _emit(self):
+        """Merge the days that now have both halves; drop halves older than the lag window."""
+        pending_keys = pd.MultiIndex.from_frame(self.pending[KEYS])
+        waiting_keys = pd.MultiIndex.from_frame(self.waiting[KEYS])
+        done = pending_keys.isin(waiting_keys)
+        matched = waiting_keys.isin(pending_keys[done])
+
+        agg = aggregate_admissions(self.pending[done], self.categories)
+        rows = pd.merge(agg, self.waiting[matched], on=KEYS, how="inner")
+
+        oldest = self.history.groupby(PARTITION_KEYS)["date"].min().rename("_oldest")
+        self.pending = _recent(self.pending[~done], oldest)
+        self.waiting = _recent(self.waiting[~matched], oldest)
+        return rows
+
+
+def _stack(frames):
+    frames = [frame for frame in frames if frame is not None]
+    non_empty = [frame for frame in frames if len(frame)]
+    return pd.concat(non_empty or frames[:1], ignore_index=True)
+
+
+def _recent(frame, oldest):
+    cutoff = frame.join(oldest, on=PARTITION_KEYS)["_oldest"]
+    return frame[~(frame["date"] < cutoff)].reset_index(drop=True)
+
+
+def _frozen(stats):
+    """Copy of finalized stats without the value counts they were computed from."""
+    stats = copy.copy(stats)
+    stats.counts = {}
+    stats.triage = Counter()
+    return stats
+
+
+def _conform(frame, stats):
+    """Give newly read rows the full run's columns and dtypes (ints with gaps become float)."""
+    frame = frame.reindex(columns=stats.columns)
+    dtypes = {
+        col: np.dtype(float) if dtype.kind in "iu" and frame[col].isna().any() else dtype
+        for col, dtype in stats.dtypes.items()
+    }
+    return frame.astype(dtypes)
+
+
+class _StateUnpickler(pickle.Unpickler):
+    """Resolve state classes to this module whether it ran as a script or was imported."""
+
+    def find_class(self, module, name):
+        if name in ("FeatureState", "StreamStats", "DateFill"):
+            return globals()[name]
+        return super().find_class(module, name)
+
+
+def append_days(admission_paths, metric_paths, output_path=OUTPUT_PATH, state_path=STATE_PATH,
+                store_dir=store.STORE_DIR):
+    """Append the feature rows completed by new raw files to ``output_path`` and advance the state."""
+    state = FeatureState.load(state_path)
+    admissions = pd.concat([pd.read_csv(p, low_memory=False) for p in admission_paths]) if admission_paths else None
+    metrics = pd.concat([pd.read_csv(p, low_memory=False) for p in metric_paths]) if metric_paths else None
+
+    rows = state.update(admissions, metrics)
+    if len(rows):
+        rows.to_csv(output_path, mode="a", index=False, header=not Path(output_path).exists())
+        dated = rows.assign(date=pd.to_datetime(rows["date"]))
+        if store_dir is not None and store.exists("cleaned", store_dir):
+            store.write_table(dated, "cleaned", store_dir)
+        if store_dir is not None:
+            # Only the new rows are aggregated and added into the rollups.
+            existing = rollups.Rollups.load(rollups.rollup_dir(store_dir))
+            if existing.tables:
+                existing.update(dated).save(rollups.rollup_dir(store_dir))
+    state.save(state_path)
+    return rows
+
+
+def run_pipeline(dataset_dir=DATASET_DIR, output_path=OUTPUT_PATH, chunksize=100_000, work_dir=None,
+                 state_path=STATE_PATH, source="csv", store_dir=store.STORE_DIR):
+    """Build the cleaned features from the raw CSVs or (``source="store"``) the Parquet store.
+
+    The features are written to ``output_path`` and, when ``store_dir`` is
+    set, to the store's ``cleaned`` table and rollups.
+    """
+    if source == "store":
+        adm_source = StoreSource("admissions", chunksize, store_dir)
+        met_source = StoreSource("daily_metrics", chunksize, store_dir)
+    else:
+        adm_source = CsvSource(existing(dataset_dir, ADMISSION_FILES), chunksize)
+        met_source = CsvSource(existing(dataset_dir, METRIC_FILES), chunksize)
+
+    adm_stats = StreamStats(adm_source.columns, adm_source.dtypes)
+    met_stats = StreamStats(met_source.columns, met_source.dtypes)
+    for chunk in adm_source.chunks():
+        adm_stats.update(chunk)
+    for chunk in met_source.chunks():
+        met_stats.update(chunk)
+    adm_stats.finalize()
+    met_stats.finalize()
+    categories = {col: sorted(levels) for col, levels in adm_stats.categories.items()}
+
+    work = Path(tempfile.mkdtemp(prefix="medoptix_clean_", dir=work_dir))
+    try:
+        adm_spill, met_spill = Spill(work, "admissions"), Spill(work, "metrics")
+        adm_empty = met_empty = None
+
+        adm_fill = DateFill(adm_stats)
+        for chunk in adm_source.chunks():
+            chunk = dataset.categorize(clean_admissions(chunk, adm_stats, adm_fill), categories)
+            adm_empty = chunk.iloc[:0] if adm_empty is None else adm_empty
+            adm_spill.write(chunk)
+
+        met_fill = DateFill(met_stats)
+        for chunk in met_source.chunks():
+            chunk = clean_metrics(chunk, met_stats, met_fill)
+            met_empty = chunk.iloc[:0] if met_empty is None else met_empty
+            met_spill.write(chunk)
+
+        # Each partition's rows are bucketed by month so the final write can
+        # interleave partitions in (date, hospital_id, ward_code) order.
+        out_spill = work / "output"
+        missing_counts = set()
+        flags = {"dates_only": True, "subsecond": False}
+        state = FeatureState(adm_stats, met_stats, categories, flags, missing_counts)
+        state.adm_dates.last, state.met_dates.last = adm_fill.last, met_fill.last
+        for i, key in enumerate(dict.fromkeys(list(adm_spill.parts) + list(met_spill.parts))):
+            admissions, metrics = adm_spill.read(key, adm_empty), met_spill.read(key, met_empty)
+            if admissions is None or metrics is None:
+                continue
+            state.track(admissions, metrics)
+            features, missing = build_partition(admissions, metrics, categories)
+            missing_counts |= missing
+            if features.empty:
+                continue
+            state.columns = list(features.columns)
+            dates = features["date"]
+            flags["dates_only"] &= bool((dates == dates.dt.normalize()).all())
+            flags["subsecond"] |= bool((dates.dt.microsecond | dates.dt.nanosecond).any())
+            for month, rows in features.groupby(dates.dt.strftime("%Y-%m"), sort=False):
+                month_dir = out_spill / month
+                month_dir.mkdir(parents=True, exist_ok=True)
+                rows.to_pickle(month_dir / f"{i:06d}.pkl")
+
+        header = True
+        rows_written = 0
+        rolled = rollups.Rollups()
+        if store_dir is not None and store.exists("cleaned", store_dir):
+            shutil.rmtree(store.table_path("cleaned", store_dir))
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, "w", newline="") as f:
+            for month_dir in sorted(out_spill.iterdir()) if out_spill.exists() else []:
+                rows = pd.concat([pd.read_pickle(p) for p in sorted(month_dir.iterdir())], ignore_index=True)
+                rows = rows.sort_values(KEYS, kind="mergesort")
+                for col in missing_counts:
+                    block = [c for c in rows.columns if c.startswith(f"{col}_")]
+                    rows[block] = rows[block].astype(float)
+                if store_dir is not None:
+                    store.write_table(rows, "cleaned", store_dir, first_row_id=rows_written)
+                    rows_written += len(rows)
+                    rolled.update(rows)
+                rows["date"] = _date_strings(rows["date"], flags)
+                rows.to_csv(f, index=False, header=header)
+                header = False
+        if store_dir is not None:
+            shutil.rmtree(rollups.rollup_dir(store_dir), ignore_errors=True)
+            rolled.save(rollups.rollup_dir(store_dir))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    if state_path is not None:
+        state.finish_tracking()
+        state.save(state_path)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build cleaned_data.csv from the raw datasets in bounded memory.")
+    parser.add_argument("--dataset-dir", default=DATASET_DIR, type=Path)
+    parser.add_argument("--output", default=OUTPUT_PATH, type=Path)
+    parser.add_argument("--chunksize", default=100_000, type=int)
+    parser.add_argument("--work-dir", default=None, help="Where to spill partitions (default: system temp)")
+    parser.add_argument("--state", default=STATE_PATH, type=Path, help="Rolling state for incremental appends")
+    parser.add_argument("--source", choices=["csv", "store"], default=None,
+                        help="Read raw tables from the CSVs or the Parquet store (default: store once ingested)")
+    parser.add_argument("--store-dir", default=store.STORE_DIR, type=Path)
+    parser.add_argument("--append-admissions", nargs="*", default=[], type=Path,
+                        help="New admissions files to append incrementally instead of a full rebuild")
+    parser.add_argument("--append-metrics", nargs="*", default=[], type=Path,
+                        help="New daily metrics files to append incrementally instead of a full rebuild")
+    args = parser.parse_args()
+
+    if args.append_admissions or args.append_metrics:
+        rows = append_days(args.append_admissions, args.append_metrics, args.output, args.state, args.store_dir)
+        print(f"Appended {len(rows)} rows to {args.output}")
+        return
+
+    source = args.source or ("store" if store.exists("admissions", args.store_dir) else "csv")
+    print(f"Reading raw tables from {source}")
+    path = run_pipeline(args.dataset_dir, args.output, args.chunksize, args.work_dir, args.state,
+                        source, args.store_dir)
+    print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Benchmarks for the forecasting, serving, model-loading and feature-pipeline hot paths.
+
+Suites:
+
+    predict   - run_internal_prediction (the app path) and the /predict scoring
+                path, p50/p95 latency for every horizon 1..30
+    serve     - /predict through the FastAPI app in-process: requests/s and
+                latency at several concurrency levels
+    load      - cold start (imports + load + first forecast) of the pickled and
+                compact global model, each in a fresh process
+    pipeline  - Data/clean.py on synthetic copies of the datasets at 1x, 10x, 100x
+
+A run writes one JSON document: run metadata plus a flat ``metrics`` map.
+Metric names ending in ``_per_s`` are higher-is-better, all others
+lower-is-better. The run fails (exit code 1) when a metric breaks its budget
+in ``thresholds.json`` or, with ``--baseline``, is more than ``--tolerance``
+worse than the same metric in a previous run.
+
+Usage::
+
+    python -m benchmarks.bench                                  # all suites -> benchmarks/results/<commit>.json
+    python -m benchmarks.bench --suite predict --suite serve
+    python -m benchmarks.bench --baseline benchmarks/results/abc1234.json --tolerance 0.25
+    python -m benchmarks.bench --scales 1 10                    # skip the 100x pipeline run
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from database import store  # noqa: E402
+from deploy.forecasting import ForecastEngine, run_internal_prediction  # noqa: E402
+from model.compact import COMPACT_DIR, PICKLE_PATH, compare_load, load_model, load_schema  # noqa: E402
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+THRESHOLDS_PATH = BENCH_DIR / "thresholds.json"
+
+SUITES = ("predict", "serve", "load", "pipeline")
+STEPS = range(1, 31)
+CONCURRENCY = (1, 8, 32, 128)
+SCALES = (1, 10, 100)
+
+# A representative request, as the app's forecast form sends it.
+FEATURES = {
+    "hospital_id": 1, "ward_code_ICU": 1, "occupancy_rate_lag1": 0.6, "overflow_lag1": 42.0,
+    "avg_wait_minutes_lag1": 227.0, "base_beds": 30, "effective_capacity": 34, "staffing_index": 0.927,
+}
+
+
+def _percentiles(samples, prefix, metrics):
+    ms = np.asarray(samples) * 1000
+    metrics[f"{prefix}.p50_ms"] = float(np.percentile(ms, 50))
+    metrics[f"{prefix}.p95_ms"] = float(np.percentile(ms, 95))
+
+
+def _time_calls(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_predict(repeat=50):
+    """Latency of one forecast per horizon via the app path and the API's engine path."""
+    schema = load_schema()
+    model = load_model()
+    engine = ForecastEngine(model, schema)
+    metrics = {}
+    for steps in STEPS:
+        _percentiles(_time_calls(lambda: run_internal_prediction(model, schema, steps, FEATURES), repeat),
+                     f"predict.app.steps_{steps}", metrics)
+        # The engine caches its baseline per horizon; reset it so each call pays the full cost.
+        def scored():
+            engine._baseline = np.empty(0)
+            engine.forecast_many([FEATURES], [steps])
+        _percentiles(_time_calls(scored, repeat), f"predict.engine.steps_{steps}", metrics)
+    return metrics
+
+
+def bench_serve(requests=400, concurrency=CONCURRENCY):
+    """Requests/s and latency of POST /predict, driven in-process through ASGI."""
+    import httpx
+
+    # Only the models are wanted: no forecast table written, no model-watcher thread started.
+    os.environ["MEDOPTIX_MATERIALIZE"] = "0"
+    os.environ["MEDOPTIX_RELOAD_INTERVAL_S"] = "0"
+    from deploy import inference
+
+    inference.load_artifacts()
+
+    async def run(level):
+        transport = httpx.ASGITransport(app=inference.app)
+        limit = asyncio.Semaphore(level)
+        samples = []
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def one(i):
+                async with limit:
+                    body = {"steps": 1 + i % 30, "features": FEATURES}
+                    start = time.perf_counter()
+                    response = await client.post("/predict", json=body)
+                    samples.append(time.perf_counter() - start)
+                    response.raise_for_status()
+
+            await one(0)  # warm-up: starts the batcher
+            samples.clear()
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(requests)))
+            elapsed = time.perf_counter() - start
+        await inference.BATCHER.close()
+        return samples, elapsed
+
+    metrics = {}
+    for level in concurrency:
+        samples, elapsed = asyncio.run(run(level))
+        metrics[f"serve.predict.c{level}.requests_per_s"] = requests / elapsed
+        _percentiles(samples, f"serve.predict.c{level}", metrics)
+    return metrics
+
+
+def bench_load():
+    """Cold-start seconds and peak RSS of each model format, each in a fresh process."""
+    metrics = {}
+    formats = {"pickle": PICKLE_PATH.exists(), "compact": (COMPACT_DIR / "manifest.json").exists()}
+    if all(formats.values()):
+        for kind, row in compare_load().items():
+            metrics[f"load.{kind}.cold_start_s"] = row["cold_start_s"]
+            metrics[f"load.{kind}.peak_rss_mb"] = row["peak_rss_mb"]
+    else:
+        print(f"Skipping load suite: missing model artifacts {[k for k, ok in formats.items() if not ok]}")
+    return metrics
+
+
+def synthetic_dataset(out_dir, scale, dataset_dir=store.DATASET_DIR):
+    """Write ``scale`` copies of the admissions and metrics CSVs, each copy as new hospitals.
+
+    Copies keep every raw value (including the dirty ones) and shift
+    ``hospital_id`` by 1000 per copy, so the pipeline sees ``scale`` times as
+    many series over the same dates.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rows = 0
+    for name in ("admissions", "daily_metrics"):
+        for file in store.SOURCE_FILES[name]:
+            path = Path(dataset_dir) / file
+            if not path.exists():
+                continue
+            raw = pd.read_csv(path, dtype=str, keep_default_na=False)
+            ids = pd.to_numeric(raw["hospital_id"], errors="coerce")
+            copies = []
+            for i in range(scale):
+                copy = raw.copy()
+                shifted = (ids + 1000 * i).astype("Int64").astype(str)
+                copy["hospital_id"] = shifted.where(ids.notna(), raw["hospital_id"])
+                copies.append(copy)
+            frame = pd.concat(copies, ignore_index=True)
+            frame.to_csv(out_dir / file, index=False)
+            rows += len(frame)
+    for file in store.SOURCE_FILES["hospitals"] + store.SOURCE_FILES["wards"]:
+        if (Path(dataset_dir) / file).exists():
+            shutil.copy(Path(dataset_dir) / file, out_dir / file)
+    return rows
+
+
+def bench_pipeline(scales=SCALES):
+    """Seconds and input rows/s of the cleaning pipeline on synthetic datasets."""
+    sys.path.insert(0, str(ROOT / "Data"))
+    from clean import run_pipeline
+
+    metrics = {}
+    for scale in scales:
+        with tempfile.TemporaryDirectory(prefix="medoptix_bench_") as work:
+            dataset_dir = Path(work) / "Dataset"
+            rows = synthetic_dataset(dataset_dir, scale)
+            start = time.perf_counter()
+            run_pipeline(dataset_dir, Path(work) / "cleaned_data.csv", work_dir=work, state_path=None,
+                         store_dir=None)
+            elapsed = time.perf_counter() - start
+        metrics[f"pipeline.x{scale}.seconds"] = elapsed
+        metrics[f"pipeline.x{scale}.rows_per_s"] = rows / elapsed
+    return metrics
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(suites=SUITES, scales=SCALES):
+    metrics = {}
+    for suite in suites:
+        start = time.perf_counter()
+        if suite == "predict":
+            metrics.update(bench_predict())
+        elif suite == "serve":
+            metrics.update(bench_serve())
+        elif suite == "load":
+            metrics.update(bench_load())
+        elif suite == "pipeline":
+            metrics.update(bench_pipeline(scales))
+        print(f"{suite:8s} done in {time.perf_counter() - start:.1f}s")
+
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "suites": list(suites),
+        "metrics": metrics,
+    }
+
+
+def higher_is_better(name):
+    return name.endswith("_per_s")
+
+
+def check(result, thresholds=None, baseline=None, tolerance=0.2):
+    """Return a list of human-readable regressions against budgets and a baseline run."""
+    failures = []
+    metrics = result["metrics"]
+    for name, budget in (thresholds or {}).items():
+        if name not in metrics:
+            continue
+        value = metrics[name]
+        if "max" in budget and value > budget["max"]:
+            failures.append(f"{name} = {value:.4g} exceeds budget {budget['max']:.4g}")
+        if "min" in budget and value < budget["min"]:
+            failures.append(f"{name} = {value:.4g} is below budget {budget['min']:.4g}")
+
+    for name, before in (baseline or {}).get("metrics", {}).items():
+        if name not in metrics or not before:
+            continue
+        change = metrics[name] / before - 1
+        worse = -change if higher_is_better(name) else change
+        if worse > tolerance:
+            failures.append(f"{name} = {metrics[name]:.4g} is {worse:.0%} worse than baseline {before:.4g}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the MedOptix benchmark suite.")
+    parser.add_argument("--suite", action="append", choices=SUITES, help="suite to run (repeatable; default all)")
+    parser.add_argument("--scales", nargs="+", type=int, default=list(SCALES))
+    parser.add_argument("--out", type=Path, default=None, help="result file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--thresholds", type=Path, default=THRESHOLDS_PATH)
+    parser.add_argument("--baseline", type=Path, default=None, help="previous result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown vs the baseline")
+    args = parser.parse_args()
+
+    result = run(args.suite or SUITES, args.scales)
+    out = args.out or RESULTS_DIR / f"{result['commit']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    print(f"Wrote {out}")
+
+    thresholds = None
+    if args.thresholds and args.thresholds.exists():
+        with open(args.thresholds, "r") as f:
+            thresholds = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    failures = check(result, thresholds, baseline, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if failures:
+        raise SystemExit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
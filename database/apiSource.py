@@ -1,35 +1,431 @@
+"""Fetch the API tables into the Parquet store.
+
+``fetch_all`` downloads every ``api_data`` endpoint concurrently over one
+pooled ``httpx.AsyncClient``, retrying transient failures with exponential
+backoff. Bodies are streamed to ``database/downloads/`` in chunks, and
+``ingest`` loads them into the store in chunks; JSON arrays are decoded one
+record at a time. A table's ETag / Last-Modified validators are recorded
+once it is loaded, and sent back on the next run, so unchanged tables come
+back as 304 and are skipped. ``api_call`` is the original
+one-request-at-a-time fetch, kept as the baseline for ``compare``.
+
+Usage::
+
+    python -m database.apiSource ingest [--base-url URL]
+    python -m database.apiSource standin [DATASET_DIR] [--port 8765] [--latency 0.05]
+    python -m database.apiSource compare [DATASET_DIR] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
 import requests
+import pandas as pd
 from dotenv import load_dotenv
-import os
+
+from database import store
+from database.store import write_table
 
 
 load_dotenv()
 
 api_base = os.getenv("base_url")
 
-def api_call(endpoint, file_name):
+CONCURRENCY = int(os.getenv("MEDOPTIX_API_CONCURRENCY", "4"))
+RETRIES = int(os.getenv("MEDOPTIX_API_RETRIES", "3"))
+BACKOFF_S = float(os.getenv("MEDOPTIX_API_BACKOFF_S", "0.5"))
+TIMEOUT_S = float(os.getenv("MEDOPTIX_API_TIMEOUT_S", "60"))
+CHUNK_BYTES = 1 << 20
+DOWNLOAD_DIR = Path(__file__).resolve().parent / "downloads"
+STATE_PATH = Path(__file__).resolve().parent / "api_state.json"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def api_call(endpoint, table, base=None, root=store.STORE_DIR):
 
     try:
-        api = f'{api_base}/{endpoint}'
+        api = f'{base or api_base}/{endpoint}'
 
         response = requests.get(api)
 
         if response.status_code == 200:
             data = response.json()
 
-            file_path = os.path.join("Datasets",file_name)
+            write_table(pd.DataFrame(data), table, root, mode="overwrite")
 
-            with open(file_path, "wb") as file:
-                file.write(data)
-                
         else:
             print(f"Failed to fetch data from {endpoint}. Status code: {response.status_code}")
     except Exception as e:
-        print(str(e))   
+        print(str(e))
 
 api_data = {
-    'admissions': 'admissions.csv',
-    'daily_metrics': 'daily_metrics.csv',
-    'hospitals': 'hospitals.csv',
-    'wards': 'wards.csv'
-}
\ No newline at end of file
+    'admissions': 'admissions',
+    'daily_metrics': 'daily_metrics',
+    'hospitals': 'hospitals',
+    'wards': 'wards'
+}
+
+
+# ---------------------------------------------------------------------------
+# Concurrent fetch
+
+def load_validators(path=STATE_PATH):
+    if Path(path).exists():
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def save_validators(validators, path=STATE_PATH):
+    tmp_path = Path(path).with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(validators, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+async def fetch_endpoint(client, endpoint, out_dir, validators, semaphore, retries=RETRIES, backoff=BACKOFF_S):
+    """Stream one endpoint to ``out_dir/<endpoint>.body``; returns a result dict.
+
+    ``status`` is "downloaded", "unchanged" (304) or "failed". A download
+    carries the response's validators under ``validators``; record them once
+    the body is loaded.
+    """
+    headers = {}
+    known = validators.get(endpoint, {})
+    if known.get("etag"):
+        headers["If-None-Match"] = known["etag"]
+    if known.get("last_modified"):
+        headers["If-Modified-Since"] = known["last_modified"]
+
+    path = Path(out_dir) / f"{endpoint}.body"
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            # Exponential backoff with jitter so retries of parallel fetches spread out.
+            await asyncio.sleep(backoff * 2 ** (attempt - 1) * (0.5 + random.random()))
+        try:
+            async with semaphore:
+                async with client.stream("GET", endpoint, headers=headers) as response:
+                    if response.status_code == 304:
+                        return {"endpoint": endpoint, "status": "unchanged", "bytes": 0}
+                    if response.status_code in RETRY_STATUS:
+                        error = f"status {response.status_code}"
+                        continue
+                    if response.status_code != 200:
+                        return {"endpoint": endpoint, "status": "failed", "error": f"status {response.status_code}"}
+
+                    size = 0
+                    fd, tmp_name = tempfile.mkstemp(dir=out_dir, suffix=".part")
+                    try:
+                        with os.fdopen(fd, "wb") as f:
+                            async for chunk in response.aiter_bytes(CHUNK_BYTES):
+                                f.write(chunk)
+                                size += len(chunk)
+                        os.replace(tmp_name, path)
+                    finally:
+                        if os.path.exists(tmp_name):
+                            os.remove(tmp_name)
+
+                    received = {
+                        "etag": response.headers.get("etag"),
+                        "last_modified": response.headers.get("last-modified"),
+                        "content_type": response.headers.get("content-type", "application/json"),
+                    }
+                    return {"endpoint": endpoint, "status": "downloaded", "bytes": size, "path": str(path),
+                            "validators": received}
+        except httpx.TransportError as e:
+            error = str(e) or type(e).__name__
+    return {"endpoint": endpoint, "status": "failed", "error": error}
+
+
+async def fetch_all(endpoints=None, base=None, out_dir=DOWNLOAD_DIR, state_path=STATE_PATH,
+                    concurrency=CONCURRENCY, retries=RETRIES, backoff=BACKOFF_S):
+    """Fetch ``endpoints`` concurrently over one pooled client; returns one result dict per endpoint.
+
+    Sends the validators recorded in ``state_path`` but does not update them.
+    """
+    endpoints = list(api_data if endpoints is None else endpoints)
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    validators = load_validators(state_path)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=base or api_base, limits=limits, timeout=TIMEOUT_S) as client:
+        results = await asyncio.gather(*[
+            fetch_endpoint(client, endpoint, out_dir, validators, semaphore, retries, backoff)
+            for endpoint in endpoints
+        ])
+    return results
+
+
+def iter_json_records(path, block_size=CHUNK_BYTES):
+    """Yield the items of a JSON array body one at a time, reading ``block_size`` characters at once."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer, pos, opened = "", 0, False
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                more = f.read(block_size)
+                if not more:
+                    if opened:
+                        raise ValueError(f"{path}: JSON array is not closed")
+                    return
+                buffer, pos = more, 0
+                continue
+            if not opened:
+                if buffer[pos] != "[":
+                    raise ValueError(f"{path}: expected a JSON array of records")
+                opened, pos = True, pos + 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The item runs past the buffer: keep its start and read on.
+                more = f.read(block_size)
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            yield item
+            pos = end
+
+
+def _record_chunks(records, chunksize):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == chunksize:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
+
+
+def load_body(path, table, content_type="application/json", root=store.STORE_DIR, chunksize=500_000):
+    """Load a downloaded body into the store, ``chunksize`` rows at a time."""
+    if "csv" in content_type:
+        chunks = pd.read_csv(path, chunksize=chunksize, dtype=str)
+    elif "ndjson" in content_type or "jsonl" in content_type:
+        chunks = pd.read_json(path, lines=True, chunksize=chunksize)
+    else:
+        chunks = _record_chunks(iter_json_records(path), chunksize)
+
+    rows = 0
+    for i, chunk in enumerate(chunks):
+        rows += write_table(chunk, table, root, mode="overwrite" if i == 0 else "append", first_row_id=rows)
+    return rows
+
+
+def ingest(base=None, root=store.STORE_DIR, out_dir=DOWNLOAD_DIR, state_path=STATE_PATH,
+           concurrency=CONCURRENCY):
+    """Fetch every endpoint and load the changed ones into the store.
+
+    A table's validators are saved only after it is loaded. If a load fails,
+    that table and the ones not loaded yet keep their previous validators, so
+    the next run downloads them again.
+    """
+    results = asyncio.run(fetch_all(api_data, base, out_dir, state_path, concurrency))
+    validators = load_validators(state_path)
+    for result in results:
+        if result["status"] == "downloaded":
+            received = result["validators"]
+            result["rows"] = load_body(result["path"], api_data[result["endpoint"]], received["content_type"], root)
+            validators[result["endpoint"]] = received
+            save_validators(validators, state_path)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Local stand-in server
+
+class StandinServer:
+    """Threaded HTTP server that serves the CSV datasets as the API's JSON endpoints.
+
+    Each endpoint returns its table as a JSON array of records with an ETag
+    and Last-Modified, and honours If-None-Match / If-Modified-Since. Use
+    ``latency`` to add a per-request delay and ``fail_first`` to answer the
+    first N requests of every endpoint with 503.
+    """
+
+    def __init__(self, dataset_dir=store.DATASET_DIR, port=0, latency=0.0, fail_first=0):
+        self.bodies = {}
+        for table, files in store.SOURCE_FILES.items():
+            frames = [store.normalize_columns(pd.read_csv(Path(dataset_dir) / f)) for f in files
+                      if (Path(dataset_dir) / f).exists()]
+            if frames:
+                self.set_table(table, pd.concat(frames, ignore_index=True))
+        self.latency = latency
+        self.fail_first = fail_first
+        self.requests = {}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def set_table(self, endpoint, frame):
+        body = frame.to_json(orient="records").encode()
+        self.bodies[endpoint] = (body, f'"{hashlib.sha1(body).hexdigest()}"', time.time())
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                endpoint = self.path.strip("/")
+                with server._lock:
+                    server.requests[endpoint] = count = server.requests.get(endpoint, 0) + 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if endpoint not in server.bodies:
+                    return self._reply(404)
+                if count <= server.fail_first:
+                    return self._reply(503)
+
+                body, etag, modified = server.bodies[endpoint]
+                headers = {"ETag": etag, "Last-Modified": formatdate(modified, usegmt=True)}
+                since = self.headers.get("If-Modified-Since")
+                if self.headers.get("If-None-Match") == etag or (
+                        since and "If-None-Match" not in self.headers
+                        and parsedate_to_datetime(since).timestamp() >= int(modified)):
+                    return self._reply(304, headers=headers)
+                self._reply(200, body, dict(headers, **{"Content-Type": "application/json"}))
+
+            def _reply(self, status, body=b"", headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    # Chunked writes keep the server from copying large bodies in one go.
+                    for i in range(0, len(body), CHUNK_BYTES):
+                        self.wfile.write(body[i:i + CHUNK_BYTES])
+
+        return Handler
+
+
+def compare(dataset_dir=store.DATASET_DIR, latency=0.05, repeat=3):
+    """Seconds for the sequential ``api_call`` loop vs the concurrent path, against the stand-in.
+
+    ``fetch`` times cover getting every body (parsed for the sequential
+    loop, on disk for the concurrent one); ``total`` times include loading
+    the tables into a scratch store.
+    """
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    with StandinServer(dataset_dir, latency=latency) as server, tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        state = tmp / "api_state.json"
+
+        def fresh():
+            # Without validators every run downloads in full.
+            if state.exists():
+                state.unlink()
+
+        def sequential_fetch():
+            for endpoint in api_data:
+                requests.get(f"{server.url}/{endpoint}").json()
+
+        def concurrent_fetch():
+            fresh()
+            asyncio.run(fetch_all(api_data, server.url, tmp / "downloads", state))
+
+        def sequential_total():
+            for endpoint, table in api_data.items():
+                api_call(endpoint, table, server.url, tmp / "sequential")
+
+        def concurrent_total():
+            fresh()
+            ingest(server.url, tmp / "concurrent", tmp / "downloads", state)
+
+        report = {
+            "sequential_fetch_s": best(sequential_fetch),
+            "concurrent_fetch_s": best(concurrent_fetch),
+            "sequential_total_s": best(sequential_total),
+            "concurrent_total_s": best(concurrent_total),
+        }
+        start = time.perf_counter()
+        results = asyncio.run(fetch_all(api_data, server.url, tmp / "downloads", state))
+        report["unchanged_s"] = time.perf_counter() - start
+        report["unchanged"] = sum(r["status"] == "unchanged" for r in results)
+        report["mb"] = sum(len(body) for body, _, _ in server.bodies.values()) / 2**20
+        report["latency_s"] = latency
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch the API tables into the Parquet store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("ingest")
+    run.add_argument("--base-url", default=None)
+    run.add_argument("--concurrency", default=CONCURRENCY, type=int)
+    serve = sub.add_parser("standin")
+    serve.add_argument("dataset_dir", nargs="?", default=store.DATASET_DIR)
+    serve.add_argument("--port", default=8765, type=int)
+    serve.add_argument("--latency", default=0.0, type=float)
+    bench = sub.add_parser("compare")
+    bench.add_argument("dataset_dir", nargs="?", default=store.DATASET_DIR)
+    bench.add_argument("--latency", default=0.05, type=float)
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        for result in ingest(args.base_url, concurrency=args.concurrency):
+            print(f"{result['endpoint']:14s} {result['status']:10s} {result.get('rows', '')}")
+    elif args.command == "standin":
+        server = StandinServer(args.dataset_dir, args.port, args.latency)
+        print(f"Serving {', '.join(server.bodies)} on {server.url}")
+        server.httpd.serve_forever()
+    else:
+        report = compare(args.dataset_dir, args.latency)
+        print(f"fetch {report['sequential_fetch_s']:.3f}s -> {report['concurrent_fetch_s']:.3f}s  "
+              f"fetch+store {report['sequential_total_s']:.3f}s -> {report['concurrent_total_s']:.3f}s  "
+              f"unchanged re-run {report['unchanged_s']:.3f}s ({report['mb']:.1f} MB, {report['latency_s']}s latency)")
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Compact in-memory types for the raw and cleaned tables.
+
+With pandas' defaults, the cleaned features load as int64/float64, and
+``ward_code`` and the other strings load as repeated Python objects.
+``get_dummies`` followed by a bool -> int conversion then copies the one-hot
+block twice. ``compact`` applies an explicit schema instead:
+
+* ``ward_code``, ``arrival_source``, ``outcome`` and ``sex`` become
+  categorical codes.
+* ``hospital_id`` is already an integer code. It becomes the smallest
+  unsigned int that holds it, and stays numeric because the global model
+  uses it as a regressor.
+* Integer columns, and float columns that hold only whole numbers, become
+  the smallest int type that holds them.
+* Other float columns become float32 when every value round-trips within
+  ``float_rtol``. With 0, only exact downcasts are made.
+
+``categorize`` applies fixed category levels, for chunked pipelines such as
+Data/clean.py. ``one_hot`` builds indicator blocks directly as uint8 (optionally sparse).
+
+Usage::
+
+    python -m database.dataset compare [--scale N]   # peak RSS of the training data prep, default vs compact
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_COLUMNS = ["ward_code", "arrival_source", "outcome", "sex"]
+FLOAT_RTOL = 1e-6
+CHUNK_ROWS = 100_000
+
+
+def _downcast_int(series):
+    if not len(series):
+        return series
+    return pd.to_numeric(series, downcast="unsigned" if series.min() >= 0 else "integer")
+
+
+def _downcast_float(series, float_rtol):
+    values = series.to_numpy()
+    if not len(values):
+        return series
+    if not np.isnan(values).any() and np.array_equal(values, np.round(values)) \
+            and np.abs(values).max() < 2 ** 53:
+        return _downcast_int(series.astype(np.int64))
+    as32 = values.astype(np.float32)
+    if np.allclose(as32, values, rtol=float_rtol, atol=0, equal_nan=True):
+        return series.astype(np.float32)
+    return series
+
+
+def compact(frame, float_rtol=FLOAT_RTOL, categorical=CATEGORICAL_COLUMNS):
+    """``frame`` with the compact schema applied, converting one column at a time."""
+    frame = frame.copy(deep=False)
+    for col in frame.columns:
+        series = frame[col]
+        if col in categorical:
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                frame[col] = series.astype("category")
+        elif series.dtype.kind in "iu":
+            frame[col] = _downcast_int(series)
+        elif series.dtype.kind == "f":
+            frame[col] = _downcast_float(series, float_rtol)
+    return frame
+
+
+def categorize(frame, categories):
+    """``frame`` with each column of ``categories`` (name -> levels) as a categorical of exactly those levels.
+
+    Chunks categorized with the same levels share one dtype, so they
+    concatenate and group without a category union.
+    """
+    dtypes = {col: pd.CategoricalDtype(levels) for col, levels in categories.items() if col in frame.columns}
+    return frame.astype(dtypes)
+
+
+def one_hot(frame, columns, sparse=False):
+    """``get_dummies`` with uint8 (optionally sparse) indicator columns, so no bool -> int copy is needed."""
+    return pd.get_dummies(frame, columns=columns, drop_first=False, dtype=np.uint8, sparse=sparse)
+
+
+def concat(frames, float_rtol=FLOAT_RTOL):
+    """Concatenate compact frames, keeping categorical columns categorical (their categories are unioned)."""
+    frames = list(frames)
+    if not frames:
+        return pd.DataFrame()
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            categories = sorted(set().union(*(frame[col].cat.categories for frame in frames)))
+            for frame in frames:
+                frame[col] = frame[col].cat.set_categories(categories)
+    return compact(pd.concat(frames, ignore_index=True), float_rtol)
+
+
+def read_csv(path, columns=None, parse_dates=("date",), float_rtol=FLOAT_RTOL, chunksize=CHUNK_ROWS):
+    """A CSV read with the compact schema, chunk by chunk, so the full-width float64 parse never exists at once."""
+    dtype = {col: "category" for col in CATEGORICAL_COLUMNS}
+    chunks = pd.read_csv(path, usecols=columns, dtype=dtype, parse_dates=list(parse_dates), chunksize=chunksize)
+    return concat((compact(chunk, float_rtol) for chunk in chunks), float_rtol)
+
+
+def read_arrow(table, float_rtol=FLOAT_RTOL):
+    """A pyarrow Table as a compact DataFrame; strings come out as categories without an object copy."""
+    return compact(table.to_pandas(strings_to_categorical=True), float_rtol)
+
+
+_PROBE = """
+import sys
+sys.path.insert(0, sys.argv[3])
+import numpy as np
+import pandas as pd
+from database.dataset import one_hot, read_csv
+from model.compact import high_water_kb
+
+path, mode = sys.argv[1], sys.argv[2]
+baseline = high_water_kb()
+if mode == "default":
+    data = pd.read_csv(path, parse_dates=["date"]).sort_values("date")
+    data = pd.get_dummies(data, columns=["ward_code"], drop_first=False)
+    bool_cols = data.select_dtypes(include=["bool"]).columns
+    data[bool_cols] = data[bool_cols].astype(int)
+else:
+    data = read_csv(path).sort_values("date")
+    data = one_hot(data, ["ward_code"])
+data = data.set_index("date")
+weekly = data.drop(columns=["admissions"]).resample("W").mean()
+peak = high_water_kb()
+print(baseline, peak, data.memory_usage(deep=True).sum())
+"""
+
+
+def compare(path=None, scale=1):
+    """Peak RSS and frame size of the training notebook's data prep, default vs compact, each in a fresh process."""
+    if path is None:
+        from model.train_series import DATA_PATH
+        path = DATA_PATH
+    root = str(Path(__file__).resolve().parent.parent)
+    with tempfile.TemporaryDirectory() as tmp:
+        if scale > 1:
+            # One copy at a time, to keep this process small.
+            data = pd.read_csv(path)
+            path = Path(tmp) / "cleaned_data.csv"
+            for i in range(scale):
+                data.assign(hospital_id=data["hospital_id"] + 1000 * i).to_csv(
+                    path, mode="a", index=False, header=i == 0)
+        report = {}
+        for mode in ("default", "compact"):
+            out = subprocess.run([sys.executable, "-c", _PROBE, str(path), mode, root],
+                                 capture_output=True, text=True, check=True).stdout.split()
+            baseline, peak, frame_bytes = (int(v) for v in out)
+            report[mode] = {"peak_rss_mb": peak / 1024, "prep_rss_mb": (peak - baseline) / 1024,
+                            "frame_mb": frame_bytes / 2**20}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact dataset types.")
+    parser.add_argument("command", choices=["compare"])
+    parser.add_argument("--scale", default=1, type=int, help="copies of the cleaned data, as new hospitals")
+    args = parser.parse_args(argv)
+
+    report = compare(scale=args.scale)
+    for mode, row in report.items():
+        print(f"{mode:8s} peak RSS {row['peak_rss_mb']:.1f} MB (+{row['prep_rss_mb']:.1f} MB for the data)  "
+              f"frame {row['frame_mb']:.1f} MB")
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
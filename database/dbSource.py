@@ -1,30 +1,199 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+"""Incremental, chunked export of the source database into the Parquet store.
+
+Dated tables are pulled with a per-table high-water mark on ``date``: each
+run fetches only rows newer than the last date already stored, streams
+them through a server-side cursor in chunks and appends them to the store.
+Lookup tables (hospitals, wards) are small and refreshed whole. Tables are
+exported in parallel, one pooled connection each.
+
+Usage::
+
+    python -m database.dbSource ingest [--url URL]          # MEDOPTIX_DB_URL or the dbuser/dbhost/... settings
+    python -m database.dbSource standin PATH [DATASET_DIR]  # SQLite copy of the CSVs for local runs
+"""
+import argparse
+import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+from database import store
 
 load_dotenv()
 
-db_url = f'mysql+pymysql://{os.getenv("dbuser")}:{os.getenv("dbpassword")}@{os.getenv("dbhost")}:{os.getenv("dbport")}/{os.getenv("dbname")}'
+POOL_SIZE = int(os.getenv("MEDOPTIX_DB_POOL_SIZE", "4"))
+CHUNKSIZE = int(os.getenv("MEDOPTIX_DB_CHUNKSIZE", "50000"))
+STATE_PATH = Path(__file__).resolve().parent / "ingest_state.json"
 
-engine = create_engine(db_url)
+# Table -> column used as the high-water mark (None: refresh the whole table).
+TABLES = {
+    'admissions': 'date',
+    'daily_metrics': 'date',
+    'hospitals': None,
+    'wards': None
+}
 
-session = sessionmaker(bind=engine)
 
-ssession()
+def database_url():
+    url = os.getenv("MEDOPTIX_DB_URL")
+    if url:
+        return url
+    return f'mysql+pymysql://{os.getenv("dbuser")}:{os.getenv("dbpassword")}@{os.getenv("dbhost")}:{os.getenv("dbport")}/{os.getenv("dbname")}'
 
-queries = {
-    'admissions': 'SELECT * FROM admissions',
-    'daily_metrics': 'SELECT * FROM daily_metrics',
-    'hospitals': 'SELECT * FROM hospitals',
-    'wards': 'SELECT * FROM wards'
-}
-try:
-    for table, query in queries.items():
-        results = pd.read_sql(query, engine)
 
-        file_path = os.path.join("Datasets", f"{table}.csv")
+def make_engine(url=None, pool_size=POOL_SIZE):
+    """Engine whose pool never opens more than ``pool_size`` connections."""
+    return create_engine(url or database_url(), pool_size=pool_size, max_overflow=0, pool_pre_ping=True)
+
+
+class IngestState:
+    """High-water marks per table, persisted as JSON after every committed chunk."""
+
+    def __init__(self, path=STATE_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.marks = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.marks = json.load(f)
+
+    def get(self, table):
+        return self.marks.get(table)
+
+    def set(self, table, mark):
+        with self._lock:
+            self.marks[table] = mark
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self.marks, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def _mark(value):
+    """Date as the string the source compares against; plain dates stay plain."""
+    value = pd.Timestamp(value)
+    return value.date().isoformat() if value == value.normalize() else value.isoformat(sep=" ")
+
+
+def stored_mark(table, date_column, root=store.STORE_DIR):
+    """Latest date already in the store, so a first run does not re-append what a CSV ingest loaded."""
+    if not store.exists(table, root):
+        return None
+    dates = store.read_table(table, columns=[date_column], root=root)[date_column]
+    return _mark(dates.max()) if dates.notna().any() else None
+
+
+def export_table(engine, table, date_column, state, root=store.STORE_DIR, chunksize=CHUNKSIZE):
+    """Append the rows of ``table`` past its high-water mark to the store; returns rows written.
+
+    Rows arrive ordered by date. The last date of each chunk is held back
+    until the next chunk (or the end) so only complete dates are written and
+    the mark always sits on a date that is fully stored: an interrupted run
+    resumes without gaps or duplicates.
+    """
+    if date_column is None:
+        with engine.connect() as conn:
+            frame = pd.read_sql(text(f"SELECT * FROM {table}"), conn)
+        return store.write_table(frame, table, root, mode="overwrite")
+
+    mark = state.get(table) or stored_mark(table, date_column, root)
+    query = f"SELECT * FROM {table}"
+    params = {}
+    if mark is not None:
+        query += f" WHERE {date_column} > :mark"
+        params["mark"] = mark
+    query += f" ORDER BY {date_column}"
+
+    written = 0
+    next_id = store.next_row_id(table, root)
+    carry = None
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+        for chunk in pd.read_sql(text(query), conn, params=params, chunksize=chunksize):
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+            dates = pd.to_datetime(chunk[date_column], errors="coerce")
+            last = dates.max()
+            complete = ~(dates == last)
+            carry = chunk[~complete]
+            if complete.any():
+                next_id += store.write_table(chunk[complete], table, root, first_row_id=next_id)
+                written += int(complete.sum())
+                if dates[complete].notna().any():
+                    state.set(table, _mark(dates[complete].max()))
+
+    if carry is not None and len(carry):
+        store.write_table(carry, table, root, first_row_id=next_id)
+        written += len(carry)
+        last = pd.to_datetime(carry[date_column], errors="coerce").max()
+        if not pd.isna(last):
+            state.set(table, _mark(last))
+    return written
+
+
+def ingest(url=None, root=store.STORE_DIR, state_path=STATE_PATH, pool_size=POOL_SIZE, chunksize=CHUNKSIZE,
+           tables=None):
+    """Export every table in parallel; returns {table: rows written}."""
+    engine = make_engine(url, pool_size)
+    state = IngestState(state_path)
+    tables = TABLES if tables is None else tables
+    try:
+        with ThreadPoolExecutor(max_workers=pool_size) as pool:
+            futures = {
+                table: pool.submit(export_table, engine, table, date_column, state, root, chunksize)
+                for table, date_column in tables.items()
+            }
+            return {table: future.result() for table, future in futures.items()}
+    finally:
+        engine.dispose()
+
+
+def build_standin(path, dataset_dir=store.DATASET_DIR):
+    """Load the CSV datasets into a SQLite file with the source database's table names."""
+    engine = create_engine(f"sqlite:///{path}")
+    for table, files in store.SOURCE_FILES.items():
+        frames = [store.normalize_columns(pd.read_csv(Path(dataset_dir) / f)) for f in files
+                  if (Path(dataset_dir) / f).exists()]
+        if frames:
+            frame = pd.concat(frames, ignore_index=True)
+            if "date" in frame.columns:
+                frame["date"] = pd.to_datetime(frame["date"], errors="coerce").dt.strftime("%Y-%m-%d")
+            frame.to_sql(table, engine, if_exists="replace", index=False)
+    engine.dispose()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the source database into the Parquet store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("ingest")
+    run.add_argument("--url", default=None)
+    run.add_argument("--store-dir", default=store.STORE_DIR, type=Path)
+    run.add_argument("--state", default=STATE_PATH, type=Path)
+    run.add_argument("--pool-size", default=POOL_SIZE, type=int)
+    run.add_argument("--chunksize", default=CHUNKSIZE, type=int)
+    standin = sub.add_parser("standin")
+    standin.add_argument("path")
+    standin.add_argument("dataset_dir", nargs="?", default=store.DATASET_DIR)
+    args = parser.parse_args()
+
+    if args.command == "standin":
+        print(f"Wrote {build_standin(args.path, args.dataset_dir)}")
+        return
+
+    try:
+        counts = ingest(args.url, args.store_dir, args.state, args.pool_size, args.chunksize)
+    except Exception as e:
+        print(str(e))
+        return
+    for table, rows in counts.items():
+        print(f"{table:14s} {rows:>10,d} new rows")
+
 
-        results.to_csv(file_path, index=False)
-except Exception as e:
-    print(str(e))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
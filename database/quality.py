@@ -0,0 +1,567 @@
+"""Single-pass, mergeable data-quality profiles.
+
+clean.ipynb checks the raw tables by scanning every column several times:
+``isnull().mean()``, ``duplicated()``, ``describe()``, mean/std for 3-sigma
+outliers, then 5%/95% quantiles for clipping. ``TableProfile`` gathers all of
+these in one pass over chunked input. Every column keeps accumulators that
+merge without the rows:
+
+* count, nulls and invalid values. Invalid values are unparseable numbers,
+  fractions in integer columns and rule violations such as triage_level
+  "6.5" or "abc". They are tallied by value.
+* Welford moments (Chan's update per chunk): mean, std, min, max.
+* A quantile store. It holds exact value counts up to ``EXACT_VALUES``
+  distinct values, then log buckets of ``RELATIVE_ACCURACY`` relative width
+  (a DDSketch). Quantiles and the 3-sigma outlier count come from it.
+* A HyperLogLog sketch of the distinct values, and Misra-Gries counters for
+  the most frequent ones.
+
+The table keeps its row hashes, so duplicate rows are counted exactly, even
+across merged profiles. The store saves one profile per ingest batch, and
+``load_profile`` merges them. Profiling a new daily file therefore costs
+only that file.
+
+Usage::
+
+    python -m database.quality [DATASET_DIR]     # profile the raw CSVs, one pass each
+    python -m database.quality --store           # merged profiles saved by store ingests
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import sys
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from database import store
+
+CHUNKSIZE = 100_000
+EXACT_VALUES = 1024
+RELATIVE_ACCURACY = 0.01
+HLL_PRECISION = 12
+TOP_K = 256
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+PROFILE_DIR = "_profiles"
+
+# Value rules beyond the store's column types. triage_level is stored as
+# text, because the cleaning step decides what to do with "6.5" or "abc".
+RULES = {
+    "triage_level": {"numeric": True, "integer": True, "min": 1, "max": 5},
+}
+
+
+def column_rules(name=None):
+    """Rules per column: numeric/integer from the store schema of table ``name``, plus ``RULES``."""
+    rules = {}
+    schema = store.SCHEMAS.get(name)
+    for field in schema if schema is not None else []:
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            rules[field.name] = {"numeric": True, "integer": pa.types.is_integer(field.type)}
+    for col, rule in RULES.items():
+        rules[col] = {**rules.get(col, {}), **rule}
+    return rules
+
+
+# ---------------------------------------------------------------------------
+# Accumulators
+
+class Moments:
+    """Count, mean, sum of squared deviations, min and max; chunks combine with Chan's update."""
+
+    def __init__(self, n=0, mean=0.0, m2=0.0, low=math.inf, high=-math.inf):
+        self.n, self.mean, self.m2, self.low, self.high = n, mean, m2, low, high
+
+    def update(self, values):
+        if len(values):
+            mean = float(values.mean())
+            self.merge(Moments(len(values), mean, float(((values - mean) ** 2).sum()),
+                               float(values.min()), float(values.max())))
+
+    def merge(self, other):
+        n = self.n + other.n
+        if other.n:
+            delta = other.mean - self.mean
+            self.mean += delta * other.n / n
+            self.m2 += other.m2 + delta * delta * self.n * other.n / n
+            self.low, self.high = min(self.low, other.low), max(self.high, other.high)
+            self.n = n
+        return self
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else math.nan
+
+    def to_dict(self):
+        empty = not self.n
+        return {"n": self.n, "mean": self.mean, "m2": self.m2,
+                "min": None if empty else self.low, "max": None if empty else self.high}
+
+    @classmethod
+    def from_dict(cls, d):
+        if not d["n"]:
+            return cls()
+        return cls(d["n"], d["mean"], d["m2"], d["min"], d["max"])
+
+
+class QuantileSketch:
+    """Exact value counts up to ``exact_values`` distinct values, then log buckets (DDSketch).
+
+    A bucket covers (gamma^(i-1), gamma^i] with gamma = (1 + a) / (1 - a), so
+    any value reported from it is within relative accuracy ``a`` of the truth.
+    """
+
+    def __init__(self, exact_values=EXACT_VALUES, relative_accuracy=RELATIVE_ACCURACY):
+        self.exact_values = exact_values
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.exact = Counter()
+        self.positive, self.negative = Counter(), Counter()
+        self.zeros = 0
+
+    @property
+    def is_exact(self):
+        return self.exact is not None
+
+    @property
+    def n(self):
+        if self.is_exact:
+            return sum(self.exact.values())
+        return sum(self.positive.values()) + sum(self.negative.values()) + self.zeros
+
+    def update(self, values):
+        if not len(values):
+            return
+        if self.is_exact:
+            unique, counts = np.unique(values, return_counts=True)
+            self.exact.update(dict(zip(unique.tolist(), counts.tolist())))
+            if len(self.exact) > self.exact_values:
+                self._to_buckets()
+        else:
+            self._add_buckets(values)
+
+    def _bucket(self, magnitudes):
+        return np.ceil(np.log(magnitudes) / math.log(self.gamma)).astype(np.int64)
+
+    def _add_buckets(self, values, counts=None):
+        values = np.asarray(values, dtype=float)
+        counts = np.ones(len(values), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        zero = values == 0
+        self.zeros += int(counts[zero].sum())
+        for sign, store_ in ((values > 0, self.positive), (values < 0, self.negative)):
+            if sign.any():
+                keys = self._bucket(np.abs(values[sign]))
+                unique, inverse = np.unique(keys, return_inverse=True)
+                totals = np.bincount(inverse, weights=counts[sign]).astype(np.int64)
+                store_.update(dict(zip(unique.tolist(), totals.tolist())))
+
+    def _to_buckets(self):
+        exact, self.exact = self.exact, None
+        if exact:
+            self._add_buckets(list(exact.keys()), list(exact.values()))
+
+    def merge(self, other):
+        if self.is_exact and other.is_exact:
+            self.exact.update(other.exact)
+            if len(self.exact) > self.exact_values:
+                self._to_buckets()
+            return self
+        if self.is_exact:
+            self._to_buckets()
+        if other.is_exact:
+            other = QuantileSketch(self.exact_values, self.relative_accuracy).merge(other)
+            other._to_buckets()
+        self.positive.update(other.positive)
+        self.negative.update(other.negative)
+        self.zeros += other.zeros
+        return self
+
+    def _sorted(self):
+        """(values, counts) in ascending order; bucket representatives once the store is approximate."""
+        if self.is_exact:
+            items = sorted(self.exact.items())
+            return np.array([v for v, _ in items], dtype=float), np.array([c for _, c in items], dtype=np.int64)
+        scale = 2 / (self.gamma + 1)
+        negative = sorted(self.negative.items(), reverse=True)
+        positive = sorted(self.positive.items())
+        values = ([-scale * self.gamma ** k for k, _ in negative] + ([0.0] if self.zeros else [])
+                  + [scale * self.gamma ** k for k, _ in positive])
+        counts = [c for _, c in negative] + ([self.zeros] if self.zeros else []) + [c for _, c in positive]
+        return np.array(values, dtype=float), np.array(counts, dtype=np.int64)
+
+    def quantiles(self, qs):
+        """``Series.quantile`` (linear interpolation) for each of ``qs``; exact while the store is."""
+        values, counts = self._sorted()
+        if not len(values):
+            return [math.nan for _ in qs]
+        cumulative = np.cumsum(counts)
+        n = int(cumulative[-1])
+        out = []
+        for q in qs:
+            rank = q * (n - 1)
+            lower = int(math.floor(rank))
+            a = values[np.searchsorted(cumulative, lower, side="right")]
+            b = values[np.searchsorted(cumulative, min(lower + 1, n - 1), side="right")]
+            out.append(float(a + (b - a) * (rank - lower)))
+        return out
+
+    def count_outside(self, low, high):
+        """Values below ``low`` or above ``high``; approximate to one bucket once the store is."""
+        values, counts = self._sorted()
+        return int(counts[(values < low) | (values > high)].sum())
+
+    def to_dict(self):
+        d = {"exact_values": self.exact_values, "relative_accuracy": self.relative_accuracy}
+        if self.is_exact:
+            d["exact"] = [[v, c] for v, c in self.exact.items()]
+        else:
+            d.update(positive=[[k, c] for k, c in self.positive.items()],
+                     negative=[[k, c] for k, c in self.negative.items()], zeros=self.zeros)
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        sketch = cls(d["exact_values"], d["relative_accuracy"])
+        if "exact" in d:
+            sketch.exact = Counter({v: c for v, c in d["exact"]})
+        else:
+            sketch.exact = None
+            sketch.positive = Counter({k: c for k, c in d["positive"]})
+            sketch.negative = Counter({k: c for k, c in d["negative"]})
+            sketch.zeros = d["zeros"]
+        return sketch
+
+
+class HyperLogLog:
+    """Distinct-count sketch: 2^precision registers of leading-zero ranks, merged by maximum."""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def update_hashes(self, hashes):
+        if not len(hashes):
+            return
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.int64)
+        rest = hashes & np.uint64((1 << width) - 1)
+        # Rank = position of the first set bit in the remaining bits; frexp gives the bit length.
+        bit_length = np.where(rest > 0, np.frexp(rest.astype(float))[1], 0)
+        rank = (width - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int((self.registers == 0).sum())
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return float(raw)
+
+    def to_dict(self):
+        return {"precision": self.precision, "registers": base64.b64encode(self.registers.tobytes()).decode()}
+
+    @classmethod
+    def from_dict(cls, d):
+        registers = np.frombuffer(base64.b64decode(d["registers"]), dtype=np.uint8).copy()
+        return cls(d["precision"], registers)
+
+
+class TopValues:
+    """Misra-Gries frequent values: exact while at most ``k`` distinct values have been seen.
+
+    ``error`` bounds how far any reported count may fall short of the truth.
+    """
+
+    def __init__(self, k=TOP_K):
+        self.k = k
+        self.counts = Counter()
+        self.error = 0
+
+    def update(self, series):
+        if len(series):
+            self.counts.update(series.value_counts().to_dict())
+            self._trim()
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.error += other.error
+        self._trim()
+        return self
+
+    def _trim(self):
+        if len(self.counts) > self.k:
+            cut = sorted(self.counts.values(), reverse=True)[self.k]
+            self.counts = Counter({v: c - cut for v, c in self.counts.items() if c > cut})
+            self.error += cut
+
+    @property
+    def is_exact(self):
+        return self.error == 0
+
+    def most_common(self, n=None):
+        return self.counts.most_common(n)
+
+    def to_dict(self):
+        return {"k": self.k, "error": self.error, "counts": [[_json_value(v), c] for v, c in self.counts.items()]}
+
+    @classmethod
+    def from_dict(cls, d):
+        top = cls(d["k"])
+        top.counts = Counter({v: c for v, c in d["counts"]})
+        top.error = d["error"]
+        return top
+
+
+def _json_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# ---------------------------------------------------------------------------
+# Column and table profiles
+
+class ColumnProfile:
+    """All single-pass statistics of one column."""
+
+    def __init__(self, numeric=False, rule=None):
+        self.numeric = numeric
+        self.rule = rule or {}
+        self.count = 0
+        self.nulls = 0
+        self.invalid = TopValues()
+        self.n_invalid = 0
+        self.top = TopValues()
+        self.distinct = HyperLogLog()
+        self.moments = Moments() if numeric else None
+        self.sketch = QuantileSketch() if numeric else None
+
+    def update(self, series):
+        self.count += len(series)
+        present = series[series.notna()]
+        self.nulls += len(series) - len(present)
+        if not len(present):
+            return
+        if self.numeric:
+            present = self._valid_numbers(present)
+            if not len(present):
+                return
+        self.top.update(present)
+        self.distinct.update_hashes(pd.util.hash_array(present.to_numpy()))
+        if self.numeric:
+            values = present.to_numpy(dtype=float)
+            self.moments.update(values)
+            self.sketch.update(values)
+
+    def _valid_numbers(self, present):
+        """Numbers that pass the column's rule; the rest are tallied as invalid."""
+        values = pd.to_numeric(present, errors="coerce") if present.dtype.kind not in "iuf" else present
+        bad = values.isna()
+        if self.rule.get("integer"):
+            bad |= values != np.floor(values)
+        if "min" in self.rule:
+            bad |= values < self.rule["min"]
+        if "max" in self.rule:
+            bad |= values > self.rule["max"]
+        if bad.any():
+            self.n_invalid += int(bad.sum())
+            self.invalid.update(present[bad].astype(str))
+        return values[~bad]
+
+    def merge(self, other):
+        self.count += other.count
+        self.nulls += other.nulls
+        self.n_invalid += other.n_invalid
+        self.invalid.merge(other.invalid)
+        self.top.merge(other.top)
+        self.distinct.merge(other.distinct)
+        if self.numeric:
+            self.moments.merge(other.moments)
+            self.sketch.merge(other.sketch)
+        return self
+
+    def summary(self):
+        row = {
+            "count": self.count,
+            "null_pct": round(100 * self.nulls / self.count, 2) if self.count else math.nan,
+            "invalid": self.n_invalid,
+            "distinct": len(self.top.counts) if self.top.is_exact else round(self.distinct.estimate()),
+        }
+        top = self.top.most_common(1)
+        row["top"], row["freq"] = top[0] if top else (None, 0)
+        if self.invalid.counts:
+            row["invalid_values"] = dict(self.invalid.most_common(5))
+        if self.numeric and self.moments.n:
+            mean, std = self.moments.mean, self.moments.std
+            row.update(mean=mean, std=std, min=self.moments.low, max=self.moments.high)
+            for q, value in zip(QUANTILES, self.sketch.quantiles(QUANTILES)):
+                row[f"p{round(q * 100)}"] = value
+            row["outliers_3sigma"] = self.sketch.count_outside(mean - 3 * std, mean + 3 * std) \
+                if not math.isnan(std) else 0
+            row["exact_quantiles"] = self.sketch.is_exact
+        return row
+
+    def to_dict(self):
+        d = {"numeric": self.numeric, "rule": self.rule, "count": self.count, "nulls": self.nulls,
+             "n_invalid": self.n_invalid, "invalid": self.invalid.to_dict(), "top": self.top.to_dict(),
+             "distinct": self.distinct.to_dict()}
+        if self.numeric:
+            d.update(moments=self.moments.to_dict(), sketch=self.sketch.to_dict())
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        col = cls(d["numeric"], d["rule"])
+        col.count, col.nulls, col.n_invalid = d["count"], d["nulls"], d["n_invalid"]
+        col.invalid, col.top = TopValues.from_dict(d["invalid"]), TopValues.from_dict(d["top"])
+        col.distinct = HyperLogLog.from_dict(d["distinct"])
+        if col.numeric:
+            col.moments, col.sketch = Moments.from_dict(d["moments"]), QuantileSketch.from_dict(d["sketch"])
+        return col
+
+
+class TableProfile:
+    """Column profiles plus exact duplicate-row counting for one table, built chunk by chunk."""
+
+    def __init__(self, name=None):
+        self.name = name
+        self.rules = column_rules(name)
+        self.rows = 0
+        self.columns = {}
+        self._hashes = [np.empty(0, dtype=np.uint64)]
+
+    def update(self, chunk):
+        normalized = store.normalize_columns(chunk)
+        # A frame holding both "ï»¿admission_id" and "admission_id" keeps its raw names.
+        chunk = normalized if normalized.columns.is_unique else chunk
+        self.rows += len(chunk)
+        if len(chunk):
+            self._hashes.append(pd.util.hash_pandas_object(chunk, index=False).to_numpy())
+        for col in chunk.columns:
+            if col not in self.columns:
+                rule = self.rules.get(col)
+                numeric = bool(rule and rule.get("numeric")) or chunk[col].dtype.kind in "iuf"
+                self.columns[col] = ColumnProfile(numeric, rule)
+            self.columns[col].update(chunk[col])
+        return self
+
+    @property
+    def hashes(self):
+        """Sorted distinct row hashes; pending chunks are folded in on first use."""
+        if len(self._hashes) > 1:
+            self._hashes = [np.unique(np.concatenate(self._hashes))]
+        return self._hashes[0]
+
+    @property
+    def duplicates(self):
+        return self.rows - len(self.hashes)
+
+    def merge(self, other):
+        self.rows += other.rows
+        self._hashes.append(other.hashes)
+        for col, profile in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(profile)
+            else:
+                self.columns[col] = ColumnProfile.from_dict(profile.to_dict())
+        return self
+
+    def report(self):
+        """One row per column: the notebook's null %, describe(), 3-sigma outliers and 5%/95% bounds."""
+        return pd.DataFrame.from_dict({col: profile.summary() for col, profile in self.columns.items()}, orient="index")
+
+    def to_dict(self):
+        return {"name": self.name, "rows": self.rows,
+                "hashes": base64.b64encode(self.hashes.tobytes()).decode(),
+                "columns": {col: profile.to_dict() for col, profile in self.columns.items()}}
+
+    @classmethod
+    def from_dict(cls, d):
+        profile = cls(d["name"])
+        profile.rows = d["rows"]
+        profile._hashes = [np.frombuffer(base64.b64decode(d["hashes"]), dtype=np.uint64).copy()]
+        profile.columns = {col: ColumnProfile.from_dict(c) for col, c in d["columns"].items()}
+        return profile
+
+
+# ---------------------------------------------------------------------------
+# Profiling inputs and the store's saved profiles
+
+def profile_frame(frame, name=None):
+    return TableProfile(name).update(frame)
+
+
+def profile_csv(paths, name=None, chunksize=CHUNKSIZE):
+    """One pass over the CSV files, as text when ``name`` has a store schema (the store ingest reads them so)."""
+    profile = TableProfile(name)
+    dtype = str if name in store.SCHEMAS else None
+    for path in [paths] if isinstance(paths, (str, Path)) else paths:
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=dtype, low_memory=False):
+            profile.update(chunk)
+    return profile
+
+
+def profile_dir(name, root=store.STORE_DIR):
+    return store.table_path(name, root) / PROFILE_DIR
+
+
+def save_profile(profile, name, root=store.STORE_DIR):
+    """Write one ingest batch's profile next to the store table (pyarrow ignores ``_`` directories)."""
+    path = profile_dir(name, root)
+    path.mkdir(parents=True, exist_ok=True)
+    out = path / f"{uuid.uuid4().hex}.json"
+    tmp_path = Path(f"{out}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(profile.to_dict(), f)
+    os.replace(tmp_path, out)
+    return out
+
+
+def load_profile(name, root=store.STORE_DIR):
+    """All saved batch profiles of a store table merged into one, or None if there are none."""
+    merged = None
+    for path in sorted(profile_dir(name, root).glob("*.json")):
+        with open(path, "r") as f:
+            batch = TableProfile.from_dict(json.load(f))
+        merged = batch if merged is None else merged.merge(batch)
+    return merged
+
+
+def print_profile(profile):
+    print(f"{profile.name}: {profile.rows:,d} rows, {profile.duplicates:,d} duplicate rows")
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(profile.report())
+    print("-" * 100)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Single-pass data-quality profiles.")
+    parser.add_argument("dataset_dir", nargs="?", default=store.DATASET_DIR, type=Path)
+    parser.add_argument("--store", action="store_true", help="merge the profiles saved by store ingests")
+    parser.add_argument("--chunksize", default=CHUNKSIZE, type=int)
+    args = parser.parse_args(argv)
+
+    for name, files in store.SOURCE_FILES.items():
+        if args.store:
+            profile = load_profile(name)
+        else:
+            paths = [args.dataset_dir / f for f in files if (args.dataset_dir / f).exists()]
+            profile = profile_csv(paths, name, args.chunksize) if paths else None
+        if profile is None:
+            print(f"{name}: no data", file=sys.stderr)
+            continue
+        print_profile(profile)
+
+
+if __name__ == "__main__":
+    main()
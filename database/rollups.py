@@ -0,0 +1,276 @@
+"""Pre-aggregated rollups of the cleaned features: daily, weekly and monthly, per ward, per hospital and network-wide.
+
+Each table has one row per group and period. It holds the number of
+cleaned rows (``rows``) and the sum of every numeric column
+(``<column>_sum``). That includes ``admissions``, ``hospital_id`` and the
+ward indicators ``ward_code_<w>``. A mean is sum / rows, so it is exact at
+every level and equals ``resample(...).mean()`` over the same rows. The
+cleaned features have no missing values, so one row count serves every
+column.
+
+    level     keys
+    ward      hospital_id, ward_code, period
+    hospital  hospital_id, period
+    network   period
+
+Periods are labelled the way pandas' resample labels them. Days (``D``) use
+the date, weeks (``W``) the Sunday they end on, and months (``MS``) their
+first day.
+
+Sums and counts add. ``Rollups.update`` therefore aggregates only the new
+cleaned rows and adds them into the tables, without re-reading the history.
+Data/clean.py rebuilds the rollups on a full run and updates them when days
+are appended. The tables are Parquet files in the store, at
+``database/store/rollups/<level>_<resolution>.parquet``.
+
+Usage::
+
+    python -m database.rollups build                 # from the cleaned data
+    python -m database.rollups query network W [--columns admissions] [--hospital-id 1] [--start 2025-01-01]
+    python -m database.rollups compare [--scale N]   # resampling the full history vs reading a rollup
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from database import store
+
+ROLLUP_DIR = store.STORE_DIR / "rollups"
+LEVELS = {"ward": ["hospital_id", "ward_code"], "hospital": ["hospital_id"], "network": []}
+RESOLUTIONS = ("D", "W", "MS")
+PERIOD = "period"
+ROWS = "rows"
+
+
+def rollup_dir(store_dir=store.STORE_DIR):
+    return Path(store_dir) / "rollups"
+
+
+def table_path(level, resolution, root=ROLLUP_DIR):
+    return Path(root) / f"{level}_{resolution}.parquet"
+
+
+def period_label(dates, resolution):
+    """The resample label of each date's period."""
+    dates = pd.to_datetime(dates).dt.normalize()
+    if resolution == "D":
+        return dates
+    if resolution == "W":
+        return dates + pd.to_timedelta(6 - dates.dt.weekday, unit="D")
+    if resolution == "MS":
+        return dates.dt.to_period("M").dt.start_time
+    raise ValueError(f"Unknown resolution {resolution!r}; use one of {', '.join(RESOLUTIONS)}")
+
+
+def _check(level, resolution):
+    if level not in LEVELS:
+        raise KeyError(f"Unknown level {level!r}; use one of {', '.join(LEVELS)}")
+    if resolution not in RESOLUTIONS:
+        raise KeyError(f"Unknown resolution {resolution!r}; use one of {', '.join(RESOLUTIONS)}")
+
+
+def _sum(frame, level):
+    """Sums per period and group; tables stay sorted by period first, so an update only touches its tail."""
+    return frame.groupby([PERIOD] + LEVELS[level], sort=True, as_index=False).sum()
+
+
+def aggregate(rows):
+    """{(level, resolution): table} for cleaned ``rows``; the ward-daily sums are rolled up to everything else."""
+    frame = rows.select_dtypes("number").astype("float64").add_suffix("_sum")
+    wards = pd.get_dummies(rows["ward_code"].astype(str), prefix="ward_code", dtype="float64").add_suffix("_sum")
+    frame = pd.concat([frame, wards], axis=1)
+    frame.insert(0, ROWS, 1)
+    frame.insert(0, PERIOD, pd.to_datetime(rows["date"]).dt.normalize())
+    frame.insert(0, "ward_code", rows["ward_code"].astype(str))
+    frame.insert(0, "hospital_id", rows["hospital_id"].astype("int64"))
+
+    daily = _sum(frame, "ward")
+    tables = {}
+    for resolution in RESOLUTIONS:
+        ward = daily if resolution == "D" else _sum(daily.assign(**{PERIOD: period_label(daily[PERIOD], resolution)}),
+                                                     "ward")
+        tables[("ward", resolution)] = ward
+        hospital = _sum(ward.drop(columns="ward_code"), "hospital")
+        tables[("hospital", resolution)] = hospital
+        tables[("network", resolution)] = _sum(hospital.drop(columns="hospital_id"), "network")
+    return tables
+
+
+def means(table, columns=None):
+    """Means per group and period from a rollup table: ``<column>_sum`` / ``rows``, plus ``rows``."""
+    keys = [c for c in ("hospital_id", "ward_code", PERIOD) if c in table.columns]
+    if columns is None:
+        columns = [c[:-4] for c in table.columns if c.endswith("_sum")]
+    # hospital_id is a measure only where it is not a key (network-wide).
+    columns = [c for c in columns if c not in keys]
+    out = pd.DataFrame({c: table[f"{c}_sum"] / table[ROWS] for c in columns}, index=table.index)
+    out[ROWS] = table[ROWS]
+    return pd.concat([table[keys], out], axis=1).set_index(keys).sort_index()
+
+
+class Rollups:
+    """Every (level, resolution) rollup table, in memory."""
+
+    def __init__(self, tables=None):
+        self.tables = dict(tables or {})
+
+    @classmethod
+    def build(cls, data):
+        return cls().update(data)
+
+    @classmethod
+    def load(cls, root=ROLLUP_DIR):
+        tables = {}
+        for level in LEVELS:
+            for resolution in RESOLUTIONS:
+                path = table_path(level, resolution, root)
+                if path.exists():
+                    tables[(level, resolution)] = pd.read_parquet(path)
+        return cls(tables)
+
+    @classmethod
+    def open(cls, root=ROLLUP_DIR):
+        """The saved rollups, built from the cleaned data (and saved) if there are none yet."""
+        rollups = cls.load(root)
+        if not rollups.tables:
+            from model.train_series import load_cleaned_data
+            rollups = cls.build(load_cleaned_data())
+            rollups.save(root)
+        return rollups
+
+    def save(self, root=ROLLUP_DIR):
+        Path(root).mkdir(parents=True, exist_ok=True)
+        for (level, resolution), table in self.tables.items():
+            path = table_path(level, resolution, root)
+            tmp_path = path.with_suffix(".tmp")
+            table.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+    def update(self, rows):
+        """Add newly cleaned rows. Rows already counted must not be passed again."""
+        if len(rows) == 0:
+            return self
+        for (level, resolution), partial in aggregate(rows).items():
+            current = self.tables.get((level, resolution))
+            if current is not None:
+                # Periods before the new rows' first one are unchanged; only the rest is summed again.
+                # A ward seen for the first time adds an indicator column, which is 0 in the older sums.
+                recent = current[PERIOD] >= partial[PERIOD].iloc[0]
+                merged = _sum(pd.concat([current[recent], partial], ignore_index=True), level)
+                partial = pd.concat([current[~recent], merged], ignore_index=True).fillna(0)
+            self.tables[(level, resolution)] = partial
+        return self
+
+    def table(self, level, resolution):
+        _check(level, resolution)
+        return self.tables[(level, resolution)]
+
+    def means(self, level, resolution, columns=None):
+        return means(self.table(level, resolution), columns)
+
+
+def query(level, resolution, columns=None, start=None, end=None, hospital_id=None, ward_code=None, root=ROLLUP_DIR):
+    """Means per period from one saved rollup table, reading only the requested columns and rows."""
+    _check(level, resolution)
+    path = table_path(level, resolution, root)
+    if not path.exists():
+        raise FileNotFoundError(f"No rollup {level}/{resolution} under {Path(root)}; run python -m database.rollups build")
+    filters = []
+    if start is not None:
+        filters.append((PERIOD, ">=", period_label(pd.Series([start]), resolution)[0]))
+    if end is not None:
+        filters.append((PERIOD, "<=", period_label(pd.Series([end]), resolution)[0]))
+    if hospital_id is not None and level != "network":
+        filters.append(("hospital_id", "==", int(hospital_id)))
+    if ward_code is not None and level == "ward":
+        filters.append(("ward_code", "==", ward_code))
+    read = None
+    if columns is not None:
+        read = LEVELS[level] + [PERIOD, ROWS] + [f"{c}_sum" for c in columns]
+    table = pd.read_parquet(path, columns=read, filters=filters or None)
+    return means(table, columns)
+
+
+def compare(data=None, scale=1, repeat=3):
+    """Seconds to get weekly network, monthly per-ward and daily per-hospital means by resampling vs from rollups.
+
+    ``scale`` copies of the cleaned data are used, each copy as new hospitals.
+    """
+    from model.train_series import load_cleaned_data
+
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    if data is None:
+        data = load_cleaned_data()
+    if scale > 1:
+        data = pd.concat([data.assign(hospital_id=data["hospital_id"] + 1000 * i) for i in range(scale)],
+                         ignore_index=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        report = {"build_s": best(lambda: Rollups.build(data).save(tmp))}
+        frame = data.set_index("date")
+        numeric = frame.select_dtypes("number").columns
+        report["resample_s"] = best(lambda: (
+            frame[numeric].resample("W").mean(),
+            frame.groupby(["hospital_id", "ward_code"])[numeric.drop("hospital_id")].resample("MS").mean(),
+            frame.groupby("hospital_id")[numeric.drop("hospital_id")].resample("D").mean(),
+        ))
+        report["rollup_s"] = best(lambda: (
+            query("network", "W", root=tmp), query("ward", "MS", root=tmp), query("hospital", "D", root=tmp)))
+        latest = data[data["date"] == data["date"].max()]
+        history = data[data["date"] < data["date"].max()]
+        rollups = Rollups.build(history)
+        start = time.perf_counter()
+        rollups.update(latest)
+        report["update_one_day_s"] = time.perf_counter() - start
+        report["rows"] = len(data)
+        report["rollup_rows"] = {f"{level}_{resolution}": len(table)
+                                 for (level, resolution), table in Rollups.load(tmp).tables.items()}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-aggregated rollups of the cleaned features.")
+    parser.add_argument("--root", default=ROLLUP_DIR, type=Path)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build")
+    ask = sub.add_parser("query")
+    ask.add_argument("level", choices=list(LEVELS))
+    ask.add_argument("resolution", choices=list(RESOLUTIONS))
+    ask.add_argument("--columns", nargs="*", default=None)
+    ask.add_argument("--start", default=None)
+    ask.add_argument("--end", default=None)
+    ask.add_argument("--hospital-id", default=None, type=int)
+    ask.add_argument("--ward-code", default=None)
+    bench = sub.add_parser("compare")
+    bench.add_argument("--scale", default=1, type=int, help="copies of the cleaned data, as new hospitals")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from model.train_series import load_cleaned_data
+        rollups = Rollups.build(load_cleaned_data())
+        rollups.save(args.root)
+        for (level, resolution), table in rollups.tables.items():
+            print(f"{level:8s} {resolution:2s} {len(table):7d} rows")
+    elif args.command == "query":
+        print(query(args.level, args.resolution, args.columns, args.start, args.end, args.hospital_id,
+                    args.ward_code, args.root).to_string())
+    else:
+        report = compare(scale=args.scale)
+        print(f"resample {report['resample_s']:.3f}s -> rollups {report['rollup_s']:.3f}s  "
+              f"(build {report['build_s']:.3f}s, one new day {report['update_one_day_s']:.3f}s)")
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""Partitioned Parquet store for the raw tables and the cleaned features.
+
+Each table is a hive-partitioned Parquet dataset under ``database/store/``::
+
+    store/admissions/hospital_id=1/ward_code=ED/month=2023-01/part-<id>.parquet
+    store/daily_metrics/...
+    store/cleaned/...
+    store/hospitals/part-<id>.parquet
+    store/wards/part-<id>.parquet
+
+Columns are written with the typed schemas below (dates as timestamps,
+numbers as int64/float64; unparseable or fractional-int values become null) and header BOM
+residue such as ``ï»¿date`` is normalised away. ``row_id`` records arrival
+order so loaders can return rows exactly in the order they were ingested.
+Every ingest also saves a data-quality profile of its rows under
+``<table>/_profiles/`` (see ``database/quality.py``).
+
+Usage::
+
+    python -m database.store ingest [DATASET_DIR]   # raw CSVs -> store
+    python -m database.store append TABLE FILE.csv  # append a new day's rows
+    python -m database.store compare [DATASET_DIR]  # load time and disk size, CSV vs store
+"""
+import json
+import shutil
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+STORE_DIR = Path(__file__).resolve().parent / "store"
+DATASET_DIR = Path(__file__).resolve().parent / "Dataset"
+
+ROW_ID = "row_id"
+ROWS_PER_GROUP = 1_000_000
+MONTH = "month"
+PARTITION_KEYS = ["hospital_id", "ward_code", MONTH]
+BOM_PREFIXES = ("ï»¿", "﻿")
+
+SCHEMAS = {
+    "admissions": pa.schema([
+        ("admission_id", pa.int64()),
+        ("date", pa.timestamp("ns")),
+        ("hospital_id", pa.int64()),
+        ("ward_code", pa.string()),
+        ("arrival_source", pa.string()),
+        # Kept as text: the cleaning step decides what "6.5" or "abc" mean.
+        ("triage_level", pa.string()),
+        ("wait_minutes", pa.int64()),
+        ("length_of_stay_days", pa.int64()),
+        ("outcome", pa.string()),
+        ("age", pa.int64()),
+        ("sex", pa.string()),
+        ("procedure_flag", pa.float64()),
+    ]),
+    "daily_metrics": pa.schema([
+        ("date", pa.timestamp("ns")),
+        ("hospital_id", pa.int64()),
+        ("ward_code", pa.string()),
+        ("base_beds", pa.int64()),
+        ("effective_capacity", pa.int64()),
+        ("occupancy", pa.int64()),
+        ("overflow", pa.int64()),
+        ("admissions", pa.int64()),
+        ("discharges", pa.int64()),
+        ("staffing_index", pa.float64()),
+        ("avg_wait_minutes", pa.int64()),
+        ("admission_rate_per_bed", pa.float64()),
+        ("discharge_rate_per_bed", pa.float64()),
+        ("occupancy_rate", pa.float64()),
+    ]),
+    "hospitals": pa.schema([
+        ("hospital_id", pa.int64()),
+        ("hospital_name", pa.string()),
+        ("city", pa.string()),
+        ("country", pa.string()),
+        ("latitude", pa.float64()),
+        ("longitude", pa.float64()),
+        ("founded_year", pa.int64()),
+    ]),
+    "wards": pa.schema([
+        ("hospital_id", pa.int64()),
+        ("ward_id", pa.string()),
+        ("ward_code", pa.string()),
+        ("ward_name", pa.string()),
+        ("base_beds", pa.int64()),
+    ]),
+}
+
+# Tables without a date are small lookups and are not partitioned.
+PARTITIONED = {"admissions", "daily_metrics", "cleaned"}
+
+SOURCE_FILES = {
+    "admissions": ["admissions.csv", "main_admissions.csv"],
+    "daily_metrics": ["daily_metrics.csv", "main_daily_metrics.csv"],
+    "hospitals": ["hospitals.csv"],
+    "wards": ["wards.csv"],
+}
+
+
+def normalize_columns(frame):
+    """Strip byte-order-mark residue (``ï»¿date`` -> ``date``) from column names."""
+    columns = []
+    for col in frame.columns:
+        for prefix in BOM_PREFIXES:
+            if col.startswith(prefix):
+                col = col[len(prefix):]
+        columns.append(col)
+    return frame.set_axis(columns, axis=1)
+
+
+def table_path(name, root=STORE_DIR):
+    return Path(root) / name
+
+
+def exists(name, root=STORE_DIR):
+    path = table_path(name, root)
+    return path.exists() and any(path.rglob("*.parquet"))
+
+
+def to_arrow(frame, name, first_row_id=0):
+    """Typed Arrow table for ``frame`` with ``row_id`` and, for dated tables, ``month`` added."""
+    frame = normalize_columns(frame)
+    schema = SCHEMAS.get(name)
+    if schema is not None:
+        frame = frame.reindex(columns=schema.names)
+        for field in schema:
+            col = frame[field.name]
+            if pa.types.is_timestamp(field.type):
+                frame[field.name] = pd.to_datetime(col, errors="coerce")
+            elif pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+                values = pd.to_numeric(col, errors="coerce")
+                if pa.types.is_integer(field.type):
+                    fractional = values.notna() & (values != np.floor(values))
+                    if fractional.any():
+                        print(f"{name}.{field.name}: {int(fractional.sum())} non-integer values stored as null")
+                        values = values.mask(fractional)
+                frame[field.name] = values
+            else:
+                frame[field.name] = col.where(col.isna(), col.astype(str))
+
+    frame = frame.reset_index(drop=True)
+    frame[ROW_ID] = np.arange(first_row_id, first_row_id + len(frame), dtype=np.int64)
+    if name in PARTITIONED:
+        frame[MONTH] = pd.to_datetime(frame["date"]).dt.strftime("%Y-%m")
+
+    if schema is None:
+        return pa.Table.from_pandas(frame, preserve_index=False)
+    fields = list(schema) + [pa.field(ROW_ID, pa.int64())]
+    if name in PARTITIONED:
+        fields.append(pa.field(MONTH, pa.string()))
+    return pa.Table.from_pandas(frame, schema=pa.schema(fields), preserve_index=False)
+
+
+def _partitioning(table):
+    schema = pa.schema([table.schema.field(key) for key in PARTITION_KEYS])
+    return ds.partitioning(schema, flavor="hive")
+
+
+def write_table(frame, name, root=STORE_DIR, mode="append", first_row_id=None):
+    """Write a DataFrame to store table ``name``; ``mode`` is "append" or "overwrite".
+
+    Appends number their rows after the table's last ``row_id`` unless the
+    caller, writing many batches in a row, passes ``first_row_id`` itself.
+    """
+    path = table_path(name, root)
+    if mode == "overwrite" and path.exists():
+        shutil.rmtree(path)
+    if first_row_id is None:
+        first_row_id = next_row_id(name, root) if mode == "append" else 0
+
+    table = to_arrow(frame, name, first_row_id)
+    partitioned = name in PARTITIONED
+    if partitioned:
+        # Contiguous partitions let each file be written as one row group.
+        table = table.sort_by([(key, "ascending") for key in PARTITION_KEYS] + [(ROW_ID, "ascending")])
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=_partitioning(table) if partitioned else None,
+        min_rows_per_group=ROWS_PER_GROUP,
+        max_rows_per_group=ROWS_PER_GROUP,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    # Partition columns are not stored in the files; keep their types next to them.
+    if not (path / "_common_metadata").exists():
+        pq.write_metadata(table.schema, path / "_common_metadata")
+    return len(frame)
+
+
+def dataset(name, root=STORE_DIR):
+    path = table_path(name, root)
+    if not exists(name, root):
+        raise FileNotFoundError(f"No store table {name!r} under {Path(root)}")
+    schema = pq.read_schema(path / "_common_metadata")
+    partitioning = None
+    if name in PARTITIONED:
+        partitioning = ds.partitioning(pa.schema([schema.field(key) for key in PARTITION_KEYS]), flavor="hive")
+    return ds.dataset(path, schema=schema, format="parquet", partitioning=partitioning)
+
+
+def next_row_id(name, root=STORE_DIR):
+    if not exists(name, root):
+        return 0
+    row_ids = dataset(name, root).to_table(columns=[ROW_ID]).column(ROW_ID)
+    return int(pc.max(row_ids).as_py()) + 1 if len(row_ids) else 0
+
+
+def build_filter(start=None, end=None, hospital_id=None, ward_code=None):
+    """Arrow filter expression; dates prune ``month`` partitions as well as rows."""
+    conditions = []
+    if hospital_id is not None:
+        conditions.append(ds.field("hospital_id") == hospital_id)
+    if ward_code is not None:
+        wards = [ward_code] if isinstance(ward_code, str) else list(ward_code)
+        conditions.append(ds.field("ward_code").isin(wards))
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions.append(ds.field(MONTH) >= start.strftime("%Y-%m"))
+        conditions.append(ds.field("date") >= pa.scalar(start.to_pydatetime(), pa.timestamp("ns")))
+    if end is not None:
+        end = pd.Timestamp(end)
+        conditions.append(ds.field(MONTH) <= end.strftime("%Y-%m"))
+        conditions.append(ds.field("date") <= pa.scalar(end.to_pydatetime(), pa.timestamp("ns")))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read_arrow(name, columns=None, start=None, end=None, hospital_id=None, ward_code=None, root=STORE_DIR):
+    """Arrow table in ingest order, reading only the requested columns and partitions.
+
+    Rows with no date sit in the null ``month`` partition and are left out
+    whenever a date range is given.
+    """
+    data = dataset(name, root)
+    wanted = [c for c in data.schema.names if c not in (ROW_ID, MONTH)] if columns is None else list(columns)
+    table = data.to_table(
+        columns=wanted + [ROW_ID],
+        filter=build_filter(start, end, hospital_id, ward_code),
+    )
+    return table.sort_by(ROW_ID).select(wanted)
+
+
+def read_table(name, columns=None, start=None, end=None, hospital_id=None, ward_code=None, root=STORE_DIR):
+    """DataFrame version of ``read_arrow``."""
+    return read_arrow(name, columns, start, end, hospital_id, ward_code, root).to_pandas()
+
+
+def ingest_csv(paths, name, root=STORE_DIR, chunksize=2_000_000, replace=True):
+    """Write the concatenated CSV files to store table ``name`` chunk by chunk, profiling them on the way.
+
+    ``replace=False`` appends instead, e.g. a new day's file; its profile is
+    saved next to the earlier ones, so only the new rows are scanned.
+    """
+    from database.quality import TableProfile, save_profile
+
+    path = table_path(name, root)
+    if replace and path.exists():
+        shutil.rmtree(path)
+    first_row_id = next_row_id(name, root)
+    profile = TableProfile(name)
+    rows = 0
+    for csv_path in paths:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype=str):
+            profile.update(chunk)
+            rows += write_table(chunk, name, root, first_row_id=first_row_id + rows)
+    if rows:
+        save_profile(profile, name, root)
+    return rows
+
+
+def ingest(dataset_dir=DATASET_DIR, root=STORE_DIR):
+    counts = {}
+    for name, files in SOURCE_FILES.items():
+        paths = [Path(dataset_dir) / f for f in files if (Path(dataset_dir) / f).exists()]
+        if paths:
+            counts[name] = ingest_csv(paths, name, root)
+    return counts
+
+
+def _size(paths):
+    return sum(f.stat().st_size for p in paths for f in ([p] if p.is_file() else p.rglob("*")) if f.is_file())
+
+
+def compare(dataset_dir=DATASET_DIR, root=STORE_DIR, repeat=3):
+    """Full and filtered load times (best of ``repeat``) and disk sizes, CSV vs store."""
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    report = {}
+    for name, files in SOURCE_FILES.items():
+        paths = [Path(dataset_dir) / f for f in files if (Path(dataset_dir) / f).exists()]
+        if not paths or not exists(name, root):
+            continue
+        row = {
+            "csv_mb": _size(paths) / 2**20,
+            "store_mb": _size([table_path(name, root)]) / 2**20,
+            "csv_load_s": best(lambda: pd.concat([pd.read_csv(p, low_memory=False) for p in paths])),
+            "store_load_s": best(lambda: read_table(name, root=root)),
+        }
+        if name in PARTITIONED:
+            sample = read_table(name, columns=["hospital_id", "ward_code", "date"], root=root).dropna()
+            h, w, last = sample["hospital_id"].iloc[-1], sample["ward_code"].iloc[-1], sample["date"].max()
+            first = last - pd.Timedelta(days=30)
+
+            def csv_filtered():
+                frame = pd.concat([normalize_columns(pd.read_csv(p, low_memory=False)) for p in paths])
+                dates = pd.to_datetime(frame["date"], errors="coerce")
+                return frame[(frame["hospital_id"] == h) & (frame["ward_code"] == w) & dates.between(first, last)]
+
+            row["csv_filtered_s"] = best(csv_filtered)
+            row["store_filtered_s"] = best(lambda: read_table(name, start=first, end=last, hospital_id=h,
+                                                              ward_code=w, root=root))
+        report[name] = row
+    return report
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "ingest"
+    dataset_dir = Path(argv[1]) if len(argv) > 1 else DATASET_DIR
+
+    if command == "ingest":
+        for name, rows in ingest(dataset_dir).items():
+            print(f"{name:14s} {rows:>10,d} rows -> {table_path(name)}")
+    elif command == "append":
+        if len(argv) < 3:
+            raise SystemExit("Usage: python -m database.store append TABLE FILE.csv [FILE.csv ...]")
+        name = argv[1]
+        rows = ingest_csv([Path(p) for p in argv[2:]], name, replace=False)
+        print(f"{name:14s} {rows:>10,d} rows appended -> {table_path(name)}")
+    elif command == "compare":
+        report = compare(dataset_dir)
+        for name, row in report.items():
+            line = (f"{name:14s} disk {row['csv_mb']:.2f} -> {row['store_mb']:.2f} MB  "
+                    f"load {row['csv_load_s']:.3f} -> {row['store_load_s']:.3f} s")
+            if "store_filtered_s" in row:
+                line += f"  one ward/30 days {row['csv_filtered_s']:.3f} -> {row['store_filtered_s']:.3f} s"
+            print(line)
+        print(json.dumps(report))
+    else:
+        raise SystemExit(f"Unknown command {command!r}; use ingest, append or compare")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import asyncio
+import os
+from contextlib import contextmanager
+
+MAX_INFLIGHT = int(os.getenv("MEDOPTIX_MAX_INFLIGHT", "1024"))
+
+
+class Overloaded(Exception):
+    """Raised when a request arrives while the service is at its in-flight limit."""
+
+
+class AdmissionControl:
+    """Caps the number of forecasts in flight; requests beyond the cap are refused at once.
+
+    Refusing immediately (the API answers 503 with Retry-After) keeps queueing
+    delay bounded under overload instead of letting every request time out.
+    """
+
+    def __init__(self, max_inflight=MAX_INFLIGHT):
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.rejected = 0
+
+    def __enter__(self):
+        self._reserve(1)
+        return self
+
+    def __exit__(self, *exc):
+        self.inflight -= 1
+        return False
+
+    @contextmanager
+    def admit(self, n):
+        """Hold ``n`` in-flight slots at once, e.g. one per forecast of a batch."""
+        self._reserve(n)
+        try:
+            yield self
+        finally:
+            self.inflight -= n
+
+    def _reserve(self, n):
+        if self.inflight + n > self.max_inflight:
+            self.rejected += 1
+            raise Overloaded(f"{self.inflight} forecasts in flight, {n} more requested (limit {self.max_inflight})")
+        self.inflight += n
+
+
+class Coalescer:
+    """Shares one in-flight computation between identical concurrent requests.
+
+    ``run(key, make)`` awaits ``make()`` for the first caller with ``key``;
+    callers arriving before it finishes get the same result (or exception)
+    without doing the work again. Only use it on the event loop thread.
+    """
+
+    def __init__(self, on_coalesced=None):
+        self._pending = {}
+        self.coalesced = 0
+        self.on_coalesced = on_coalesced
+
+    async def run(self, key, make):
+        future = self._pending.get(key)
+        if future is not None:
+            self.coalesced += 1
+            if self.on_coalesced is not None:
+                self.on_coalesced()
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(make())
+        self._pending[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._pending.get(key) is future:
+                del self._pending[key]
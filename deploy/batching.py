@@ -0,0 +1,88 @@
+import asyncio
+
+
+class MicroBatcher:
+    """Groups concurrent submissions arriving within a short window into one call.
+
+    ``handler`` receives the list of queued items and must return one result per
+    item, in order. It runs in the default executor so the event loop keeps
+    accepting requests while a batch is being scored. Up to ``max_concurrent``
+    batches are scored at once; more than one only helps when the handler
+    hands work to other processes.
+
+    When the handler raises for a batch, each item is scored again on its
+    own, so only the items that fail by themselves get the exception.
+    """
+
+    def __init__(self, handler, max_batch_size=64, max_wait_ms=5.0, max_concurrent=1):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrent = max_concurrent
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        self._slots = None
+        self._inflight = set()
+
+    async def submit(self, item):
+        """Queue ``item`` and wait for its result from the next batch."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+            self._worker = loop.create_task(self._run())
+
+        future = loop.create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._slots.acquire()
+            task = loop.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        try:
+            await self._score(batch)
+        finally:
+            self._slots.release()
+
+    async def _score(self, batch):
+        loop = asyncio.get_running_loop()
+        items = [item for item, _ in batch]
+        try:
+            results = await loop.run_in_executor(None, self.handler, items)
+        except Exception as e:
+            if len(batch) > 1:
+                for entry in batch:
+                    await self._score([entry])
+                return
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,509 @@
+"""Client for the forecast API: pooled connections, concurrent fan-out, batching and a response cache.
+
+``ForecastClient`` (blocking) and ``AsyncForecastClient`` (asyncio) send the
+``PredictRequest`` schema of deploy/inference.py. A request names a series
+by ``hospital_id`` and ``ward_code``. The server builds its features from the
+feature store, and ``features`` only overrides them.
+
+* Each client holds one keep-alive connection pool, and every call has a timeout.
+* Transport errors and 429/502/503/504 responses are retried with
+  exponential backoff. The server's Retry-After is honoured.
+* ``predict_many`` first drops duplicate requests and cache hits. The rest
+  go through ``/predict/batch`` in chunks of ``batch_size``. A server
+  without a batch endpoint (404/405) gets concurrent ``/predict`` calls
+  instead. At most ``concurrency`` calls are in flight at once.
+* Successful responses are cached by request for ``cache_ttl`` seconds.
+
+    with ForecastClient("http://localhost:8000") as client:
+        client.predict(1, "ICU", steps=7)
+        client.predict_many([{"hospital_id": h, "ward_code": w, "steps": 7} for h in (1, 2) for w in ("ED", "ICU")])
+
+    async with AsyncForecastClient("http://localhost:8000") as client:
+        await client.predict_many(requests)
+
+``StandinServer`` is an in-process stand-in for the API, with the same
+request and response shapes, for tests and ``compare``.
+
+Usage::
+
+    python -m deploy.client predict 1 ICU [--steps 7] [--start-date 2025-10-27] [--base-url URL]
+    python -m deploy.client standin [--port 8000] [--latency 0.02] [--no-batch]
+    python -m deploy.client compare [--latency 0.02] [--series 20] [--horizons 3]
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain
+
+import httpx
+import requests
+
+API_URL = os.getenv("MEDOPTIX_API_URL", "http://localhost:8000")
+CONCURRENCY = int(os.getenv("MEDOPTIX_CLIENT_CONCURRENCY", "8"))
+BATCH_SIZE = int(os.getenv("MEDOPTIX_CLIENT_BATCH_SIZE", "64"))
+RETRIES = int(os.getenv("MEDOPTIX_CLIENT_RETRIES", "3"))
+BACKOFF_S = float(os.getenv("MEDOPTIX_CLIENT_BACKOFF_S", "0.2"))
+TIMEOUT_S = float(os.getenv("MEDOPTIX_CLIENT_TIMEOUT_S", "30"))
+CACHE_SIZE = int(os.getenv("MEDOPTIX_CLIENT_CACHE_SIZE", "1024"))
+CACHE_TTL_S = float(os.getenv("MEDOPTIX_CLIENT_CACHE_TTL_S", "300"))
+# A 500 is a scoring error for that request, so retrying it would not help.
+RETRY_STATUS = {429, 502, 503, 504}
+NO_BATCH_STATUS = {404, 405}
+WARDS = ["ED", "ICU", "MED", "SURG"]
+
+
+def forecast_request(hospital_id=None, ward_code=None, steps=1, start_date=None, features=None):
+    """A ``PredictRequest`` body; ``start_date`` may be a date, datetime or ISO string."""
+    body = {"steps": int(steps)}
+    if hospital_id is not None:
+        body["hospital_id"] = int(hospital_id)
+    if ward_code is not None:
+        body["ward_code"] = str(ward_code)
+    if start_date is not None:
+        if isinstance(start_date, datetime):
+            start_date = start_date.date()
+        body["start_date"] = str(start_date)
+    if features:
+        body["features"] = {name: float(value) for name, value in features.items()}
+    return body
+
+
+def request_key(body):
+    return json.dumps(body, sort_keys=True)
+
+
+class ResponseCache:
+    """LRU of response bodies by request key, each kept for ``ttl`` seconds."""
+
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL_S):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+
+class _BaseClient:
+    def __init__(self, base_url=API_URL, concurrency=CONCURRENCY, batch_size=BATCH_SIZE, retries=RETRIES,
+                 backoff=BACKOFF_S, timeout=TIMEOUT_S, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL_S, batch=None):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = ResponseCache(cache_size, cache_ttl) if cache_size else None
+        # None until the first batch call shows whether the server has /predict/batch.
+        self.batch = batch
+        self.limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+
+    def _plan(self, items):
+        """Cache key per request, the cached responses, and the unique uncached bodies to send."""
+        keys, cached, pending = [], {}, {}
+        for item in items:
+            body = forecast_request(**item)
+            key = request_key(body)
+            keys.append(key)
+            if key in cached or key in pending:
+                continue
+            value = self.cache.get(key) if self.cache is not None else None
+            if value is not None:
+                cached[key] = value
+            else:
+                pending[key] = body
+        return keys, cached, pending
+
+    def _chunks(self, items):
+        return [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+
+    def _finish(self, keys, results, fetched):
+        if self.cache is not None:
+            for key, value in fetched.items():
+                self.cache.put(key, value)
+        results.update(fetched)
+        return [copy.deepcopy(results[key]) for key in keys]
+
+    def _delay(self, attempt, response):
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # Exponential backoff with jitter so retries of parallel calls spread out.
+        return self.backoff * 2 ** (attempt - 1) * (0.5 + random.random())
+
+    def _retry(self, attempt, response):
+        """True if the call should be made again after ``response`` (None for a transport error)."""
+        return attempt < self.retries and (response is None or response.status_code in RETRY_STATUS)
+
+
+class ForecastClient(_BaseClient):
+    """Blocking client; ``predict_many`` fans out over a thread pool that shares the connection pool."""
+
+    def __init__(self, base_url=API_URL, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.http = httpx.Client(base_url=self.base_url, limits=self.limits, timeout=self.timeout)
+
+    def close(self):
+        self.http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _post(self, path, body):
+        attempt = 0
+        while True:
+            try:
+                response = self.http.post(path, json=body)
+            except httpx.TransportError:
+                if not self._retry(attempt, None):
+                    raise
+                response = None
+            if not self._retry(attempt, response):
+                return response
+            attempt += 1
+            time.sleep(self._delay(attempt, response))
+
+    def _send_one(self, body):
+        response = self._post("/predict", body)
+        response.raise_for_status()
+        return response.json()
+
+    def _send_batch(self, chunk):
+        """Responses for one chunk via /predict/batch, or None if the server has no batch endpoint."""
+        response = self._post("/predict/batch", {"requests": [body for _, body in chunk]})
+        if response.status_code in NO_BATCH_STATUS:
+            self.batch = False
+            return None
+        response.raise_for_status()
+        self.batch = True
+        return response.json()["results"]
+
+    def _fetch(self, pending):
+        items = list(pending.items())
+        keys = [key for key, _ in items]
+        if len(items) > 1 and self.batch is not False:
+            chunks = self._chunks(items)
+            # The first chunk goes alone while the server's batch support is unknown.
+            first = self._send_batch(chunks[0])
+            if first is not None:
+                with ThreadPoolExecutor(min(self.concurrency, len(chunks))) as pool:
+                    rest = list(pool.map(self._send_batch, chunks[1:]))
+                return dict(zip(keys, chain(first, *rest)))
+        with ThreadPoolExecutor(min(self.concurrency, len(items))) as pool:
+            return dict(zip(keys, pool.map(self._send_one, [body for _, body in items])))
+
+    def predict(self, hospital_id=None, ward_code=None, steps=1, start_date=None, features=None):
+        """The /predict response for one series."""
+        return self.predict_many([{"hospital_id": hospital_id, "ward_code": ward_code, "steps": steps,
+                                   "start_date": start_date, "features": features}])[0]
+
+    def predict_many(self, items):
+        """Responses for a list of ``forecast_request`` keyword dicts, in order."""
+        keys, results, pending = self._plan(items)
+        return self._finish(keys, results, self._fetch(pending) if pending else {})
+
+
+class AsyncForecastClient(_BaseClient):
+    """asyncio client; ``predict_many`` fans out as tasks over one ``httpx.AsyncClient``."""
+
+    def __init__(self, base_url=API_URL, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.http = httpx.AsyncClient(base_url=self.base_url, limits=self.limits, timeout=self.timeout)
+
+    async def close(self):
+        await self.http.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _post(self, path, body, limit):
+        attempt = 0
+        while True:
+            try:
+                async with limit:
+                    response = await self.http.post(path, json=body)
+            except httpx.TransportError:
+                if not self._retry(attempt, None):
+                    raise
+                response = None
+            if not self._retry(attempt, response):
+                return response
+            attempt += 1
+            await asyncio.sleep(self._delay(attempt, response))
+
+    async def _send_one(self, body, limit):
+        response = await self._post("/predict", body, limit)
+        response.raise_for_status()
+        return response.json()
+
+    async def _send_batch(self, chunk, limit):
+        response = await self._post("/predict/batch", {"requests": [body for _, body in chunk]}, limit)
+        if response.status_code in NO_BATCH_STATUS:
+            self.batch = False
+            return None
+        response.raise_for_status()
+        self.batch = True
+        return response.json()["results"]
+
+    async def _fetch(self, pending):
+        items = list(pending.items())
+        keys = [key for key, _ in items]
+        limit = asyncio.Semaphore(self.concurrency)
+        if len(items) > 1 and self.batch is not False:
+            chunks = self._chunks(items)
+            first = await self._send_batch(chunks[0], limit)
+            if first is not None:
+                rest = await asyncio.gather(*(self._send_batch(chunk, limit) for chunk in chunks[1:]))
+                return dict(zip(keys, chain(first, *rest)))
+        return dict(zip(keys, await asyncio.gather(*(self._send_one(body, limit) for _, body in items))))
+
+    async def predict(self, hospital_id=None, ward_code=None, steps=1, start_date=None, features=None):
+        return (await self.predict_many([{"hospital_id": hospital_id, "ward_code": ward_code, "steps": steps,
+                                          "start_date": start_date, "features": features}]))[0]
+
+    async def predict_many(self, items):
+        keys, results, pending = self._plan(items)
+        return self._finish(keys, results, await self._fetch(pending) if pending else {})
+
+
+# ---------------------------------------------------------------------------
+# Local stand-in server
+
+class StandinServer:
+    """Threaded HTTP server that answers /predict and /predict/batch in the API's response shape.
+
+    Forecasts are a deterministic function of the request, so repeated calls
+    compare equal. ``latency`` delays every HTTP request. With ``batch=False``,
+    /predict/batch answers 404, like an API without the endpoint.
+    ``fail_first`` answers the first N requests with 503 and Retry-After: 0.
+    """
+
+    def __init__(self, port=0, latency=0.0, batch=True, fail_first=0):
+        self.latency = latency
+        self.batch = batch
+        self.fail_first = fail_first
+        self.requests = {}
+        self.forecasts = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.forecasts = 0
+
+    def forecast(self, body):
+        """The stand-in response for one ``PredictRequest`` body; raises ValueError for an invalid one."""
+        steps = body.get("steps", 1)
+        if not isinstance(steps, int) or steps < 1:
+            raise ValueError("steps must be a positive integer")
+        hospital_id, ward_code = body.get("hospital_id"), body.get("ward_code")
+        features = body.get("features") or {}
+        start = date.fromisoformat(body["start_date"]) if body.get("start_date") else date.today() + timedelta(1)
+        level = 10 * (hospital_id or 0) + sum(map(ord, ward_code or "")) % 40
+        with self._lock:
+            self.forecasts += 1
+        return {
+            "predictions": [level + (start.toordinal() + h) % 7 for h in range(steps)],
+            "steps": steps,
+            "model": "series" if hospital_id is not None and ward_code else "global",
+            "features_used": [],
+            "features_provided": list(features),
+            "feature_source": "store" if hospital_id is not None and ward_code else "request",
+            "start_date": str(start),
+            "missing_features": [],
+            "note": "0 features were auto-filled with 0",
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with server._lock:
+                    server.requests[self.path] = server.requests.get(self.path, 0) + 1
+                    count = sum(server.requests.values())
+                if server.latency:
+                    time.sleep(server.latency)
+                if count <= server.fail_first:
+                    return self._reply(503, {"detail": "Server busy"}, {"Retry-After": "0"})
+                try:
+                    payload = json.loads(body or b"{}")
+                    if self.path == "/predict":
+                        return self._reply(200, server.forecast(payload))
+                    if self.path == "/predict/batch" and server.batch:
+                        results = [server.forecast(item) for item in payload["requests"]]
+                        return self._reply(200, {"results": results, "count": len(results)})
+                except (ValueError, KeyError, TypeError) as e:
+                    return self._reply(422, {"detail": str(e)})
+                self._reply(404, {"detail": "Not Found"})
+
+            def _reply(self, status, obj, headers=None):
+                body = json.dumps(obj).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def compare(latency=0.02, n_series=20, horizons=3, repeat=3):
+    """Seconds and HTTP requests for the same forecasts sent five ways, against the stand-in.
+
+    The sent forecasts are ``n_series`` hospital/ward series times
+    ``horizons`` horizons, and each is asked for twice. The five ways are:
+    the old one-``requests.post``-per-forecast loop, pooled sync fan-out,
+    asyncio fan-out, batched, and a batched re-run served from the cache.
+    """
+    series = [(1 + i // len(WARDS), WARDS[i % len(WARDS)]) for i in range(n_series)]
+    items = [{"hospital_id": h, "ward_code": w, "steps": 7 * (k + 1)} for h, w in series for k in range(horizons)] * 2
+
+    def best(server, fn):
+        times = []
+        for _ in range(repeat):
+            server.reset()
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times), sum(server.requests.values())
+
+    report = {"forecasts": len(items), "latency_s": latency}
+    with StandinServer(latency=latency) as server, StandinServer(latency=latency, batch=False) as plain:
+        def loop():
+            for item in items:
+                requests.post(f"{plain.url}/predict", json=forecast_request(**item), timeout=TIMEOUT_S).json()
+
+        def pooled():
+            with ForecastClient(plain.url, cache_size=0) as client:
+                client.predict_many(items)
+
+        def async_fanout():
+            async def run():
+                async with AsyncForecastClient(plain.url, cache_size=0) as client:
+                    await client.predict_many(items)
+            asyncio.run(run())
+
+        def batched():
+            with ForecastClient(server.url, cache_size=0) as client:
+                client.predict_many(items)
+
+        cached_client = ForecastClient(server.url)
+        cached_client.predict_many(items)
+        with cached_client:
+            runs = {"loop": (plain, loop), "pooled": (plain, pooled), "async": (plain, async_fanout),
+                    "batch": (server, batched), "cached": (server, lambda: cached_client.predict_many(items))}
+            for name, (target, fn) in runs.items():
+                report[f"{name}_s"], report[f"{name}_requests"] = best(target, fn)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forecast API client.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    one = sub.add_parser("predict")
+    one.add_argument("hospital_id", type=int)
+    one.add_argument("ward_code")
+    one.add_argument("--steps", default=7, type=int)
+    one.add_argument("--start-date", default=None)
+    one.add_argument("--base-url", default=API_URL)
+    serve = sub.add_parser("standin")
+    serve.add_argument("--port", default=8000, type=int)
+    serve.add_argument("--latency", default=0.0, type=float)
+    serve.add_argument("--no-batch", action="store_true", help="answer /predict/batch with 404")
+    bench = sub.add_parser("compare")
+    bench.add_argument("--latency", default=0.02, type=float)
+    bench.add_argument("--series", default=20, type=int)
+    bench.add_argument("--horizons", default=3, type=int)
+    args = parser.parse_args()
+
+    if args.command == "predict":
+        with ForecastClient(args.base_url) as client:
+            print(json.dumps(client.predict(args.hospital_id, args.ward_code, args.steps, args.start_date), indent=2))
+    elif args.command == "standin":
+        server = StandinServer(args.port, args.latency, batch=not args.no_batch)
+        print(f"Serving /predict{'' if args.no_batch else ' and /predict/batch'} on {server.url}")
+        server.httpd.serve_forever()
+    else:
+        report = compare(args.latency, args.series, args.horizons)
+        print(f"{report['forecasts']} forecasts at {report['latency_s']}s latency:")
+        for name in ("loop", "pooled", "async", "batch", "cached"):
+            print(f"  {name:7s} {report[f'{name}_s']:.3f}s  {report[f'{name}_requests']} HTTP requests")
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Online feature store: cleaned feature rows keyed by (hospital_id, ward_code, date).
+
+Forecast clients used to send the lag features by hand, and everything they
+left out was zero-filled. The store holds the cleaned rows in memory, one
+dict entry per (hospital_id, ward_code, day), plus each series' newest day.
+Building the exog for a request is then a few dict lookups per forecast day,
+with no scan of history. ``exog`` returns a (steps, schema) matrix for a
+forecast starting on any date:
+
+* A day that has a cleaned row uses that row.
+* A later day takes its lags from the days they refer to. lag1 is the
+  previous day's value and lag7 the value a week before. The value of
+  column ``c`` on day t is row t+1's ``c_lag1`` or row t+7's ``c_lag7``.
+  Days after the newest observed one carry its last known value forward.
+* The other features (admission mix, capacity, staffing) come from the
+  series' newest row.
+
+``hospital_id`` and the ``ward_code_*`` dummies follow from the key. Values
+a client sends override the store's for every step. ``forecast_exog`` builds
+the exog for a model's own forecast periods: day by day for a daily model,
+otherwise the newest day's row held over every period.
+
+    features = FeatureStore.load()
+    exog = features.exog(3, "ICU", "2024-06-01", 7, engine.schema)
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from model.train_series import load_cleaned_data
+
+KEYS = ["date", "hospital_id", "ward_code"]
+TARGET = "admissions"
+LAGS = {"lag1": 1, "lag7": 7}
+
+
+def _day(value):
+    return pd.Timestamp(value).toordinal()
+
+
+class FeatureStore:
+    """Feature rows by (hospital_id, ward_code, ordinal day); when a day repeats, the row added last wins."""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.position = {name: i for i, name in enumerate(self.columns)}
+        self.bases = sorted({c[:-5] for c in self.columns if c.endswith("_lag1") and f"{c[:-5]}_lag7" in self.position})
+        # Each lag column -> (the base's lag1 column, how many days back it looks).
+        self.lagged = {self.position[f"{base}_{lag}"]: (self.position[f"{base}_lag1"], days)
+                       for base in self.bases for lag, days in LAGS.items()}
+        self.lag7_of = {self.position[f"{base}_lag1"]: self.position[f"{base}_lag7"] for base in self.bases}
+        self.rows = {}
+        self.latest = {}
+        self._layouts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, data):
+        columns = [c for c in data.columns if c not in KEYS and c != TARGET]
+        store = cls(columns)
+        store.update(data)
+        return store
+
+    @classmethod
+    def load(cls, **kwargs):
+        """The store over the cleaned data (Parquet store or cleaned_data.csv)."""
+        return cls.from_frame(load_cleaned_data(compact=True, **kwargs))
+
+    def update(self, data):
+        """Add or replace cleaned rows; the cost is proportional to the new rows."""
+        values = data.reindex(columns=self.columns).to_numpy(dtype=float)
+        days = pd.to_datetime(data["date"]).map(pd.Timestamp.toordinal).to_numpy()
+        hospitals, wards = data["hospital_id"].to_numpy(), data["ward_code"].astype(str).to_numpy()
+        with self._lock:
+            for hospital_id, ward_code, day, row in zip(hospitals, wards, days, values):
+                series = (int(hospital_id), ward_code)
+                self.rows[series + (int(day),)] = row
+                if day > self.latest.get(series, -1):
+                    self.latest[series] = int(day)
+        return len(values)
+
+    def __contains__(self, series):
+        return tuple(series) in self.latest
+
+    def series(self):
+        return sorted(self.latest)
+
+    def latest_date(self, hospital_id, ward_code):
+        day = self.latest.get((hospital_id, ward_code))
+        return None if day is None else pd.Timestamp.fromordinal(day)
+
+    def row(self, hospital_id, ward_code, date):
+        """Feature values of one day as a dict, or None if the day has no cleaned row."""
+        row = self.rows.get((hospital_id, ward_code, _day(date)))
+        return None if row is None else dict(zip(self.columns, row.tolist()))
+
+    def first_day(self, hospital_id, ward_code, start=None):
+        """The forecast's first day: ``start``, or the day after the series' newest row."""
+        if start is not None:
+            return pd.Timestamp(start)
+        return pd.Timestamp.fromordinal(self.latest[(hospital_id, ward_code)] + 1)
+
+    def value(self, hospital_id, ward_code, name):
+        """``name`` on the series' newest day, or None."""
+        day, col = self.latest.get((hospital_id, ward_code)), self.position.get(name)
+        if day is None or col is None:
+            return None
+        return float(self.rows[(hospital_id, ward_code, day)][col])
+
+    def provides(self, name):
+        return name in self.position or name == "hospital_id" or name.startswith("ward_code_")
+
+    def _raw(self, series, lag1, day, fallback):
+        """Value on ``day`` of the column whose lag1 is at ``lag1``, read back from later rows' lags."""
+        for offset, position in ((1, lag1), (7, self.lag7_of[lag1])):
+            row = self.rows.get(series + (day + offset,))
+            if row is not None:
+                return row[position]
+        return fallback
+
+    def days(self, hospital_id, ward_code, start, steps):
+        """(steps, columns) feature values for the ``steps`` days from ``start``."""
+        series = (hospital_id, ward_code)
+        newest = self.latest[series]
+        latest = self.rows[series + (newest,)]
+        first = _day(self.first_day(hospital_id, ward_code, start))
+        out = np.empty((steps, len(self.columns)))
+        for h in range(steps):
+            day = first + h
+            row = self.rows.get(series + (day,))
+            if row is not None:
+                out[h] = row
+                continue
+            out[h] = latest
+            for col, (lag1, back) in self.lagged.items():
+                # Values up to the day before the newest row are known; later ones carry the last forward.
+                known = day - back < newest
+                out[h, col] = self._raw(series, lag1, day - back, latest[lag1]) if known else latest[lag1]
+        return out
+
+    def layout(self, schema):
+        """(store column or -1 per schema name); cached per schema."""
+        key = tuple(schema)
+        layout = self._layouts.get(key)
+        if layout is None:
+            layout = np.array([self.position.get(name, -1) for name in schema])
+            self._layouts[key] = layout
+        return layout
+
+    def forecast_exog(self, hospital_id, ward_code, periods, schema, overrides=None):
+        """Exog for a forecast over ``periods`` (``ForecastEngine.next_periods``)."""
+        if periods.freqstr == "D":
+            return self.exog(hospital_id, ward_code, periods[0], len(periods), schema, overrides)
+        newest = self.exog(hospital_id, ward_code, self.latest_date(hospital_id, ward_code), 1, schema, overrides)
+        return np.repeat(newest, len(periods), axis=0)
+
+    def exog(self, hospital_id, ward_code, start, steps, schema, overrides=None):
+        """(steps, len(schema)) exog for a forecast of ``steps`` days from ``start`` (default: after the newest day).
+
+        Raises KeyError for a series the store does not have.
+        """
+        if (hospital_id, ward_code) not in self.latest:
+            raise KeyError(f"No features for hospital {hospital_id}, ward {ward_code}")
+        values = self.days(hospital_id, ward_code, start, steps)
+        layout = self.layout(schema)
+        exog = np.where(layout >= 0, values[:, np.maximum(layout, 0)], 0.0)
+        for i, name in enumerate(schema):
+            if name == "hospital_id":
+                exog[:, i] = hospital_id
+            elif name.startswith("ward_code_"):
+                exog[:, i] = float(name == f"ward_code_{ward_code}")
+        for name, value in (overrides or {}).items():
+            if name in schema:
+                exog[:, list(schema).index(name)] = value
+        return exog
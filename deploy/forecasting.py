@@ -0,0 +1,220 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from deploy.metrics import AUTOFILLED_FEATURES, AUTOFILLED_REQUESTS, INTERNAL_STAGES
+from model.compact import CompactSARIMAX
+
+
+class ForecastEngine:
+    """Vectorised SARIMAX forecasting for many feature rows at once.
+
+    With the exogenous regressors in the observation equation (the statsmodels
+    default), a forecast is the ARIMA baseline plus ``exog @ beta``. The engine
+    computes the baseline once per horizon and scores any number of requests
+    with a single matrix product instead of one ``model.forecast`` each.
+    """
+
+    def __init__(self, model, schema, version=None):
+        self.model = model
+        self.schema = list(schema)
+        # The served global-model version (model/versions.py); None for per-series models.
+        self.version = version
+        self.index = {name: i for i, name in enumerate(self.schema)}
+        self.linear = is_exog_linear(model)
+        self.beta = exog_coefficients(model, self.schema) if self.linear else None
+        self._baseline = np.empty(0)
+        self._observe_lock = threading.Lock()
+
+    def baseline(self, steps):
+        """Forecast with all exogenous features at zero, cached by horizon."""
+        if steps > len(self._baseline):
+            zeros = np.zeros((steps, len(self.schema)))
+            self._baseline = np.asarray(self.model.forecast(steps=steps, exog=zeros), dtype=float)
+        return self._baseline[:steps]
+
+    def build_exog(self, feature_rows):
+        """Stack feature dicts into one (n_rows, n_schema) matrix; unknown keys are ignored, missing ones are 0."""
+        exog = np.zeros((len(feature_rows), len(self.schema)))
+        for row, features in enumerate(feature_rows):
+            for name, value in features.items():
+                col = self.index.get(name)
+                if col is not None:
+                    exog[row, col] = value
+        return exog
+
+    def forecast_many(self, feature_rows, steps):
+        """Forecast each request for its own horizon; returns one float array per request.
+
+        A request is a feature dict, held over the horizon, or a (steps,
+        n_schema) exog matrix in schema order, one row per forecast day.
+        """
+        if not self.linear:
+            return [self._forecast_one(features, n) for features, n in zip(feature_rows, steps)]
+
+        baseline = self.baseline(max(steps))
+        held = [i for i, features in enumerate(feature_rows) if isinstance(features, dict)]
+        forecasts = [None] * len(feature_rows)
+        if held:
+            offsets = self.build_exog([feature_rows[i] for i in held]) @ self.beta
+            for i, offset in zip(held, offsets):
+                forecasts[i] = baseline[:steps[i]] + offset
+        for i, features in enumerate(feature_rows):
+            if forecasts[i] is None:
+                forecasts[i] = baseline[:steps[i]] + np.asarray(features, dtype=float)[:steps[i]] @ self.beta
+        return forecasts
+
+    def sweep(self, base_features, grid, steps):
+        """Score every combination of ``grid`` values on top of ``base_features``.
+
+        ``grid`` maps feature names to the values to try. Returns the scenario
+        matrix (one column per grid feature), the (n_scenarios, steps) forecast
+        matrix and the grid features the model does not use.
+        """
+        if not self.linear:
+            raise ValueError("Scenario sweeps need a model whose exog enters as a fixed regression term")
+
+        names = list(grid)
+        axes = np.meshgrid(*[np.asarray(grid[name], dtype=float) for name in names], indexing="ij")
+        scenarios = np.column_stack([axis.ravel() for axis in axes]) if names else np.empty((1, 0))
+
+        base = self.build_exog([base_features])[0]
+        used = [i for i, name in enumerate(names) if name in self.index]
+        cols = [self.index[names[i]] for i in used]
+
+        # Swap the swept columns of the base row for each scenario's values.
+        offsets = base @ self.beta + (scenarios[:, used] - base[cols]) @ self.beta[cols]
+        forecasts = self.baseline(steps)[None, :] + offsets[:, None]
+        ignored = [name for name in names if name not in self.index]
+        return scenarios, forecasts, ignored
+
+    def next_periods(self, steps):
+        """The ``steps`` periods a forecast covers: from the period after the model's last observed one, at its
+        frequency. None when the model records neither.
+        """
+        last, freq = model_index(self.model)
+        if last is None or not freq:
+            return None
+        return pd.date_range(last, periods=steps + 1, freq=freq)[1:]
+
+    def observe(self, admissions, feature_rows, dates=None, persist=True):
+        """Advance the model's filtered state with newly observed periods; returns how many were applied.
+
+        Only compact models can be updated in place. With ``dates``, periods at
+        or before the model's last observed date are skipped, so replaying a day
+        is harmless. The rest must be periods of the model's frequency that follow
+        on from it without a gap; a missing period is sent with admissions None.
+        ``persist`` writes the new state back to the artifact.
+        """
+        if not hasattr(self.model, "observe"):
+            raise ValueError("Only compact model artifacts can be updated in place; export one with model.compact")
+
+        with self._observe_lock:
+            manifest = self.model.manifest
+            if dates is not None:
+                periods = check_periods(dates, manifest)
+                keep = [i for i, d in enumerate(periods) if d is not None]
+                admissions = [admissions[i] for i in keep]
+                feature_rows = [feature_rows[i] for i in keep]
+                dates = [periods[i] for i in keep]
+            if not admissions:
+                return 0
+
+            endog = np.array([np.nan if a is None else a for a in admissions], dtype=float)
+            exog = np.array([[row.get(name, 0.0) for name in self.model.exog_names] for row in feature_rows],
+                            dtype=float)
+            applied = self.model.observe(endog, exog)
+            self._baseline = np.empty(0)
+            if persist:
+                self.model.save_state(last_index=pd.Timestamp(dates[-1]) if dates else None)
+            return applied
+
+    def _forecast_one(self, features, steps):
+        if isinstance(features, dict):
+            exog = np.repeat(self.build_exog([features]), steps, axis=0)
+        else:
+            exog = np.asarray(features, dtype=float)[:steps]
+        return np.asarray(self.model.forecast(steps=steps, exog=exog), dtype=float)
+
+
+def model_index(model):
+    """(last observed period, frequency string) of a compact or pickled model; either may be None."""
+    manifest = getattr(model, "manifest", None)
+    if manifest is not None:
+        last = manifest.get("last_index")
+        return (pd.Timestamp(last) if last else None), manifest.get("freq")
+    index = getattr(getattr(model, "model", None), "_index", None)
+    if isinstance(index, pd.DatetimeIndex) and len(index):
+        return index[-1], index.freqstr
+    return None, None
+
+
+def check_periods(dates, manifest):
+    """Dates as periods of the model's frequency; None for those at or before its last observed period.
+
+    Raises ValueError for a date off the frequency (a Wednesday for a W-SUN
+    model) or new periods that do not follow on from the last one.
+    """
+    freq = manifest.get("freq")
+    if not freq:
+        raise ValueError("The model artifact records no frequency; re-export it with model.compact")
+    offset = pd.tseries.frequencies.to_offset(freq)
+    periods = pd.DatetimeIndex(pd.to_datetime(dates)).normalize()
+    off = [d for d in periods if not offset.is_on_offset(d)]
+    if off:
+        raise ValueError(f"{off[0].date()} is not a period of the model's frequency {freq}")
+
+    last = pd.Timestamp(manifest["last_index"]) if manifest.get("last_index") else None
+    new = periods[periods > last] if last is not None else periods
+    if len(new):
+        first = last + offset if last is not None else new[0]
+        expected = pd.date_range(first, periods=len(new), freq=offset)
+        if not new.equals(expected):
+            gap = next(e for d, e in zip(new, expected) if d != e)
+            raise ValueError(f"Observations must be consecutive {freq} periods; expected {gap.date()} next "
+                             f"(send a missing period with admissions null)")
+    return [d if last is None or d > last else None for d in periods]
+
+
+def is_exog_linear(model):
+    """True when exog enters only through a fixed regression term, so forecasts are additive in exog."""
+    if isinstance(model, CompactSARIMAX):
+        return True
+    spec = getattr(model, "model", None)
+    if spec is None:
+        return False
+    return getattr(spec, "mle_regression", False) and not getattr(spec, "time_varying_regression", False)
+
+
+def exog_coefficients(model, schema):
+    """Fitted regression coefficients ordered like ``schema``."""
+    if isinstance(model, CompactSARIMAX):
+        return model.exog_coefficients(schema)
+    return np.asarray(model.params[list(schema)], dtype=float)
+
+
+def run_internal_prediction(model, schema, steps, features):
+    """Single-request forecast as the Streamlit app runs it; returns (predictions, error)."""
+    try:
+        with INTERNAL_STAGES.time(stage="frame"):
+            exog_df = pd.DataFrame([features] * steps)
+        missing = [f for f in schema if f not in features]
+        if missing:
+            AUTOFILLED_REQUESTS.inc()
+            for feature in missing:
+                AUTOFILLED_FEATURES.inc(feature=feature)
+        with INTERNAL_STAGES.time(stage="reindex"):
+            exog_df = exog_df.reindex(columns=schema, fill_value=0)
+        with INTERNAL_STAGES.time(stage="forecast"):
+            forecast = model.forecast(steps=steps, exog=exog_df)
+        with INTERNAL_STAGES.time(stage="round"):
+            predictions = [max(0, round(pred)) for pred in forecast.tolist()]
+        return predictions, None
+    except Exception as e:
+        return [], str(e)
+
+
+def to_admissions(forecast):
+    """Round forecasts to whole, non-negative admission counts."""
+    return np.maximum(np.rint(forecast), 0).astype(int).tolist()
@@ -0,0 +1,106 @@
+"""Hot reload of the global model from the versioned model directories (model/versions.py).
+
+``ModelWatcher`` polls ``versions/serving.json`` every
+``MEDOPTIX_RELOAD_INTERVAL_S`` seconds from a daemon thread. When the
+current or candidate version changes, it loads that version in the same
+thread, while the API keeps serving the old one, and then hands the loaded
+``ServedModel`` to a callback. The API swaps its reference to the served
+engine in one assignment. Requests that already picked an engine finish on
+it, and new requests get the new version. If a version fails to load, the
+old one keeps serving, and the watcher tries again when the pointer next
+changes.
+"""
+import os
+import threading
+from pathlib import Path
+
+from deploy.forecasting import ForecastEngine
+from deploy.metrics import MODEL_LOAD, MODEL_SWAPS
+from model.compact import load_model, load_schema
+from model.versions import observed_dir
+
+RELOAD_INTERVAL_S = float(os.getenv("MEDOPTIX_RELOAD_INTERVAL_S", "5"))
+# Version label of the unversioned model directory served before any version is published.
+BASE_VERSION = "base"
+
+
+class ServedModel:
+    """One loaded global-model version: its directory, model, schema and engine."""
+
+    def __init__(self, version, path, model, schema):
+        self.version = version
+        self.path = Path(path)
+        self.model = model
+        self.schema = schema
+        self.engine = ForecastEngine(model, schema, version=version)
+
+
+def load_served(version, path):
+    """Load the global model in ``path``, with any state /observe advanced for its version."""
+    path = Path(path)
+    with MODEL_LOAD.time(model="global"):
+        model = load_model(path / "sarimax_model.pkl", path / "sarimax_compact", observed_dir(path))
+    return ServedModel(version, path, model, load_schema(path / "sarimax_schema.json"))
+
+
+class ModelWatcher:
+    """Loads the versions ``serving.json`` names, off the request path, as they change.
+
+    ``on_current(served)`` receives each newly activated version.
+    ``on_candidate(served)`` receives each new candidate, or None when the
+    candidate is cleared. ``seen`` holds the version of each role that was
+    last acted on. Set it for versions loaded at start-up.
+    """
+
+    def __init__(self, versions, on_current, on_candidate, interval=RELOAD_INTERVAL_S):
+        self.versions = versions
+        self.callbacks = {"current": on_current, "candidate": on_candidate}
+        self.interval = interval
+        self.seen = {"current": None, "candidate": None}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        """Load and hand over each role whose version changed since the last check; returns the roles swapped."""
+        serving = self.versions.serving()
+        swapped = []
+        for role, callback in self.callbacks.items():
+            version = serving.get(role)
+            if version == self.seen[role]:
+                continue
+            self.seen[role] = version
+            if version is None:
+                # A cleared candidate stops shadowing; without a current version the loaded one keeps serving.
+                if role == "candidate":
+                    callback(None)
+                    swapped.append(role)
+                continue
+            try:
+                served = load_served(version, self.versions.path(version))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Model version {version} not loaded as {role}: {e}")
+                continue
+            callback(served)
+            MODEL_SWAPS.inc(role=role)
+            print(f"Model version {version} is now {role}")
+            swapped.append(role)
+        return swapped
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Model watcher: {e}")
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,85 +1,603 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel, Field
-import pickle
-import pandas as pd
-import json
+import os
+import sys
+import time
 from pathlib import Path
-from typing import Dict, Union
+from datetime import date
+from typing import Dict, List, Optional, Union
+
+if not __package__:
+    # Run as a script (cd deploy && python inference.py): the deploy/ and model/ packages live in the repo root.
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from deploy.admission import AdmissionControl, Coalescer, Overloaded
+from deploy.batching import MicroBatcher
+from deploy.feature_store import FeatureStore
+from deploy import profiling
+from deploy.forecasting import to_admissions
+from deploy.hot_reload import BASE_VERSION, ModelWatcher, load_served
+from deploy.materialized import HORIZON, BackgroundRefresh, ForecastTable, materialize
+from deploy.metrics import (AUTOFILLED_FEATURES, AUTOFILLED_REQUESTS, COALESCED_REQUESTS, METRICS,
+                            PREDICT_STAGES, REJECTED_REQUESTS)
+from deploy.model_cache import ModelCache
+from deploy.risk import N_PATHS, capacity_risk, risk_level
+from deploy.shadow import ShadowScorer
+from deploy.workers import WORKERS, ForecastPool, state_of
+from model.registry import ModelRegistry
+from model.versions import ModelVersions
 
 app = FastAPI(title="MedOptix API")
 
+
+class ReceivedAtMiddleware:
+    """Stamps each request on arrival so /predict can time body parsing and validation."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["received_at"] = time.perf_counter()
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(ReceivedAtMiddleware)
+
 MODEL = None
 FEATURE_SCHEMA = None
+ENGINE = None
+SERVED = None
+WATCHER = None
+MODEL_CACHE = None
+POOL = None
+FEATURES = None
+FORECASTS = ForecastTable()
+
+BATCH_WINDOW_MS = float(os.getenv("MEDOPTIX_BATCH_WINDOW_MS", "5"))
+MAX_BATCH_SIZE = int(os.getenv("MEDOPTIX_MAX_BATCH_SIZE", "256"))
+MAX_SCENARIOS = int(os.getenv("MEDOPTIX_MAX_SCENARIOS", "100000"))
+MAX_RISK_PATHS = int(os.getenv("MEDOPTIX_MAX_RISK_PATHS", "100000"))
+MODEL_DIR = Path(__file__).resolve().parent.parent / "model"
+REGISTRY_DIR = Path(os.getenv("MEDOPTIX_REGISTRY_DIR", MODEL_DIR / "registry"))
+VERSIONS_DIR = Path(os.getenv("MEDOPTIX_MODEL_VERSIONS_DIR", MODEL_DIR / "versions"))
+MODEL_CACHE_MB = float(os.getenv("MEDOPTIX_MODEL_CACHE_MB", "512"))
+MATERIALIZE = os.getenv("MEDOPTIX_MATERIALIZE", "1") != "0"
+
+ADMISSION = AdmissionControl()
+COALESCER = Coalescer(on_coalesced=COALESCED_REQUESTS.inc)
 
 @app.on_event("startup")
 def load_artifacts():
-    global MODEL, FEATURE_SCHEMA
-    model_path = Path("../model/sarimax_model.pkl")
-    schema_path = Path("../model/sarimax_schema.json")
-    
-    if model_path.exists():
-        with open(model_path, 'rb') as f:
-            MODEL = pickle.load(f)
-    else:
-        print("Model file not found at:", model_path.absolute())
-    
-    if schema_path.exists():
-        with open(schema_path, 'r') as f:
-            FEATURE_SCHEMA = json.load(f)
-    else:
-        print("Schema file not found at:", schema_path.absolute())
+    global MODEL_CACHE, POOL, FEATURES, WATCHER
+    # The version model/versions/serving.json names, else the unversioned artifacts in model/.
+    versions = ModelVersions(VERSIONS_DIR)
+    model_dir = versions.serving_dir(default=MODEL_DIR)
+    try:
+        serve(load_served(versions.current() or BASE_VERSION, model_dir))
+    except (OSError, ValueError) as e:
+        print(f"Global model not loaded from {model_dir.absolute()}: {e}")
+
+    # Per-series models are loaded on first use, bounded by MEDOPTIX_MODEL_CACHE_MB.
+    MODEL_CACHE = ModelCache(ModelRegistry(REGISTRY_DIR), max_bytes=int(MODEL_CACHE_MB * 2**20))
+    print(f"Model registry at {REGISTRY_DIR.absolute()}: {len(MODEL_CACHE.registry)} series models")
+
+    # Requests that name a hospital and ward get their features from the cleaned data.
+    try:
+        FEATURES = FeatureStore.load()
+        print(f"Feature store: {len(FEATURES.rows)} rows for {len(FEATURES.latest)} series")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Feature store not loaded: {e}")
+
+    # With MEDOPTIX_SERVE_WORKERS=N, batches are scored in N worker processes, N at a time.
+    if WORKERS > 0 and POOL is None:
+        POOL = ForecastPool(WORKERS, versions.current() or BASE_VERSION, MODEL_DIR, VERSIONS_DIR, REGISTRY_DIR,
+                            int(MODEL_CACHE_MB * 2**20))
+        BATCHER.max_concurrent = WORKERS
+
+    refresh_forecasts()
+
+    # New versions are loaded in the watcher's thread and swapped in without a restart.
+    if WATCHER is None:
+        WATCHER = ModelWatcher(versions, swap_current, swap_candidate)
+        WATCHER.seen["current"] = versions.current()
+        WATCHER.check()
+        WATCHER.start()
+
+
+def serve(served):
+    global MODEL, FEATURE_SCHEMA, ENGINE, SERVED
+    MODEL, FEATURE_SCHEMA, ENGINE, SERVED = served.model, served.schema, served.engine, served
+
+
+def swap_current(served):
+    """Serve a newly activated version; requests that already picked the old engine finish on it."""
+    if POOL is not None:
+        # The new workers load the version before the pool switches to them; they load the old one again
+        # only for a request that picked it before the swap.
+        POOL.reload(served.version)
+    serve(served)
+    if SHADOW.candidate is not None and SHADOW.candidate.version == served.version:
+        SHADOW.set_candidate(None)
+    refresh_forecasts()
+
+
+def swap_candidate(served):
+    SHADOW.set_candidate(served.engine if served is not None else None)
+
+
+def refresh_forecasts():
+    """Recompute the forecast table if the models or data changed since it was written."""
+    if not MATERIALIZE or SERVED is None:
+        return
+    try:
+        written = materialize(FORECASTS, SERVED.path, REGISTRY_DIR)
+        if written:
+            print(f"Forecast table refreshed: {written} rows")
+    except Exception as e:
+        print(f"Forecast table not refreshed: {e}")
 
 
 class PredictRequest(BaseModel):
     steps: int = Field(default=1, ge=1, description="Number of time steps to forecast")
     features: Dict[str, Union[int, float]] = Field(
-        ..., 
-        description="Dictionary of feature names and their values"
+        default_factory=dict,
+        description="Feature values; with hospital_id and ward_code they override the feature store's"
+    )
+    hospital_id: Optional[int] = Field(default=None, description="Series hospital; with ward_code selects its own model")
+    ward_code: Optional[str] = Field(default=None, description="Series ward code, e.g. ICU")
+    start_date: Optional[date] = Field(
+        default=None,
+        description="First forecast period; must be the period after the model's last observed one, the default"
     )
 
 
-@app.post("/predict")
-def predict(request: PredictRequest):
-    """Make predictions with automatic feature reindexing"""
-    
+class PredictBatchRequest(BaseModel):
+    requests: List[PredictRequest] = Field(..., min_length=1, description="Forecast requests scored together")
+
+
+class ScenarioRequest(BaseModel):
+    steps: int = Field(default=7, ge=1, description="Number of time steps to forecast")
+    features: Dict[str, Union[int, float]] = Field(
+        default_factory=dict,
+        description="Baseline feature values shared by every scenario"
+    )
+    grid: Dict[str, List[float]] = Field(
+        ...,
+        description="Feature names mapped to the values to sweep, e.g. staffing_index"
+    )
+
+
+class RiskRequest(PredictRequest):
+    steps: int = Field(default=7, ge=1, description="Number of time steps to simulate")
+    n_paths: int = Field(default=N_PATHS, ge=100, description="Number of simulated admission paths")
+    seed: Optional[int] = Field(default=None, description="Random seed, for reproducible probabilities")
+
+
+class Observation(BaseModel):
+    date: Optional[str] = Field(default=None, description="Period observed (YYYY-MM-DD); periods already applied are skipped")
+    admissions: Optional[float] = Field(default=None, description="Observed admissions; null for a period without data")
+    features: Dict[str, Union[int, float]] = Field(
+        default_factory=dict,
+        description="Observed feature values for the period; missing ones are 0"
+    )
+
+
+class ObserveRequest(BaseModel):
+    observations: List[Observation] = Field(..., min_length=1, description="Consecutive new periods, oldest first")
+    hospital_id: Optional[int] = Field(default=None, description="Series hospital; omit with ward_code for the global model")
+    ward_code: Optional[str] = Field(default=None, description="Series ward code, e.g. ICU")
+
+
+def check_artifacts():
     if MODEL is None:
         raise HTTPException(
             status_code=503, 
-            detail="Model not loaded. Please check if sarimax_model.pkl exists in ../model/"
+            detail="Model not loaded. Please check if sarimax_model.pkl exists in model/"
         )
     
     if FEATURE_SCHEMA is None:
         raise HTTPException(
             status_code=503, 
-            detail="Schema not loaded. Please check if sarimax_schema.json exists in ../model/"
+            detail="Schema not loaded. Please check if sarimax_schema.json exists in model/"
         )
-    
+
+
+def is_global(engine):
+    return engine.version is not None
+
+
+def select_engine(request):
+    """Per-series engine when the registry has one for the request, else the global model."""
+    if request.hospital_id is not None and request.ward_code and MODEL_CACHE is not None:
+        engine = MODEL_CACHE.get(request.hospital_id, request.ward_code)
+        if engine is not None:
+            check_start(request, engine)
+            return engine
+
+    check_artifacts()
+    check_start(request, ENGINE)
+    return ENGINE
+
+
+def check_start(request, engine):
+    """The model forecasts from the end of its own observed data; a start_date elsewhere is refused."""
+    periods = engine.next_periods(request.steps)
+    if periods is not None and request.start_date is not None and request.start_date != periods[0].date():
+        raise HTTPException(
+            status_code=409,
+            detail=f"start_date {request.start_date} is not the model's next period; it forecasts from "
+                   f"{periods[0].date()} ({periods.freqstr})"
+        )
+
+
+def uses_store(request):
+    return (FEATURES is not None and request.hospital_id is not None and bool(request.ward_code)
+            and (request.hospital_id, request.ward_code) in FEATURES)
+
+
+def request_exog(request, engine):
+    """Exog from the feature store for a known series, else the sent features held over the horizon."""
+    if not uses_store(request):
+        return request.features
+    periods = engine.next_periods(request.steps)
+    if periods is not None:
+        return FEATURES.forecast_exog(request.hospital_id, request.ward_code, periods, engine.schema,
+                                      request.features)
+    return FEATURES.exog(request.hospital_id, request.ward_code, request.start_date, request.steps,
+                         engine.schema, request.features)
+
+
+def score_requests(items):
+    """Forecast (request, engine) pairs, stacking every request that shares an engine."""
+    groups = {}
+    for i, (_, engine) in enumerate(items):
+        groups.setdefault(id(engine), (engine, []))[1].append(i)
+
+    results = [None] * len(items)
+    for engine, rows in groups.values():
+        requests = [items[i][0] for i in rows]
+        with PREDICT_STAGES.time(stage="score"):
+            forecasts = engine.forecast_many([request_exog(r, engine) for r in requests], [r.steps for r in requests])
+        with PREDICT_STAGES.time(stage="round"):
+            for i, forecast in zip(rows, forecasts):
+                results[i] = to_admissions(forecast)
+    return results
+
+
+def score_in_pool(items):
+    """Score (request, engine) pairs in the worker pool; workers hold their own copy of each engine."""
+    tasks = [
+        (None if is_global(engine) else (request.hospital_id, request.ward_code), engine.version or SERVED.version,
+         state_of(engine), request_exog(request, engine), request.steps)
+        for request, engine in items
+    ]
+    with PREDICT_STAGES.time(stage="score"):
+        return POOL.score(tasks)
+
+
+def score_items(items):
+    return score_in_pool(items) if POOL is not None else score_requests(items)
+
+
+def request_key(request, engine):
+    """Identity of a forecast: identical keys in flight at the same time share one result."""
+    series = (request.hospital_id, request.ward_code) if not is_global(engine) or uses_store(request) else None
+    return series, engine.version, request.steps, request.start_date, tuple(sorted(request.features.items()))
+
+
+def prediction_response(request, predictions, engine):
+    from_store = uses_store(request)
+    periods = engine.next_periods(request.steps)
+    if periods is not None:
+        start_date = str(periods[0].date())
+    elif from_store:
+        start_date = str(FEATURES.first_day(request.hospital_id, request.ward_code, request.start_date).date())
+    else:
+        start_date = request.start_date
+    missing_features = [f for f in engine.schema
+                        if f not in request.features and not (from_store and FEATURES.provides(f))]
+    if missing_features:
+        AUTOFILLED_REQUESTS.inc()
+        for feature in missing_features:
+            AUTOFILLED_FEATURES.inc(feature=feature)
+
+    return {
+        "predictions": predictions,
+        "steps": request.steps,
+        "model": "global" if is_global(engine) else "series",
+        "model_version": engine.version,
+        "features_used": engine.schema,
+        "features_provided": list(request.features.keys()),
+        "feature_source": "store" if from_store else "request",
+        "start_date": start_date,
+        "dates": [str(period.date()) for period in periods] if periods is not None else None,
+        "freq": periods.freqstr if periods is not None else None,
+        "missing_features": missing_features,
+        "note": f"{len(missing_features)} features were auto-filled with 0"
+    }
+
+
+def shadow_score(request, engine):
+    return to_admissions(engine.forecast_many([request_exog(request, engine)], [request.steps])[0])
+
+
+def submit_shadow(request, predictions, engine):
+    """Queue a sample of global-model forecasts for the candidate version; never waits for it."""
+    if is_global(engine):
+        SHADOW.submit(request, predictions)
+
+
+BATCHER = MicroBatcher(score_items, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=BATCH_WINDOW_MS)
+SHADOW = ShadowScorer(shadow_score)
+REFRESHER = BackgroundRefresh(refresh_forecasts)
+
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await BATCHER.close()
+    if WATCHER is not None:
+        WATCHER.stop()
+    SHADOW.close()
+    REFRESHER.close()
+    if POOL is not None:
+        POOL.close()
+
+
+@app.post("/predict")
+async def predict(request: PredictRequest, http_request: Request):
+    """Make predictions with automatic feature reindexing.
+
+    Concurrent calls are micro-batched and scored together, identical
+    concurrent calls share one forecast, and calls beyond the in-flight
+    limit are refused with 503.
+    """
+    started = time.perf_counter()
+    received_at = getattr(http_request.state, "received_at", None)
+    if received_at is not None:
+        PREDICT_STAGES.observe(started - received_at, stage="parse_validate")
+
     try:
-        exog_df = pd.DataFrame([request.features] * request.steps)
-        
-        exog_df = exog_df.reindex(columns=FEATURE_SCHEMA, fill_value=0)
-        
-        forecast = MODEL.forecast(steps=request.steps, exog=exog_df)
-        
-        predictions = [max(0, round(pred)) for pred in forecast.tolist()]
-        
-        missing_features = [f for f in FEATURE_SCHEMA if f not in request.features.keys()]
-        
-        return {
-            "predictions": predictions,
-            "steps": request.steps,
-            "features_used": list(exog_df.columns),
-            "features_provided": list(request.features.keys()),
-            "missing_features": missing_features,
-            "note": f"{len(missing_features)} features were auto-filled with 0"
-        }
-    
+        with ADMISSION:
+            with PREDICT_STAGES.time(stage="select_engine"):
+                engine = await run_in_threadpool(select_engine, request)
+
+            try:
+                with PREDICT_STAGES.time(stage="batch"):
+                    predictions = await COALESCER.run(
+                        request_key(request, engine), lambda: BATCHER.submit((request, engine))
+                    )
+            except Exception as e:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Prediction error: {str(e)}"
+                )
+    except Overloaded as e:
+        REJECTED_REQUESTS.inc()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+    with PREDICT_STAGES.time(stage="respond"):
+        response = prediction_response(request, predictions, engine)
+    PREDICT_STAGES.observe(time.perf_counter() - (received_at or started), stage="total")
+    submit_shadow(request, predictions, engine)
+    return response
+
+
+@app.post("/predict/batch")
+async def predict_batch(batch: PredictBatchRequest):
+    """Score a list of prediction requests in a single pass.
+
+    Each request of the batch takes an in-flight slot; a batch that does not
+    fit under the limit is refused with 503, and one larger than the limit with 400.
+    """
+    if len(batch.requests) > ADMISSION.max_inflight:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch has {len(batch.requests)} requests; the limit is {ADMISSION.max_inflight}"
+        )
+    try:
+        with ADMISSION.admit(len(batch.requests)):
+            return await run_in_threadpool(score_batch, batch)
+    except Overloaded as e:
+        REJECTED_REQUESTS.inc()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
+def score_batch(batch):
+    engines = [select_engine(r) for r in batch.requests]
+
+    try:
+        predictions = score_items(list(zip(batch.requests, engines)))
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Prediction error: {str(e)}"
         )
 
+    results = [prediction_response(r, p, e) for r, p, e in zip(batch.requests, predictions, engines)]
+    for r, p, e in zip(batch.requests, predictions, engines):
+        submit_shadow(r, p, e)
+    return {
+        "results": results,
+        "count": len(batch.requests)
+    }
+
+
+@app.post("/scenarios")
+def scenarios(request: ScenarioRequest):
+    """Closed-form sensitivity sweep over a grid of feature values"""
+    check_artifacts()
+    engine = ENGINE
+
+    n_scenarios = 1
+    for values in request.grid.values():
+        n_scenarios *= len(values)
+    if n_scenarios > MAX_SCENARIOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Grid has {n_scenarios} scenarios; the limit is {MAX_SCENARIOS}"
+        )
+
+    try:
+        grid, forecasts, ignored = engine.sweep(request.features, request.grid, request.steps)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Large grids skip FastAPI's per-item encoder; the payload is already plain lists.
+    return JSONResponse({
+        "features": list(request.grid),
+        "scenarios": grid.tolist(),
+        "predictions": to_admissions(forecasts),
+        "baseline": to_admissions(engine.forecast_many([request.features], [request.steps])[0]),
+        "steps": request.steps,
+        "ignored_features": ignored,
+        "note": f"{len(ignored)} grid features are not used by the model and have no effect"
+    })
+
+
+def capacity_value(request, name):
+    """Capacity sent with the request, else the series' latest from the feature store."""
+    if name in request.features:
+        return request.features[name]
+    return FEATURES.value(request.hospital_id, request.ward_code, name) if uses_store(request) else None
+
+
+@app.post("/risk")
+def risk(request: RiskRequest):
+    """Per-day probabilities of admissions exceeding base_beds and effective_capacity, from simulated paths"""
+    if request.n_paths > MAX_RISK_PATHS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{request.n_paths} paths requested; the limit is {MAX_RISK_PATHS}"
+        )
+    engine = select_engine(request)
+
+    try:
+        mean = engine.forecast_many([request_exog(request, engine)], [request.steps])[0]
+        result = capacity_risk(
+            engine.model, mean,
+            base_beds=capacity_value(request, "base_beds"),
+            effective_capacity=capacity_value(request, "effective_capacity"),
+            n_paths=request.n_paths, seed=request.seed
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Risk simulation error: {str(e)}"
+        )
+
+    result["steps"] = request.steps
+    result["model"] = "global" if is_global(engine) else "series"
+    if "p_exceed_effective_capacity" in result:
+        result["risk_level"] = risk_level(result["p_exceed_effective_capacity"])
+    return result
+
+
+@app.post("/observe")
+def observe(request: ObserveRequest):
+    """Advance a model's state with newly observed periods, without refitting; 409 for a gap or an off-frequency date"""
+    if request.hospital_id is not None and request.ward_code:
+        engine = MODEL_CACHE.get(request.hospital_id, request.ward_code) if MODEL_CACHE is not None else None
+        if engine is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No model registered for hospital {request.hospital_id}, ward {request.ward_code}"
+            )
+    else:
+        check_artifacts()
+        engine = ENGINE
+
+    observations = request.observations
+    dates = [o.date for o in observations]
+    if any(d is None for d in dates):
+        dates = None
+
+    try:
+        applied = engine.observe([o.admissions for o in observations], [o.features for o in observations], dates)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Observe error: {str(e)}"
+        )
+
+    manifest = engine.model.manifest
+    if applied and not is_global(engine):
+        MODEL_CACHE.registry.record_observations(
+            request.hospital_id, request.ward_code, manifest.get("last_index"), manifest["nobs"]
+        )
+    # Pool workers reload this model on their next task for it: the tasks carry its new nobs.
+    if applied:
+        REFRESHER.schedule()
+
+    return {
+        "applied": applied,
+        "skipped": len(observations) - applied,
+        "model": "global" if is_global(engine) else "series",
+        "last_date": manifest.get("last_index"),
+        "nobs": manifest["nobs"]
+    }
+
+
+@app.get("/forecasts/{hospital_id}/{ward_code}")
+def forecasts(hospital_id: int, ward_code: str, steps: int = 7, start_date: Optional[str] = None):
+    """Precomputed forecast from the latest observed data (or a given start date), without running the model"""
+    if not 1 <= steps <= HORIZON:
+        raise HTTPException(status_code=400, detail=f"steps must be between 1 and {HORIZON}")
+    try:
+        result = FORECASTS.lookup(hospital_id, ward_code, steps, start_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid start_date: {str(e)}")
+    if result is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No precomputed forecast for hospital {hospital_id}, ward {ward_code}"
+                   + (f" from {start_date}" if start_date else "")
+        )
+    result.update(hospital_id=hospital_id, ward_code=ward_code, steps=steps)
+    return result
+
+
+@app.get("/models")
+def models():
+    """Registered per-series models and the state of the in-memory cache"""
+    registry = MODEL_CACHE.registry
+    return {
+        "global_model_loaded": MODEL is not None,
+        "global_model_version": SERVED.version if SERVED is not None else None,
+        "shadow": SHADOW.stats(),
+        "series": sorted(registry.index),
+        "cache": MODEL_CACHE.stats(),
+        "serving": {
+            "workers": POOL.workers if POOL is not None else 0,
+            "inflight": ADMISSION.inflight,
+            "max_inflight": ADMISSION.max_inflight,
+            "rejected": ADMISSION.rejected,
+            "coalesced": COALESCER.coalesced
+        }
+    }
+
+
+@app.get("/metrics")
+def metrics():
+    """Stage latencies, autofill counters and model-load timings in the Prometheus text format"""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/profile")
+def debug_profile(seconds: float = 10.0):
+    """Sample every thread for ``seconds`` and return collapsed stacks (needs MEDOPTIX_PROFILER=1)"""
+    if not profiling.ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled; set MEDOPTIX_PROFILER=1 to enable it")
+    try:
+        profiler = profiling.profile(seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(profiler.collapsed(), headers={"X-Profile-Samples": str(profiler.samples)})
+
 
 if __name__ == "__main__":
     import uvicorn
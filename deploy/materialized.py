@@ -0,0 +1,250 @@
+"""Precomputed forecasts for every hospital x ward, served without running the model.
+
+The refresh job forecasts 1..30 periods for each (hospital_id, ward_code) in
+the cleaned data. It starts at the period after the serving model's last
+observed one (its ``last_index``) and steps at the model's frequency: days for
+a series model, weeks for the weekly global model. The feature store
+(``deploy/feature_store.py``) builds the exog. Results go to a SQLite table keyed by
+(hospital_id, ward_code, start_date, horizon); each row records its date and
+the model's frequency. Earlier start dates are kept.
+
+The job records a fingerprint of its inputs: the model artifacts, the
+registry index and the cleaned data. A refresh with an unchanged fingerprint
+does nothing, so it is cheap to run on every deploy or API start.
+``BackgroundRefresh`` runs it off the request path after /observe.
+
+Usage::
+
+    python -m deploy.materialized             # refresh if the models or data changed
+    python -m deploy.materialized --force
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from database import store
+from deploy.feature_store import FeatureStore
+from deploy.forecasting import ForecastEngine, to_admissions
+from deploy.model_cache import ModelCache
+from model.compact import load_model, load_schema
+from model.registry import REGISTRY_DIR, ModelRegistry
+from model.train_series import DATA_PATH
+from model.versions import observed_dir
+
+MODEL_DIR = Path(__file__).resolve().parent.parent / "model"
+TABLE_PATH = Path(os.getenv("MEDOPTIX_FORECAST_TABLE", MODEL_DIR / "forecast_table.sqlite"))
+HORIZON = 30
+REFRESH_DELAY_S = float(os.getenv("MEDOPTIX_REFRESH_DELAY_S", "5"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecasts (
+    hospital_id INTEGER NOT NULL,
+    ward_code TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    horizon INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    forecast REAL NOT NULL,
+    admissions INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    freq TEXT NOT NULL,
+    generated_at TEXT NOT NULL,
+    PRIMARY KEY (hospital_id, ward_code, start_date, horizon)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class ForecastTable:
+    """The on-disk forecast table; one connection shared across threads behind a lock."""
+
+    def __init__(self, path=TABLE_PATH):
+        self.path = Path(path)
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(forecasts)")]
+            if columns and "freq" not in columns:
+                # A table from before rows recorded their frequency: rebuilt by the next refresh.
+                self._conn.executescript("DROP TABLE forecasts; DELETE FROM meta;")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def fingerprint(self):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        return row[0] if row else None
+
+    def latest_start(self, hospital_id, ward_code):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT MAX(start_date) FROM forecasts WHERE hospital_id = ? AND ward_code = ?",
+                (int(hospital_id), ward_code),
+            ).fetchone()
+        return row[0]
+
+    def lookup(self, hospital_id, ward_code, steps, start_date=None):
+        """Forecast for the first ``steps`` periods from ``start_date`` (default: the latest), or None."""
+        start_date = str(pd.Timestamp(start_date).date()) if start_date is not None \
+            else self.latest_start(hospital_id, ward_code)
+        if start_date is None:
+            return None
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT date, admissions, forecast, model, freq, generated_at FROM forecasts "
+                "WHERE hospital_id = ? AND ward_code = ? AND start_date = ? AND horizon <= ? ORDER BY horizon",
+                (int(hospital_id), ward_code, start_date, int(steps)),
+            ).fetchall()
+        if len(rows) < steps:
+            return None
+        return {
+            "start_date": start_date,
+            "dates": [r[0] for r in rows],
+            "predictions": [r[1] for r in rows],
+            "forecast": [r[2] for r in rows],
+            "model": rows[0][3],
+            "freq": rows[0][4],
+            "generated_at": rows[0][5],
+        }
+
+    def write(self, rows, fingerprint):
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _stat_files(paths):
+    entries = []
+    for path in paths:
+        path = Path(path).resolve()
+        files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+        for file in files:
+            if file.exists():
+                stat = file.stat()
+                entries.append(f"{file}:{stat.st_size}:{stat.st_mtime_ns}")
+    return entries
+
+
+def input_fingerprint(model_dir=MODEL_DIR, registry_dir=REGISTRY_DIR, store_dir=store.STORE_DIR):
+    """Changes whenever a model artifact, the registry or the cleaned data changes."""
+    model_dir, registry_dir = Path(model_dir), Path(registry_dir)
+    paths = [model_dir / "sarimax_compact", model_dir / "sarimax_model.pkl", model_dir / "sarimax_schema.json",
+             registry_dir, DATA_PATH, store.table_path("cleaned", store_dir)]
+    if observed_dir(model_dir) is not None:
+        paths.append(observed_dir(model_dir))
+    return hashlib.sha256("\n".join(_stat_files(paths)).encode()).hexdigest()[:16]
+
+
+def materialize(table, model_dir=MODEL_DIR, registry_dir=REGISTRY_DIR, horizon=HORIZON, force=False):
+    """Refresh ``table`` if its inputs changed; returns the number of rows written."""
+    fingerprint = input_fingerprint(model_dir, registry_dir)
+    if not force and table.fingerprint() == fingerprint:
+        return 0
+
+    model_dir = Path(model_dir)
+    global_engine = ForecastEngine(load_model(model_dir / "sarimax_model.pkl", model_dir / "sarimax_compact",
+                                              observed_dir(model_dir)),
+                                   load_schema(model_dir / "sarimax_schema.json"))
+    cache = ModelCache(ModelRegistry(registry_dir), max_bytes=0)
+    generated_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    features = FeatureStore.load()
+    rows, skipped = [], []
+    for hospital_id, ward_code in features.series():
+        engine = cache.get(hospital_id, ward_code)
+        kind = "series" if engine is not None else "global"
+        engine = engine or global_engine
+        periods = engine.next_periods(horizon)
+        if periods is None:
+            skipped.append(f"{hospital_id}/{ward_code}")
+            continue
+        exog = features.forecast_exog(hospital_id, ward_code, periods, engine.schema)
+        forecast = engine.forecast_many([exog], [horizon])[0]
+        for h, (value, admissions) in enumerate(zip(forecast, to_admissions(forecast))):
+            rows.append((hospital_id, ward_code, str(periods[0].date()), h + 1, str(periods[h].date()),
+                         float(value), admissions, kind, periods.freqstr, generated_at))
+    if skipped:
+        print(f"No forecast origin (model records no last period or frequency): {', '.join(skipped)}")
+    table.write(rows, fingerprint)
+    return len(rows)
+
+
+class BackgroundRefresh:
+    """Runs ``refresh`` in a daemon thread once ``delay`` seconds pass without another ``schedule`` call.
+
+    A burst of /observe calls therefore costs one refresh. A call that
+    arrives while a refresh is running schedules one more.
+    """
+
+    def __init__(self, refresh, delay=REFRESH_DELAY_S):
+        self.refresh = refresh
+        self.delay = delay
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def schedule(self):
+        self._wake.set()
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="forecast-refresh", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            while not self._closed:
+                self._wake.clear()
+                if not self._wake.wait(self.delay):
+                    break
+            if self._closed:
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Background refresh: {e}")
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute forecasts for every hospital and ward.")
+    parser.add_argument("--table", default=TABLE_PATH, type=Path)
+    parser.add_argument("--registry-dir", default=REGISTRY_DIR, type=Path)
+    parser.add_argument("--force", action="store_true", help="refresh even if nothing changed")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = ForecastTable(args.table)
+    written = materialize(table, registry_dir=args.registry_dir, force=args.force)
+    if written:
+        print(f"Wrote {written} forecast rows to {args.table} in {time.perf_counter() - start:.2f}s")
+    else:
+        print("Models and data unchanged; forecast table is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""In-process latency and usage metrics, rendered in the Prometheus text format.
+
+Summaries keep a fixed-size window of recent samples per label set and
+report p50/p95/p99 over it, plus a running sum and count; counters are plain
+totals. Recording is a lock, a dict lookup and an array store, so the timers
+can stay on the hot path.
+
+    with PREDICT_STAGES.time(stage="select_engine"):
+        engine = select_engine(request)
+
+``METRICS.render()`` produces the body of ``GET /metrics``.
+"""
+import threading
+import time
+
+import numpy as np
+
+WINDOW = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _labels(labels, extra=None):
+    items = sorted(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class _Timer:
+    __slots__ = ("summary", "labels", "start")
+
+    def __init__(self, summary, labels):
+        self.summary = summary
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.summary.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Summary:
+    """Quantiles over the last ``window`` samples of each label set, with all-time sum and count."""
+
+    kind = "summary"
+
+    def __init__(self, name, help, window=WINDOW):
+        self.name = name
+        self.help = help
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.items())
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [np.empty(self.window), 0, 0.0]
+            samples, count, _ = series
+            samples[count % self.window] = value
+            series[1] = count + 1
+            series[2] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def snapshot(self):
+        """{labels: (quantile values, sum, count)} for every label set seen so far."""
+        with self._lock:
+            series = {key: (s[0][:min(s[1], self.window)].copy(), s[1], s[2]) for key, s in self._series.items()}
+        return {
+            key: (np.quantile(samples, QUANTILES) if len(samples) else np.full(len(QUANTILES), np.nan), count, total)
+            for key, (samples, count, total) in series.items()
+        }
+
+    def render(self):
+        lines = []
+        for key, (quantiles, count, total) in sorted(self.snapshot().items()):
+            for q, value in zip(QUANTILES, quantiles):
+                lines.append(f"{self.name}{_labels(key, ('quantile', q))} {value:.9g}")
+            lines.append(f"{self.name}_sum{_labels(key)} {total:.9g}")
+            lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return lines
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.items())
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.items()), 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(key)} {value}" for key, value in values]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def summary(self, name, help, window=WINDOW):
+        metric = Summary(name, help, window)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help):
+        metric = Counter(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+PREDICT_STAGES = METRICS.summary(
+    "medoptix_predict_stage_seconds",
+    "Seconds spent in each stage of /predict (parse_validate, select_engine, batch, score, round, respond, total)",
+)
+INTERNAL_STAGES = METRICS.summary(
+    "medoptix_internal_prediction_stage_seconds",
+    "Seconds spent in each stage of run_internal_prediction (frame, reindex, forecast, round)",
+)
+AUTOFILLED_FEATURES = METRICS.counter(
+    "medoptix_autofilled_features_total",
+    "Schema features missing from a request and filled with 0, by feature",
+)
+AUTOFILLED_REQUESTS = METRICS.counter(
+    "medoptix_autofilled_requests_total",
+    "Requests that needed at least one feature filled with 0",
+)
+MODEL_LOAD = METRICS.summary(
+    "medoptix_model_load_seconds",
+    "Seconds to load a model artifact, by model (global or series)",
+)
+REJECTED_REQUESTS = METRICS.counter(
+    "medoptix_rejected_requests_total",
+    "Requests refused with 503 because the in-flight limit was reached",
+)
+COALESCED_REQUESTS = METRICS.counter(
+    "medoptix_coalesced_requests_total",
+    "Requests answered from an identical forecast already in flight",
+)
+MODEL_SWAPS = METRICS.counter(
+    "medoptix_model_swaps_total",
+    "Global-model versions swapped in without a restart, by role (current or candidate)",
+)
+SHADOW_SECONDS = METRICS.summary(
+    "medoptix_shadow_seconds",
+    "Seconds the candidate model took to score a shadowed request, by version",
+)
+SHADOW_ABS_DIFF = METRICS.summary(
+    "medoptix_shadow_abs_diff",
+    "Mean absolute difference in admissions per day between candidate and served forecasts, by version",
+)
+SHADOW_REQUESTS = METRICS.counter(
+    "medoptix_shadow_requests_total",
+    "Live requests sampled for shadow scoring, by version and outcome (scored, dropped, failed)",
+)
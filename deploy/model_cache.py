@@ -0,0 +1,83 @@
+import threading
+from collections import OrderedDict
+
+from deploy.forecasting import ForecastEngine
+from deploy.metrics import MODEL_LOAD
+
+
+class ModelCache:
+    """Lazily loads per-series models from a ModelRegistry into a memory-bounded LRU.
+
+    Sizes come from the registry index (bytes on disk of the artifact that
+    ``registry.load`` returns), which tracks the in-memory footprint closely
+    enough to budget by. The most recently used model is always kept, even if
+    it alone exceeds ``max_bytes``.
+    """
+
+    def __init__(self, registry, max_bytes):
+        self.registry = registry
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._engines = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._engines)
+
+    def get(self, hospital_id, ward_code):
+        """ForecastEngine for the series, or None if the registry has no model for it."""
+        key = (int(hospital_id), ward_code)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                self._engines.move_to_end(key)
+                self.hits += 1
+                return engine
+
+        entry = self.registry.entry(*key)
+        if entry is None:
+            return None
+
+        # Load outside the lock so a slow unpickle does not block cached series.
+        with MODEL_LOAD.time(model="series"):
+            model, schema = self.registry.load(*key)
+        engine = ForecastEngine(model, schema)
+
+        with self._lock:
+            self.misses += 1
+            if key not in self._engines:
+                self._engines[key] = engine
+                self._sizes[key] = entry["nbytes"]
+                self.nbytes += entry["nbytes"]
+                self._evict()
+            return self._engines[key]
+
+    def evict(self, hospital_id, ward_code):
+        """Drop one series so its next ``get`` loads it from the registry again."""
+        key = (int(hospital_id), ward_code)
+        with self._lock:
+            if self._engines.pop(key, None) is not None:
+                self.nbytes -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._engines.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return {
+            "models_loaded": len(self._engines),
+            "bytes_loaded": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and len(self._engines) > 1:
+            key, _ = self._engines.popitem(last=False)
+            self.nbytes -= self._sizes.pop(key)
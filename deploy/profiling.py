@@ -0,0 +1,80 @@
+"""Opt-in sampling profiler for capturing hot-path profiles from a running service.
+
+A background thread snapshots every other thread's Python stack at a fixed
+interval and counts identical stacks. The output is the "collapsed" format
+(``frame;frame;frame count`` per line) that flamegraph.pl and speedscope
+read. Nothing runs unless a profile is requested, and the API only exposes
+it when ``MEDOPTIX_PROFILER=1``.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+ENABLED = os.getenv("MEDOPTIX_PROFILER", "0") == "1"
+INTERVAL_MS = float(os.getenv("MEDOPTIX_PROFILER_INTERVAL_MS", "5"))
+MAX_SECONDS = 60
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms=INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError("Profiler is already running")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="medoptix-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+_LOCK = threading.Lock()
+
+
+def profile(seconds, interval_ms=INTERVAL_MS):
+    """Sample all threads for ``seconds`` (at most MAX_SECONDS) and return collapsed stacks.
+
+    Only one profile runs at a time; a concurrent call raises RuntimeError.
+    """
+    if not _LOCK.acquire(blocking=False):
+        raise RuntimeError("A profile is already being captured")
+    try:
+        profiler = SamplingProfiler(interval_ms)
+        profiler.start()
+        time.sleep(min(seconds, MAX_SECONDS))
+        profiler.stop()
+        return profiler
+    finally:
+        _LOCK.release()
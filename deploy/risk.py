@@ -0,0 +1,101 @@
+"""Monte Carlo capacity risk from simulated SARIMAX admission paths.
+
+The fitted model is linear and Gaussian. So a simulated path is the mean
+forecast plus a zero-mean deviation, drawn from the same state-space system:
+
+    x_0 ~ N(0, P_T),  x_h = T x_{h-1} + R eta_h,  y_h = mean_h + Z x_h + eps_h
+
+with ``P_T`` the covariance of the final filtered state. The deviations over
+the horizon are jointly Gaussian. Their (steps, steps) covariance comes from
+the recursion once, so all paths are drawn together as one matrix of
+standard normals times its square root: 10k paths over 30 days in a few
+milliseconds. The deviations do not depend on the exog, so any mean works:
+an engine forecast or a precomputed one.
+
+    risk = capacity_risk(engine.model, mean, base_beds=30, effective_capacity=34)
+    risk["p_exceed_effective_capacity"]     # per-day probabilities
+"""
+import os
+
+import numpy as np
+
+N_PATHS = int(os.getenv("MEDOPTIX_RISK_PATHS", "10000"))
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def state_space(model):
+    """(transition, selection, state_cov, design row, obs variance, final state cov) of a compact or pickled model."""
+    if hasattr(model, "filter_results"):
+        # statsmodels keeps a trailing time axis of length 1 on time-invariant matrices.
+        filtered = model.filter_results
+        T, R, Q, Z, H = (np.asarray(getattr(filtered, name), dtype=float)[..., 0]
+                         for name in ("transition", "selection", "state_cov", "design", "obs_cov"))
+        P = np.asarray(model.filtered_state_cov)[:, :, -1]
+    else:
+        T, R, Q, Z, H, P = (np.asarray(getattr(model, name), dtype=float) for name in
+                            ("transition", "selection", "state_cov", "design", "obs_cov", "filtered_state_cov"))
+    return T, R, Q, Z[0], float(H[0, 0]), P
+
+
+def _factor(cov):
+    """A square root of a (possibly singular) covariance matrix."""
+    values, vectors = np.linalg.eigh((cov + cov.T) / 2)
+    return vectors * np.sqrt(np.clip(values, 0.0, None))
+
+
+def deviation_covariance(model, steps):
+    """Joint (steps, steps) covariance of the next ``steps`` observations around their mean forecast."""
+    T, R, Q, Z, H, P = state_space(model)
+    RQR = R @ Q @ R.T
+    cov = np.empty((steps, steps))
+    for i in range(steps):
+        P = T @ P @ T.T + RQR
+        # Cov(y_i, y_j) = Z T^(j-i) P_i Z' for j >= i: later states carry x_i forward plus independent shocks.
+        v = P @ Z
+        for j in range(i, steps):
+            cov[i, j] = cov[j, i] = Z @ v
+            v = T @ v
+    cov[np.diag_indices(steps)] += H
+    return cov
+
+
+def simulate_deviations(model, steps, n_paths=N_PATHS, seed=None):
+    """(n_paths, steps) simulated deviations of the observations from the mean forecast."""
+    factor = _factor(deviation_covariance(model, steps))
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n_paths, steps)) @ factor.T
+
+
+def simulate_paths(model, mean, n_paths=N_PATHS, seed=None):
+    """(n_paths, steps) simulated admissions around ``mean``, floored at zero."""
+    mean = np.asarray(mean, dtype=float)
+    paths = simulate_deviations(model, len(mean), n_paths, seed)
+    paths += mean
+    return np.maximum(paths, 0.0, out=paths)
+
+
+def capacity_risk(model, mean, base_beds=None, effective_capacity=None, n_paths=N_PATHS,
+                  quantiles=QUANTILES, seed=None):
+    """Per-day exceedance probabilities and quantile bands from ``n_paths`` simulated paths."""
+    paths = simulate_paths(model, mean, n_paths, seed)
+    risk = {
+        "n_paths": n_paths,
+        "mean": paths.mean(axis=0).tolist(),
+        "quantiles": {f"p{round(q * 100)}": band.tolist() for q, band in zip(quantiles, np.quantile(paths, quantiles, axis=0))},
+    }
+    for name, capacity in (("base_beds", base_beds), ("effective_capacity", effective_capacity)):
+        if capacity is not None:
+            exceed = (paths > capacity).mean(axis=0)
+            risk[f"p_exceed_{name}"] = exceed.tolist()
+            risk[f"p_exceed_{name}_any_day"] = float((paths > capacity).any(axis=1).mean())
+    return risk
+
+
+def risk_level(p_exceed):
+    """Low / Moderate / High from the worst day's probability of exceeding capacity."""
+    worst = max(p_exceed) if len(p_exceed) else 0.0
+    if worst < 0.05:
+        return "low"
+    if worst < 0.25:
+        return "moderate"
+    return "high"
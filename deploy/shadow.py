@@ -0,0 +1,90 @@
+"""Shadow scoring: a candidate model version re-scores a sample of live forecasts, off the request path.
+
+The API calls ``ShadowScorer.submit`` once the served forecast is ready.
+``submit`` only samples and enqueues. When the queue is full the sample is
+dropped, so the served response never waits for the candidate. A daemon
+thread scores each sample with the candidate engine and records two things
+per candidate version in /metrics: the candidate's scoring time, and the
+mean absolute difference from the served admissions.
+"""
+import os
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+
+from deploy.metrics import SHADOW_ABS_DIFF, SHADOW_REQUESTS, SHADOW_SECONDS
+
+SHADOW_SAMPLE = float(os.getenv("MEDOPTIX_SHADOW_SAMPLE", "0"))
+SHADOW_QUEUE = int(os.getenv("MEDOPTIX_SHADOW_QUEUE", "256"))
+
+
+class ShadowScorer:
+    """Scores a ``sample`` fraction of submitted requests with ``candidate`` in a background thread.
+
+    ``score(request, engine)`` returns an engine's admissions for a request.
+    Nothing is sampled while ``candidate`` is None or ``sample`` is 0.
+    """
+
+    def __init__(self, score, sample=SHADOW_SAMPLE, max_queue=SHADOW_QUEUE):
+        self.score = score
+        self.sample = sample
+        self.candidate = None
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def set_candidate(self, engine):
+        self.candidate = engine
+
+    def submit(self, request, served):
+        """Queue ``request`` (answered with ``served`` admissions) for the candidate if it is sampled."""
+        candidate = self.candidate
+        if candidate is None or self.sample <= 0 or random.random() >= self.sample:
+            return False
+        try:
+            self._queue.put_nowait((candidate, request, served))
+        except queue.Full:
+            SHADOW_REQUESTS.inc(version=candidate.version, outcome="dropped")
+            return False
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+                    self._thread.start()
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            candidate, request, served = item
+            try:
+                start = time.perf_counter()
+                predictions = self.score(request, candidate)
+                SHADOW_SECONDS.observe(time.perf_counter() - start, version=candidate.version)
+            except Exception:
+                SHADOW_REQUESTS.inc(version=candidate.version, outcome="failed")
+                continue
+            SHADOW_ABS_DIFF.observe(float(np.mean(np.abs(np.subtract(predictions, served)))),
+                                    version=candidate.version)
+            SHADOW_REQUESTS.inc(version=candidate.version, outcome="scored")
+
+    def stats(self):
+        version = self.candidate.version if self.candidate is not None else None
+        return {
+            "candidate": version,
+            "sample": self.sample,
+            "queued": self._queue.qsize(),
+            **{outcome: SHADOW_REQUESTS.value(version=version, outcome=outcome)
+               for outcome in ("scored", "dropped", "failed")},
+        }
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
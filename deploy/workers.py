@@ -0,0 +1,141 @@
+"""Process pool that scores forecast batches on every core.
+
+Each worker process loads the global model and opens the model registry once,
+when it starts. Compact artifacts are memory-mapped read-only, so their
+parameter and state arrays sit once in the OS page cache however many
+workers map them; only a pickled model is copied into each worker.
+
+The API enables the pool with ``MEDOPTIX_SERVE_WORKERS=N``. Batches from the
+micro-batcher are then scored in the workers, up to N at a time, and the
+event loop only parses requests and encodes responses.
+
+Global-model tasks name the version the API picked for them. A worker loads
+the version it is asked for if it does not hold it yet, so a request that
+picked a version just before a swap is scored by that version. Tasks also
+carry the observation count (``nobs``) of the engine the API scored against.
+A worker whose copy is behind, because /observe advanced the model, reloads
+just that model from disk; the pool is not restarted.
+"""
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from deploy.forecasting import to_admissions
+from deploy.hot_reload import BASE_VERSION, load_served
+from deploy.model_cache import ModelCache
+from model.registry import ModelRegistry
+from model.versions import ModelVersions
+
+WORKERS = int(os.getenv("MEDOPTIX_SERVE_WORKERS", "0"))
+# Global-model versions a worker keeps loaded: the served one and the one before it.
+GLOBAL_VERSIONS = 2
+
+# Set once per worker process by _init_worker.
+_BASE_DIR = None
+_VERSIONS = None
+_GLOBALS = OrderedDict()
+_CACHE = None
+
+
+def _init_worker(base_dir, versions_dir, version, registry_dir, cache_bytes):
+    global _BASE_DIR, _VERSIONS, _CACHE
+    _BASE_DIR, _VERSIONS = Path(base_dir), ModelVersions(versions_dir)
+    try:
+        _global(version)
+    except (OSError, ValueError) as e:
+        print(f"Worker {os.getpid()}: global model {version} not loaded: {e}")
+    _CACHE = ModelCache(ModelRegistry(registry_dir), max_bytes=cache_bytes)
+
+
+def state_of(engine):
+    """How far ``engine``'s model has been observed: its nobs for a compact model, else None."""
+    manifest = getattr(engine.model, "manifest", None)
+    return manifest.get("nobs") if manifest is not None else None
+
+
+def _stale(engine, state):
+    return state is not None and state_of(engine) != state
+
+
+def _global(version, state=None):
+    """The global engine for ``version``, loaded on first use and again when its state is behind ``state``."""
+    engine = _GLOBALS.get(version)
+    if engine is None or _stale(engine, state):
+        path = _BASE_DIR if version == BASE_VERSION else _VERSIONS.path(version)
+        engine = _GLOBALS[version] = load_served(version, path).engine
+        while len(_GLOBALS) > GLOBAL_VERSIONS:
+            _GLOBALS.popitem(last=False)
+    return engine
+
+
+def _series(key, state):
+    engine = _CACHE.get(*key)
+    if engine is not None and _stale(engine, state):
+        _CACHE.evict(*key)
+        engine = _CACHE.get(*key)
+    return engine
+
+
+def _score(tasks):
+    """Score (series key or None, global version, state, features, steps) tasks; returns admissions per task, in order.
+
+    A task without a series key, or whose series has no model, is scored by
+    the global model ``version``. ``state`` is the ``state_of`` the engine
+    the API picked, the series' or else the global one.
+    """
+    groups = {}
+    for i, (key, version, state, _, _) in enumerate(tasks):
+        groups.setdefault((key, version, state), []).append(i)
+
+    results = [None] * len(tasks)
+    for (key, version, state), rows in groups.items():
+        engine = _series(key, state) if key is not None else None
+        engine = engine or _global(version, None if key is not None else state)
+        forecasts = engine.forecast_many([tasks[i][3] for i in rows], [tasks[i][4] for i in rows])
+        for i, forecast in zip(rows, forecasts):
+            results[i] = to_admissions(forecast)
+    return results
+
+
+def _ready(_):
+    return os.getpid()
+
+
+class ForecastPool:
+    """Worker processes that preload global-model ``version`` from ``versions_dir`` (``base_dir`` before versioning)."""
+
+    def __init__(self, workers, version, base_dir, versions_dir, registry_dir, cache_bytes):
+        self.workers = workers
+        self._initargs = (str(Path(base_dir).resolve()), str(Path(versions_dir).resolve()), version,
+                          str(Path(registry_dir).resolve()), cache_bytes)
+        self._executor = self._start()
+
+    def _start(self):
+        # spawn, not fork: the parent runs an event loop and thread pools that must not be copied.
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker, initargs=self._initargs,
+        )
+        # Submitting one task per worker spawns them all now (each loads its models on start-up),
+        # so the first requests do not pay for imports and model loads.
+        list(executor.map(_ready, range(self.workers)))
+        print(f"Forecast pool started with {self.workers} worker processes")
+        return executor
+
+    def score(self, tasks):
+        return self._executor.submit(_score, tasks).result()
+
+    def reload(self, version=None):
+        """Replace the workers so they pick up model state changed on disk, or preload global-model ``version``.
+
+        The new workers load their models before the pool switches to them; batches queued on the old ones still finish.
+        """
+        if version is not None:
+            self._initargs = self._initargs[:2] + (version,) + self._initargs[3:]
+        old, self._executor = self._executor, self._start()
+        old.shutdown(wait=False)
+
+    def close(self):
+        self._executor.shutdown()
@@ -1,10 +1,23 @@
 import streamlit as st
-import requests
+import httpx
 import pandas as pd
-from datetime import date
 import plotly.express as px
 
-API_URL = "http://localhost:8000/predict"
+from deploy.client import API_URL, ForecastClient
+
+HOSPITAL_IDS = {
+    "Helsinki Central Hospital": 1,
+    "Tampere City Hospital": 2,
+    "Turku University Hospital": 3,
+    "Oulu Regional Hospital": 4,
+    "Kuopio Medical Center": 5,
+}
+
+
+@st.cache_resource
+def load_client():
+    """One pooled client per server process, so reruns reuse its connections and cached forecasts."""
+    return ForecastClient(API_URL)
 
 st.set_page_config(
     page_title="MedOptix Forecast",
@@ -28,7 +41,6 @@ st.sidebar.title("⚙ Settings")
 st.sidebar.markdown("Configure forecasting options.")
 
 steps = st.sidebar.slider("Forecast horizon (days)", 1, 30, 7)
-start_date = st.sidebar.date_input("Forecast start date", value=date.today())
 
 st.sidebar.markdown("---")
 st.sidebar.caption("MedOptix Analytics © 2025")
@@ -40,16 +52,7 @@ st.markdown("### 🔧 Input Data")
 with st.form("prediction_form", border=True):
     col1, col2 = st.columns(2)
     with col1:
-        hospital = st.selectbox(
-            "Hospital",
-            [
-                "Helsinki Central Hospital",
-                "Tampere City Hospital",
-                "Turku University Hospital",
-                "Oulu Regional Hospital",
-                "Kuopio Medical Center",
-            ],
-        )
+        hospital = st.selectbox("Hospital", list(HOSPITAL_IDS))
     with col2:
         ward_code = st.selectbox("Ward", ["ED", "ICU", "MED", "SURG"])
 
@@ -93,10 +96,8 @@ with st.form("prediction_form", border=True):
 
 if submitted:
 
-    payload = {
-        "hospital": hospital,
-        "ward": ward_code,
-
+    # The API looks up the series' own features; the form values override them.
+    features = {
         "occupancy_rate_lag1": occupancy_rate,
         "overflow_lag1": overflow_lag,
         "avg_wait_minutes_lag1": avg_wait_lag,
@@ -104,80 +105,78 @@ if submitted:
         "base_beds": base_beds,
         "effective_capacity": effective_capacity,
         "staffing_index": staffing_index,
-
-        "steps": int(steps),
-        "start_date": start_date.isoformat(),
     }
 
     with st.spinner("Generating forecast…"):
         try:
-            response = requests.post(API_URL, json=payload)
-
-            if response.status_code == 200:
-                result = response.json()
-                forecast_values = result.get("forecast", [])
-
-                st.success("Forecast generated successfully! ✅")
-                st.markdown(f"## 📊 Forecast for **{hospital} — {ward_code}**")
-
-                if forecast_values:
-
-                    dates = pd.date_range(start=start_date, periods=len(forecast_values))
-
-                    df = pd.DataFrame({
-                        "Date": dates,
-                        "Admissions forecast": forecast_values,
-                    })
-
-                    if len(forecast_values) == 1:
-                        st.markdown("## 🧮 Predicted Admissions for Selected Day")
-                        st.markdown(
-                            f"""
-                            <div style="
-                                background-color:#f0f2f6;
-                                padding:30px;
-                                border-radius:10px;
-                                text-align:center;
-                                margin-bottom:20px;
-                            ">
-                                <h1 style="font-size:64px; margin:0;">{forecast_values[0]}</h1>
-                                <p style="font-size:20px; margin-top:10px;">
-                                    Admissions forecast for <b>{dates[0].strftime("%Y-%m-%d")}</b>
-                                </p>
-                            </div>
-                            """,
-                            unsafe_allow_html=True
-                        )
-                    else:
-                        st.markdown("### 📈 Multi-day Forecast Overview")
-
-                        fig = px.line(
-                            df,
-                            x="Date",
-                            y="Admissions forecast",
-                            markers=True,
-                            title="Admissions Forecast Over Time",
-                        )
-
-                        fig.update_layout(
-                            xaxis_title="Date",
-                            yaxis_title="Forecasted Admissions",
-                            template="plotly_white",
-                            paper_bgcolor="white",
-                            plot_bgcolor="white",
-                            height=450,
-                            hovermode="x unified"
-                        )
-
-                        st.plotly_chart(fig, use_container_width=True)
-
-                    st.dataframe(df, use_container_width=True)
-
+            result = load_client().predict(
+                HOSPITAL_IDS[hospital], ward_code, steps=int(steps), features=features
+            )
+            forecast_values = result.get("predictions", [])
+
+            st.success("Forecast generated successfully! ✅")
+            st.markdown(f"## 📊 Forecast for **{hospital} — {ward_code}**")
+
+            if forecast_values:
+
+                # The model forecasts from the period after its last observed one, at its own frequency.
+                dates = pd.to_datetime(result["dates"]) if result.get("dates") \
+                    else pd.date_range(start=result["start_date"], periods=len(forecast_values))
+
+                df = pd.DataFrame({
+                    "Date": dates,
+                    "Admissions forecast": forecast_values,
+                })
+
+                if len(forecast_values) == 1:
+                    st.markdown("## 🧮 Predicted Admissions for Selected Day")
+                    st.markdown(
+                        f"""
+                        <div style="
+                            background-color:#f0f2f6;
+                            padding:30px;
+                            border-radius:10px;
+                            text-align:center;
+                            margin-bottom:20px;
+                        ">
+                            <h1 style="font-size:64px; margin:0;">{forecast_values[0]}</h1>
+                            <p style="font-size:20px; margin-top:10px;">
+                                Admissions forecast for <b>{dates[0].strftime("%Y-%m-%d")}</b>
+                            </p>
+                        </div>
+                        """,
+                        unsafe_allow_html=True
+                    )
                 else:
-                    st.warning("No forecast data returned from the API.")
+                    st.markdown("### 📈 Multi-day Forecast Overview")
+
+                    fig = px.line(
+                        df,
+                        x="Date",
+                        y="Admissions forecast",
+                        markers=True,
+                        title="Admissions Forecast Over Time",
+                    )
+
+                    fig.update_layout(
+                        xaxis_title="Date",
+                        yaxis_title="Forecasted Admissions",
+                        template="plotly_white",
+                        paper_bgcolor="white",
+                        plot_bgcolor="white",
+                        height=450,
+                        hovermode="x unified"
+                    )
+
+                    st.plotly_chart(fig, use_container_width=True)
+
+                st.dataframe(df, use_container_width=True)
 
             else:
-                st.error(f"API error {response.status_code}: {response.text}")
+                st.warning("No forecast data returned from the API.")
+
+        except httpx.HTTPStatusError as e:
+            st.error(f"API error {e.response.status_code}: {e.response.text}")
 
         except Exception as e:
             st.error(f"Request failed: {e}")
\ No newline at end of file
@@ -0,0 +1,268 @@
+"""Warm-start rolling-origin backtests of the per-series SARIMAX models.
+
+Each (hospital_id, ward_code) series is fitted once on the data before its
+first forecast origin. From there the fitted state is walked forward: at
+every origin the model forecasts 1..``horizon`` days ahead, then the state is
+``extend``-ed with the next ``step`` observations at the same parameters, so
+an origin costs a few filter steps instead of a refit. Origins are split
+into contiguous blocks that run in worker processes; a block starts by
+filtering (not fitting) the history up to its first origin.
+
+Forecasts hold the features of the origin's last observed day over the
+horizon, as the API's feature store does past its newest row. The realised
+features of the forecast days would leak the targets through their
+``*_lag1``/``*_lag7`` columns; ``--exog realised`` scores with them anyway,
+as the notebook's test split does, for comparison. Results are written to ``model/backtest_results/``:
+
+    errors.csv       # one row per (series, origin, horizon)
+    by_origin.csv    # MAE/RMSE per series and origin over all horizons
+    by_horizon.csv   # MAE/RMSE/R² per horizon, pooled over series and origins
+    summary.json     # overall metrics and the run settings
+
+Usage::
+
+    python -m model.backtest                       # all series, daily origins over the last 20%
+    python -m model.backtest --step 7 --workers 4
+    python -m model.backtest --exog realised       # with the forecast days' realised features
+    python -m model.backtest compare               # warm start vs refitting at each origin, one series
+"""
+import argparse
+import json
+import math
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from model.compact import load_schema
+from model.train_series import SCHEMA_PATH, load_cleaned_data, series_features, series_frames
+
+RESULTS_DIR = Path(__file__).resolve().parent / "backtest_results"
+ORDER = (1, 1, 1)
+SEASONAL_ORDER = (2, 0, 2, 7)
+HORIZON = 30
+# "held": the origin's last known feature row over the horizon; "realised": the forecast days' own rows.
+EXOG_MODES = ("held", "realised")
+WORKERS = int(os.getenv("MEDOPTIX_BACKTEST_WORKERS", "0")) or None
+
+
+def _model(endog, exog, order, seasonal_order):
+    return SARIMAX(endog, exog=exog, order=order, seasonal_order=seasonal_order)
+
+
+def fit_params(endog, exog, order, seasonal_order):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return np.asarray(_model(endog, exog, order, seasonal_order).fit(disp=False).params)
+
+
+def walk_forward(endog, exog, order, seasonal_order, params, origins, horizon=HORIZON, exog_mode="held"):
+    """Forecast from each origin (ascending positions into ``endog``) with fixed ``params``.
+
+    Returns (origin, horizon, actual, forecast) rows for targets that exist
+    and were observed.
+    """
+    rows = []
+    n = len(endog)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        results = _model(endog[:origins[0]], exog[:origins[0]], order, seasonal_order).filter(params)
+        position = origins[0]
+        for origin in origins:
+            if origin > position:
+                results = results.extend(endog[position:origin], exog=exog[position:origin])
+                position = origin
+            steps = min(horizon, n - origin)
+            if steps <= 0:
+                break
+            if exog_mode == "held":
+                future = np.repeat(exog[origin - 1:origin], steps, axis=0)
+            else:
+                future = exog[origin:origin + steps]
+            forecast = results.forecast(steps=steps, exog=future)
+            for h in range(steps):
+                actual = endog[origin + h]
+                if not math.isnan(actual):
+                    rows.append((origin, h + 1, actual, float(forecast[h])))
+    return rows
+
+
+def _run_block(key, endog, exog, order, seasonal_order, params, origins, horizon, exog_mode):
+    return key, walk_forward(endog, exog, order, seasonal_order, params, origins, horizon, exog_mode)
+
+
+def _fit_series(key, endog, exog, order, seasonal_order, first_origin):
+    return key, fit_params(endog[:first_origin], exog[:first_origin], order, seasonal_order)
+
+
+def _blocks(origins, n_blocks):
+    size = max(1, math.ceil(len(origins) / n_blocks))
+    return [origins[i:i + size] for i in range(0, len(origins), size)]
+
+
+def backtest(series, order=ORDER, seasonal_order=SEASONAL_ORDER, horizon=HORIZON, test_fraction=0.2,
+             step=1, workers=WORKERS, min_obs=60, exog_mode="held"):
+    """Rolling-origin errors for ``series``: an iterable of (hospital_id, ward_code, endog, exog).
+
+    Origins run every ``step`` days over the last ``test_fraction`` of each
+    series. ``exog_mode`` is one of ``EXOG_MODES``. Returns one row per
+    (series, origin, horizon).
+    """
+    if exog_mode not in EXOG_MODES:
+        raise ValueError(f"Unknown exog mode {exog_mode!r}; use one of {', '.join(EXOG_MODES)}")
+    frames = {}
+    for hospital_id, ward_code, endog, exog in series:
+        first_origin = int(len(endog) * (1 - test_fraction))
+        if int(endog.iloc[:first_origin].notna().sum()) < min_obs:
+            print(f"Skipping {hospital_id}/{ward_code}: too little history before the first origin")
+            continue
+        frames[(hospital_id, ward_code)] = (endog, exog, first_origin)
+
+    workers = workers or os.cpu_count() or 1
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        fits = [
+            pool.submit(_fit_series, key, endog.to_numpy(float), exog.to_numpy(float), order, seasonal_order,
+                        first_origin)
+            for key, (endog, exog, first_origin) in frames.items()
+        ]
+        blocks = []
+        for future in fits:
+            key, params = future.result()
+            endog, exog, first_origin = frames[key]
+            origins = list(range(first_origin, len(endog), step))
+            for block in _blocks(origins, workers):
+                blocks.append(pool.submit(_run_block, key, endog.to_numpy(float), exog.to_numpy(float), order,
+                                          seasonal_order, params, block, horizon, exog_mode))
+
+        for future in blocks:
+            (hospital_id, ward_code), rows = future.result()
+            dates = frames[(hospital_id, ward_code)][0].index
+            frame = pd.DataFrame(rows, columns=["origin", "horizon", "actual", "forecast"])
+            frame["origin"] = dates[frame["origin"].to_numpy()]
+            frame.insert(0, "ward_code", ward_code)
+            frame.insert(0, "hospital_id", hospital_id)
+            errors.append(frame)
+
+    errors = pd.concat(errors, ignore_index=True) if errors else pd.DataFrame(
+        columns=["hospital_id", "ward_code", "origin", "horizon", "actual", "forecast"])
+    errors["error"] = errors["forecast"] - errors["actual"]
+    return errors.sort_values(["hospital_id", "ward_code", "origin", "horizon"]).reset_index(drop=True)
+
+
+def _metrics(group):
+    error = group["error"]
+    actual = group["actual"]
+    sst = float(((actual - actual.mean()) ** 2).sum())
+    return pd.Series({
+        "mae": float(error.abs().mean()),
+        "rmse": float(np.sqrt((error ** 2).mean())),
+        "r2": 1 - float((error ** 2).sum()) / sst if sst > 0 else np.nan,
+        "n": int(len(group)),
+    })
+
+
+def error_tables(errors):
+    """(by_origin, by_horizon) summaries of ``errors``."""
+    by_origin = errors.groupby(["hospital_id", "ward_code", "origin"])[["error", "actual"]].apply(_metrics)
+    by_horizon = errors.groupby("horizon")[["error", "actual"]].apply(_metrics)
+    for table in (by_origin, by_horizon):
+        table["n"] = table["n"].astype(int)
+    return by_origin.drop(columns="r2").reset_index(), by_horizon.reset_index()
+
+
+def write_results(errors, settings, out_dir=RESULTS_DIR):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    by_origin, by_horizon = error_tables(errors)
+    errors.to_csv(out_dir / "errors.csv", index=False)
+    by_origin.to_csv(out_dir / "by_origin.csv", index=False)
+    by_horizon.to_csv(out_dir / "by_horizon.csv", index=False)
+
+    summary = dict(
+        _metrics(errors).to_dict(),
+        series=int(errors.groupby(["hospital_id", "ward_code"]).ngroups),
+        origins=int(len(by_origin)),
+        created_at=datetime.now(timezone.utc).isoformat(),
+        **settings,
+    )
+    summary["n"] = int(summary["n"])
+    tmp_path = out_dir / "summary.json.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_path, out_dir / "summary.json")
+    return summary
+
+
+def load_results(out_dir=RESULTS_DIR):
+    """(summary, by_horizon) from the last run, or (None, None) if there is none."""
+    out_dir = Path(out_dir)
+    if not (out_dir / "summary.json").exists():
+        return None, None
+    with open(out_dir / "summary.json", "r") as f:
+        summary = json.load(f)
+    return summary, pd.read_csv(out_dir / "by_horizon.csv")
+
+
+def load_series():
+    data = load_cleaned_data().sort_values("date")
+    features = series_features(load_schema(SCHEMA_PATH))
+    return list(series_frames(data, features))
+
+
+def compare(order=ORDER, seasonal_order=SEASONAL_ORDER, n_origins=10, horizon=HORIZON):
+    """Seconds for ``n_origins`` origins on one series: refit at each origin vs warm-started extend."""
+    hospital_id, ward_code, endog, exog = max(load_series(), key=lambda s: int(s[2].notna().sum()))
+    endog, exog = endog.to_numpy(float), exog.to_numpy(float)
+    first_origin = int(len(endog) * 0.8)
+    origins = list(range(first_origin, first_origin + n_origins))
+
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for origin in origins:
+            refit = _model(endog[:origin], exog[:origin], order, seasonal_order).fit(disp=False)
+            refit.forecast(steps=horizon, exog=exog[origin:origin + horizon])
+    refit_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    params = fit_params(endog[:first_origin], exog[:first_origin], order, seasonal_order)
+    walk_forward(endog, exog, order, seasonal_order, params, origins, horizon)
+    warm_s = time.perf_counter() - start
+    return {"series": f"{hospital_id}/{ward_code}", "origins": n_origins, "refit_s": refit_s, "warm_start_s": warm_s}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the per-series SARIMAX models.")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "compare"])
+    parser.add_argument("--horizon", default=HORIZON, type=int)
+    parser.add_argument("--step", default=1, type=int, help="days between forecast origins")
+    parser.add_argument("--test-fraction", default=0.2, type=float)
+    parser.add_argument("--workers", default=WORKERS, type=int)
+    parser.add_argument("--exog", default="held", choices=EXOG_MODES,
+                        help="features over the horizon: the origin's last known row, or the realised rows")
+    parser.add_argument("--out-dir", default=RESULTS_DIR, type=Path)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        print(json.dumps(compare(horizon=args.horizon), indent=2))
+        return
+
+    start = time.perf_counter()
+    errors = backtest(load_series(), horizon=args.horizon, test_fraction=args.test_fraction, step=args.step,
+                      workers=args.workers, exog_mode=args.exog)
+    settings = {"order": list(ORDER), "seasonal_order": list(SEASONAL_ORDER), "horizon": args.horizon, "step": args.step,
+                "test_fraction": args.test_fraction, "exog": args.exog}
+    summary = write_results(errors, settings, args.out_dir)
+    print(f"{summary['series']} series, {summary['origins']} origins in {time.perf_counter() - start:.1f}s: "
+          f"MAE {summary['mae']:.3f}, RMSE {summary['rmse']:.3f}, R² {summary['r2']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
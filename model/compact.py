@@ -0,0 +1,285 @@
+"""Compact, data-free SARIMAX artifacts.
+
+A fitted ``SARIMAXResults`` pickle carries the training endog/exog and the
+full filtered/smoothed state history. Forecasting only needs the fitted
+parameters, the state-space system matrices they imply and the final filtered
+state, so ``export_compact`` writes just those as ``.npy`` files (plus a JSON
+manifest) that ``CompactSARIMAX.load`` memory-maps back.
+
+Usage::
+
+    python -m model.compact export              # model/sarimax_model.pkl -> model/sarimax_compact/
+    python -m model.compact compare             # cold-start time and peak RSS, pickle vs compact
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+MODEL_DIR = Path(__file__).resolve().parent
+PICKLE_PATH = MODEL_DIR / "sarimax_model.pkl"
+SCHEMA_PATH = MODEL_DIR / "sarimax_schema.json"
+COMPACT_DIR = MODEL_DIR / "sarimax_compact"
+
+SYSTEM_MATRICES = ("design", "obs_cov", "transition", "state_intercept", "selection", "state_cov")
+STATE_ARRAYS = ("filtered_state", "filtered_state_cov")
+ARRAYS = ("params",) + SYSTEM_MATRICES + STATE_ARRAYS
+
+
+def export_compact(results, schema, out_dir=COMPACT_DIR):
+    """Write the forecasting essentials of a fitted SARIMAX to ``out_dir``."""
+    spec = results.model
+    if getattr(spec, "k_trend", 0) or not getattr(spec, "mle_regression", True) or spec.time_varying_regression:
+        raise ValueError("Compact export supports SARIMAX without trend and with a fixed exog regression term")
+
+    filtered = results.filter_results
+    arrays = {"params": np.asarray(results.params, dtype=float)}
+    for name in SYSTEM_MATRICES:
+        matrix = np.asarray(getattr(filtered, name), dtype=float)
+        if matrix.shape[-1] != 1:
+            raise ValueError(f"Compact export needs a time-invariant {name} matrix")
+        arrays[name] = np.ascontiguousarray(matrix[..., 0])
+    arrays["filtered_state"] = np.asarray(results.filtered_state[:, -1], dtype=float)
+    arrays["filtered_state_cov"] = np.ascontiguousarray(results.filtered_state_cov[:, :, -1], dtype=float)
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(out_dir / f"{name}.npy", array)
+
+    exog_names = list(spec.exog_names or [])
+    manifest = {
+        "format": "medoptix-compact-sarimax",
+        "version": 1,
+        "order": list(spec.order),
+        "seasonal_order": list(spec.seasonal_order),
+        "param_names": list(spec.param_names),
+        "exog_names": exog_names,
+        "schema": list(schema),
+        "nobs": int(results.nobs),
+        "last_index": str(spec._index[-1]) if getattr(spec, "_index", None) is not None else None,
+        # Period of one observation (e.g. W-SUN, D); /observe checks new dates against it.
+        "freq": getattr(getattr(spec, "_index", None), "freqstr", None),
+    }
+    with open(out_dir / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class CompactSARIMAX:
+    """Forecast-only SARIMAX backed by (optionally memory-mapped) NumPy arrays.
+
+    ``forecast`` follows the statsmodels convention: the returned mean is
+    ``design @ a_t + exog_t @ beta`` with ``a_t`` propagated from the final
+    filtered state.
+    """
+
+    def __init__(self, manifest, arrays, path=None):
+        self.manifest = manifest
+        self.path = Path(path) if path is not None else None
+        self.param_names = manifest["param_names"]
+        self.exog_names = manifest["exog_names"]
+        self.schema = manifest["schema"]
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+
+        positions = {name: i for i, name in enumerate(self.param_names)}
+        self._exog_positions = [positions[name] for name in self.exog_names]
+        self.beta = np.asarray(self.params[self._exog_positions])
+
+    @classmethod
+    def load(cls, path=COMPACT_DIR, mmap_mode="r", state_dir=None):
+        """Load an artifact. With ``state_dir``, state saved there replaces the exported state, and saves go there."""
+        path = Path(path)
+        state_path = path
+        if state_dir is not None and (Path(state_dir) / "manifest.json").exists():
+            state_path = Path(state_dir)
+        with open(state_path / "manifest.json", "r") as f:
+            manifest = json.load(f)
+        arrays = {name: np.load((state_path if name in STATE_ARRAYS else path) / f"{name}.npy", mmap_mode=mmap_mode)
+                  for name in ARRAYS}
+        return cls(manifest, arrays, state_dir if state_dir is not None else path)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    def exog_coefficients(self, schema):
+        """Regression coefficients ordered like ``schema``; unknown names get 0."""
+        lookup = dict(zip(self.exog_names, self.beta))
+        return np.array([lookup.get(name, 0.0) for name in schema])
+
+    def exog_matrix(self, exog, steps):
+        """Coerce exog (array or DataFrame) to a (steps, k_exog) float array in training column order."""
+        if not self.exog_names:
+            return np.zeros((steps, 0))
+        if hasattr(exog, "columns"):
+            exog = exog.reindex(columns=self.exog_names, fill_value=0).to_numpy()
+        exog = np.asarray(exog, dtype=float).reshape(steps, len(self.exog_names))
+        return exog
+
+    def propagate(self, steps):
+        """Predicted states a_{T+1..T+steps} and their covariances, ignoring exog."""
+        T, c = self.transition, self.state_intercept
+        RQR = self.selection @ self.state_cov @ self.selection.T
+        state, cov = np.asarray(self.filtered_state), np.asarray(self.filtered_state_cov)
+        states = np.empty((steps, len(state)))
+        covs = np.empty((steps,) + cov.shape)
+        for h in range(steps):
+            state = T @ state + c
+            cov = T @ cov @ T.T + RQR
+            states[h], covs[h] = state, cov
+        return states, covs
+
+    def forecast(self, steps=1, exog=None):
+        """Mean forecast for the next ``steps`` periods."""
+        states, _ = self.propagate(steps)
+        mean = states @ self.design[0]
+        if self.exog_names:
+            mean = mean + self.exog_matrix(exog, steps) @ self.beta
+        return mean
+
+    def observe(self, endog, exog=None):
+        """Run the Kalman filter over newly observed periods, updating the final state in place.
+
+        Uses the fitted parameters, so the cost is O(new observations). NaN
+        entries in ``endog`` are periods without data: the state is only
+        predicted through them. Call ``save_state`` to persist the result.
+        """
+        endog = np.asarray(endog, dtype=float).reshape(-1)
+        offsets = self.exog_matrix(exog, len(endog)) @ self.beta
+        T, c, Z, H = self.transition, self.state_intercept, self.design[0], self.obs_cov[0, 0]
+        RQR = self.selection @ self.state_cov @ self.selection.T
+        state, cov = np.array(self.filtered_state), np.array(self.filtered_state_cov)
+        for y, offset in zip(endog, offsets):
+            state = T @ state + c
+            cov = T @ cov @ T.T + RQR
+            if not np.isnan(y):
+                PZ = cov @ Z
+                gain = PZ / (Z @ PZ + H)
+                state = state + gain * (y - Z @ state - offset)
+                cov = cov - np.outer(gain, PZ)
+                cov = (cov + cov.T) / 2
+
+        self.filtered_state, self.filtered_state_cov = state, cov
+        self.manifest["nobs"] = int(self.manifest.get("nobs", 0)) + len(endog)
+        return len(endog)
+
+    def save_state(self, path=None, last_index=None):
+        """Persist the filtered state (and manifest) so the next load forecasts from it."""
+        path = Path(path) if path is not None else self.path
+        if path is None:
+            raise ValueError("No artifact directory to save the state to")
+        if last_index is not None:
+            self.manifest["last_index"] = str(last_index)
+
+        path.mkdir(parents=True, exist_ok=True)
+        for name in STATE_ARRAYS:
+            tmp_path = path / f"{name}.tmp.npy"
+            np.save(tmp_path, getattr(self, name))
+            os.replace(tmp_path, path / f"{name}.npy")
+        tmp_path = path / "manifest.json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, path / "manifest.json")
+
+    def forecast_variance(self, steps=1):
+        _, covs = self.propagate(steps)
+        Z = self.design[0]
+        return np.einsum("i,hij,j->h", Z, covs, Z) + self.obs_cov[0, 0]
+
+
+def load_schema(path=SCHEMA_PATH):
+    """Feature list from a schema file: a plain JSON list, or the versioned form model.feature_selection writes."""
+    with open(path, "r") as f:
+        schema = json.load(f)
+    return schema["features"] if isinstance(schema, dict) else schema
+
+
+def load_model(pickle_path=PICKLE_PATH, compact_dir=COMPACT_DIR, state_dir=None):
+    """Prefer the compact artifact when it exists, else unpickle the full results."""
+    compact_dir = Path(compact_dir)
+    if (compact_dir / "manifest.json").exists():
+        return CompactSARIMAX.load(compact_dir, state_dir=state_dir)
+
+    import pickle
+    with open(pickle_path, "rb") as f:
+        return pickle.load(f)
+
+
+def high_water_kb():
+    """This process's peak RSS in KiB.
+
+    VmHWM covers only the process's own address space; ru_maxrss, the
+    fallback where /proc is missing, also counts a parent's peak inherited
+    across fork and exec.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+if sys.argv[1] == "pickle":
+    import pickle
+    with open(sys.argv[2], "rb") as f:
+        model = pickle.load(f)
+    k_exog = len(model.model.exog_names or [])
+    model.forecast(1, exog=[[0.0] * k_exog] if k_exog else None)
+else:
+    sys.path.insert(0, sys.argv[3])
+    from model.compact import CompactSARIMAX
+    model = CompactSARIMAX.load(sys.argv[2])
+    model.forecast(1, exog=[[0.0] * len(model.exog_names)])
+elapsed = time.perf_counter() - start
+sys.path.insert(0, sys.argv[3])
+from model.compact import high_water_kb
+print(elapsed, high_water_kb())
+"""
+
+
+def compare_load(pickle_path=PICKLE_PATH, compact_dir=COMPACT_DIR):
+    """Cold-start seconds (imports + load + first forecast) and peak RSS of each format, each in a fresh process."""
+    report = {}
+    for kind, path in (("pickle", pickle_path), ("compact", compact_dir)):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE, kind, str(path), str(MODEL_DIR.parent)],
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        size = os.path.getsize(path) if kind == "pickle" else sum(p.stat().st_size for p in Path(path).iterdir())
+        report[kind] = {"cold_start_s": float(out[0]), "peak_rss_mb": int(out[1]) / 1024, "disk_mb": size / 2**20}
+    return report
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "export"
+
+    if command == "export":
+        import pickle
+        with open(PICKLE_PATH, "rb") as f:
+            results = pickle.load(f)
+        export_compact(results, load_schema())
+        print(f"Wrote compact artifact to {COMPACT_DIR}")
+    elif command == "compare":
+        report = compare_load()
+        for kind, row in report.items():
+            print(f"{kind:8s} cold start {row['cold_start_s']:.3f}s  peak RSS {row['peak_rss_mb']:.1f} MB  on disk {row['disk_mb']:.2f} MB")
+        print(json.dumps(report))
+    else:
+        raise SystemExit(f"Unknown command {command!r}; use export or compare")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Feature selection stage: mutual information per column, memoized per data partition.
+
+The cleaned data is split into calendar-month partitions, the time component
+of the store's partitioning. For every (partition, column), the stage
+computes ``mutual_info_regression`` of the column against admissions. The
+score is cached under a hash of exactly the rows it was computed from. A
+column's score is the row-weighted mean over partitions. A retrain therefore
+only computes MI for partitions whose rows changed and for new columns.
+Misses run in parallel worker processes.
+
+Hashes and scores are computed on a canonical form of the data (``canonical``),
+so the same rows give the same keys and scores whether they were loaded with
+pandas' default dtypes or with ``load_cleaned_data(compact=True)``.
+
+The top ``top_k`` columns by score, plus hospital_id and the ward dummies,
+are written to ``model/sarimax_schema.json`` as a versioned schema:
+
+    {"version": 3, "data_hash": "...", "scores": {...}, "features": [...], ...}
+
+The version only increases when the feature list changes. When the data hash
+matches the schema on disk, the stage is skipped. Read the feature list with
+``model.compact.load_schema``.
+
+Usage::
+
+    python -m model.feature_selection            # refresh the schema if the data changed
+    python -m model.feature_selection --force    # recompute the selection (cached scores are reused)
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_selection import mutual_info_regression
+
+from model.compact import SCHEMA_PATH
+from model.train_series import load_cleaned_data
+
+MODEL_DIR = Path(__file__).resolve().parent
+CACHE_PATH = Path(os.getenv("MEDOPTIX_MI_CACHE", MODEL_DIR / "feature_selection_cache.json"))
+KEYS = ["date", "hospital_id", "ward_code"]
+TARGET = "admissions"
+TOP_K = 20
+RANDOM_STATE = 42
+WORKERS = int(os.getenv("MEDOPTIX_FEATURE_WORKERS", "0")) or None
+
+
+def candidate_columns(data):
+    return [c for c in data.columns if c not in KEYS and c != TARGET]
+
+
+def canonical(data):
+    """``data`` with one representation per kind of column, whatever dtypes it was loaded with.
+
+    Categories and strings become str, dates stay datetime64, and numbers
+    become float64 rounded through float32, the precision the compact loader
+    may keep them at.
+    """
+    out = {}
+    for column in data.columns:
+        values = data[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            out[column] = values
+        elif pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+            out[column] = values.to_numpy(np.float32).astype(np.float64)
+        else:
+            out[column] = values.astype(str)
+    return pd.DataFrame(out, index=data.index)
+
+
+def partitions(data):
+    """Yield (month, rows) with rows in a stable order, so equal data always hashes equally."""
+    data = data.sort_values(KEYS + [TARGET], kind="mergesort")
+    for month, rows in data.groupby(data["date"].dt.strftime("%Y-%m"), sort=True):
+        yield month, rows
+
+
+def _hash(values):
+    return pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes()
+
+
+def partition_keys(rows, columns):
+    """Cache key per column: a digest of the partition's keys, target and that column's values."""
+    base = hashlib.sha256(_hash(rows[KEYS + [TARGET]]))
+    keys = {}
+    for column in columns:
+        digest = base.copy()
+        digest.update(column.encode())
+        digest.update(_hash(rows[column]))
+        keys[column] = digest.hexdigest()[:24]
+    return keys
+
+
+def _score(month, values, target, columns):
+    scores = mutual_info_regression(values, target, random_state=RANDOM_STATE)
+    return month, dict(zip(columns, scores.tolist()))
+
+
+def load_cache(path=CACHE_PATH):
+    if Path(path).exists():
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def _write_json(obj, path):
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def mutual_information(data, cache_path=CACHE_PATH, workers=WORKERS):
+    """MI score per candidate column and a hash of all the inputs; only uncached partition/columns are computed."""
+    data = canonical(data)
+    columns = candidate_columns(data)
+    cache = load_cache(cache_path)
+    parts, misses = [], {}
+    for month, rows in partitions(data):
+        keys = partition_keys(rows, columns)
+        parts.append((month, len(rows), keys))
+        missing = [c for c in columns if keys[c] not in cache]
+        if missing:
+            misses[month] = (rows[missing].to_numpy(float), rows[TARGET].to_numpy(float), missing, keys)
+
+    if misses:
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            futures = [pool.submit(_score, month, values, target, missing)
+                       for month, (values, target, missing, _) in misses.items()]
+            for future in futures:
+                month, scores = future.result()
+                keys = misses[month][3]
+                cache.update({keys[column]: score for column, score in scores.items()})
+        n_scored = sum(len(m[2]) for m in misses.values())
+        print(f"Scored {n_scored} partition/columns in {len(misses)} partitions in {time.perf_counter() - start:.1f}s")
+        _write_json(cache, cache_path)
+    else:
+        print("All partition/column scores cached")
+
+    weights = np.array([n for _, n, _ in parts], dtype=float)
+    scores = {
+        column: float(np.average([cache[keys[column]] for _, _, keys in parts], weights=weights))
+        for column in columns
+    }
+    data_hash = hashlib.sha256("".join(keys[c] for _, _, keys in parts for c in columns).encode()).hexdigest()[:16]
+    return scores, data_hash
+
+
+def select_features(data=None, schema_path=SCHEMA_PATH, cache_path=CACHE_PATH, top_k=TOP_K, workers=WORKERS,
+                    force=False):
+    """Run the stage and return the versioned schema; skipped when the data has not changed."""
+    if data is None:
+        data = load_cleaned_data()
+    schema_path = Path(schema_path)
+    current = None
+    if schema_path.exists():
+        with open(schema_path, "r") as f:
+            current = json.load(f)
+    if not isinstance(current, dict):
+        current = None
+
+    scores, data_hash = mutual_information(data, cache_path, workers)
+    data_hash = f"{data_hash}-top{top_k}"
+    if current is not None and current.get("data_hash") == data_hash and not force:
+        print(f"Data unchanged; keeping schema version {current['version']}")
+        return current
+
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    ward_columns = [f"ward_code_{w}" for w in sorted(data["ward_code"].dropna().unique())]
+    features = ranked[:top_k] + ["hospital_id"] + ward_columns
+
+    version = 1
+    if current is not None:
+        version = current["version"] + (current["features"] != features)
+    schema = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "data_hash": data_hash,
+        "selection": {"method": "mutual_info_regression", "partition": "month", "top_k": top_k,
+                      "random_state": RANDOM_STATE},
+        "scores": {column: round(scores[column], 6) for column in ranked},
+        "features": features,
+    }
+    _write_json(schema, schema_path)
+    print(f"Wrote schema version {version} ({len(features)} features) to {schema_path}")
+    return schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Select SARIMAX exog features by mutual information.")
+    parser.add_argument("--schema", default=SCHEMA_PATH, type=Path)
+    parser.add_argument("--cache", default=CACHE_PATH, type=Path)
+    parser.add_argument("--top-k", default=TOP_K, type=int)
+    parser.add_argument("--workers", default=WORKERS, type=int)
+    parser.add_argument("--force", action="store_true", help="rewrite the schema even if the data is unchanged")
+    args = parser.parse_args()
+    select_features(schema_path=args.schema, cache_path=args.cache, top_k=args.top_k, workers=args.workers,
+                    force=args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Parallel, cached SARIMAX order search.
+
+Candidates (p,d,q)(P,D,Q,m) are fitted in a process pool in two rounds:
+
+1. screen - every candidate gets a short fit (``screen_maxiter`` iterations).
+   Candidates that fail, or whose AIC trails the best screened AIC by more
+   than ``prune_margin``, are dropped. Ones that already converged are final.
+2. full   - the survivors resume from their screened parameters and run to
+   ``maxiter`` iterations, best screen first;
+   queued fits whose screen AIC trails the best full AIC by more than
+   ``prune_margin`` are cancelled.
+
+Every fit is cached as JSON under ``model/order_cache/<data hash>/`` keyed
+on the order and iteration budget, so a rerun on the same data only fits
+candidates it has not seen.
+
+Usage::
+
+    python -m model.order_search            # search the notebook's weekly series, print the leaderboard
+    python -m model.order_search compare    # exhaustive sequential fits vs cold and cached search
+"""
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from model.compact import load_schema
+
+MODEL_DIR = Path(__file__).resolve().parent
+CACHE_DIR = Path(os.getenv("MEDOPTIX_ORDER_CACHE", MODEL_DIR / "order_cache"))
+SCHEMA_PATH = MODEL_DIR / "sarimax_schema.json"
+
+SCREEN_MAXITER = 10
+MAXITER = 50
+PRUNE_MARGIN = 10.0
+
+
+def candidate_orders(max_p=3, max_d=1, max_q=3, max_P=2, max_D=1, max_Q=2, m=7):
+    """Every ((p, d, q), (P, D, Q, m)) within the bounds."""
+    return [
+        ((p, d, q), (P, D, Q, m))
+        for p, d, q, P, D, Q in itertools.product(
+            range(max_p + 1), range(max_d + 1), range(max_q + 1),
+            range(max_P + 1), range(max_D + 1), range(max_Q + 1),
+        )
+    ]
+
+
+def data_hash(endog, exog=None):
+    """Stable hash of the values, index and column names a fit would see."""
+    digest = hashlib.sha256()
+    for frame in (endog, exog):
+        if frame is None:
+            digest.update(b"none")
+            continue
+        values = np.ascontiguousarray(np.asarray(frame, dtype=float))
+        digest.update(str(values.shape).encode())
+        digest.update(values.tobytes())
+        if hasattr(frame, "index"):
+            digest.update(pd.Index(frame.index).astype(str).str.cat(sep=",").encode())
+        if hasattr(frame, "columns"):
+            digest.update(",".join(map(str, frame.columns)).encode())
+    return digest.hexdigest()[:16]
+
+
+def _key(order, seasonal_order, maxiter):
+    return "{}_{}_{}".format("".join(map(str, order)), "".join(map(str, seasonal_order)), maxiter)
+
+
+class FitCache:
+    """One small JSON file per (data hash, order, seasonal order, maxiter)."""
+
+    def __init__(self, root, digest):
+        self.dir = Path(root) / digest if root is not None else None
+
+    def get(self, order, seasonal_order, maxiter):
+        if self.dir is None:
+            return None
+        path = self.dir / f"{_key(order, seasonal_order, maxiter)}.json"
+        if path.exists():
+            with open(path, "r") as f:
+                return json.load(f)
+        return None
+
+    def put(self, result):
+        if self.dir is None:
+            return
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self.dir / f"{_key(result['order'], result['seasonal_order'], result['maxiter'])}.json"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+
+
+# Set once per worker process so the series is not pickled with every task.
+_ENDOG = None
+_EXOG = None
+
+
+def _init_worker(endog, exog):
+    global _ENDOG, _EXOG
+    _ENDOG, _EXOG = endog, exog
+
+
+def _fit(order, seasonal_order, maxiter, start_params=None, budget=None):
+    """Fit one candidate; ``start_params`` resumes a screened fit for the remaining ``budget`` iterations.
+
+    Only AIC/BIC are needed, so the parameter covariance is skipped.
+    """
+    start = time.perf_counter()
+    result = {"order": list(order), "seasonal_order": list(seasonal_order), "maxiter": maxiter}
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            fitted = SARIMAX(_ENDOG, exog=_EXOG, order=order, seasonal_order=seasonal_order).fit(
+                start_params=start_params, disp=False, maxiter=budget or maxiter, cov_type="none"
+            )
+        aic = float(fitted.aic)
+        result.update(aic=aic if math.isfinite(aic) else None, bic=float(fitted.bic),
+                      converged=bool(fitted.mle_retvals.get("converged", False)),
+                      params=[float(v) for v in fitted.params], error=None)
+    except Exception as e:
+        result.update(aic=None, bic=None, converged=False, params=None, error=str(e))
+    result["fit_s"] = time.perf_counter() - start
+    return result
+
+
+def search_orders(endog, exog=None, candidates=None, workers=None, cache_dir=CACHE_DIR,
+                  screen_maxiter=SCREEN_MAXITER, maxiter=MAXITER, prune_margin=PRUNE_MARGIN):
+    """Screen, prune and fully fit ``candidates``; returns a leaderboard sorted by AIC.
+
+    Columns: order, seasonal_order, aic, bic, converged, stage ("full",
+    "screen" for candidates that converged while screening, or "pruned"),
+    cached and fit_s. Pass ``cache_dir=None`` to disable the cache.
+    """
+    candidates = candidate_orders() if candidates is None else [(tuple(o), tuple(s)) for o, s in candidates]
+    endog_values = np.asarray(endog, dtype=float)
+    exog_values = None if exog is None else np.asarray(exog, dtype=float)
+    cache = FitCache(cache_dir, data_hash(endog, exog))
+    rows = {}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(endog_values, exog_values)) as pool:
+        screened = _run_round(pool, cache, candidates, screen_maxiter)
+
+        finite = [r for r in screened.values() if r["aic"] is not None]
+        best_screen = min((r["aic"] for r in finite), default=None)
+        survivors = []
+        for candidate, result in screened.items():
+            if result["aic"] is None or result["aic"] - best_screen > prune_margin:
+                rows[candidate] = dict(result, stage="pruned")
+            elif result["converged"]:
+                rows[candidate] = dict(result, stage="screen")
+            else:
+                survivors.append(candidate)
+        survivors.sort(key=lambda c: screened[c]["aic"])
+
+        leader = min((r["aic"] for r in rows.values() if r["stage"] == "screen"), default=math.inf)
+        full = _run_round(pool, cache, survivors, maxiter, screened, prune_margin, leader)
+        for candidate in survivors:
+            rows[candidate] = dict(full[candidate], stage="full") if candidate in full \
+                else dict(screened[candidate], stage="pruned")
+
+    board = pd.DataFrame([
+        dict(rows[c], order=tuple(rows[c]["order"]), seasonal_order=tuple(rows[c]["seasonal_order"]))
+        for c in candidates
+    ])
+    board["final"] = board["stage"] != "pruned"
+    board = board.sort_values(["final", "aic"], ascending=[False, True], na_position="last")
+    return board.drop(columns=["final", "maxiter", "params", "error"]).reset_index(drop=True)
+
+
+def _run_round(pool, cache, candidates, maxiter, screened=None, prune_margin=None, leader=math.inf):
+    """Fit ``candidates`` (cache first); with ``screened`` given, cancel ones that trail the leader."""
+    results, pending = {}, {}
+    for candidate in candidates:
+        cached = cache.get(*candidate, maxiter)
+        if cached is not None:
+            results[candidate] = dict(cached, cached=True)
+            if cached["aic"] is not None:
+                leader = min(leader, cached["aic"])
+        elif screened is None:
+            pending[pool.submit(_fit, *candidate, maxiter)] = candidate
+        elif screened[candidate]["aic"] - leader <= prune_margin:
+            screen = screened[candidate]
+            pending[pool.submit(_fit, *candidate, maxiter, screen["params"],
+                                maxiter - screen["maxiter"])] = candidate
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            candidate = pending.pop(future)
+            result = future.result()
+            cache.put(result)
+            results[candidate] = dict(result, cached=False)
+            if result["aic"] is not None:
+                leader = min(leader, result["aic"])
+        if screened is not None:
+            for future, candidate in list(pending.items()):
+                if screened[candidate]["aic"] - leader > prune_margin and future.cancel():
+                    del pending[future]
+    return results
+
+
+def best_order(board):
+    """(order, seasonal_order) of the leaderboard's best fully fitted candidate."""
+    row = board.iloc[0]
+    return tuple(row["order"]), tuple(row["seasonal_order"])
+
+
+def fit_best(endog, exog, board):
+    order, seasonal_order = best_order(board)
+    return SARIMAX(endog, exog=exog, order=order, seasonal_order=seasonal_order).fit(disp=False)
+
+
+def weekly_series(train_fraction=0.8):
+    """Training split of the weekly mean admissions and schema features, as the notebook builds them."""
+    from model.train_series import load_cleaned_data
+
+    schema = load_schema(SCHEMA_PATH)
+    data = load_cleaned_data().sort_values("date")
+    data = pd.get_dummies(data, columns=["ward_code"], drop_first=False)
+    data[data.select_dtypes(include=["bool"]).columns] = data.select_dtypes(include=["bool"]).astype(int)
+    data = data.set_index("date")
+    features = [f for f in schema if f in data.columns]
+    endog, exog = data["admissions"].resample("W").mean(), data[features].resample("W").mean()
+    train_size = int(len(endog) * train_fraction)
+    return endog.iloc[:train_size], exog.iloc[:train_size]
+
+
+def compare(endog, exog, candidates, workers=None):
+    """Wall-clock seconds: every candidate fitted fully one after another vs cold and cached search."""
+    import tempfile
+
+    report = {"candidates": len(candidates), "workers": workers or os.cpu_count()}
+    _init_worker(np.asarray(endog, dtype=float), None if exog is None else np.asarray(exog, dtype=float))
+    start = time.perf_counter()
+    exhaustive = [_fit(o, s, MAXITER) for o, s in candidates]
+    report["sequential_s"] = time.perf_counter() - start
+    best = min((r for r in exhaustive if r["aic"] is not None), key=lambda r: r["aic"])
+    report["sequential_best"] = [best["order"], best["seasonal_order"], best["aic"]]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        board = search_orders(endog, exog, candidates, workers, cache_dir)
+        report["search_s"] = time.perf_counter() - start
+        start = time.perf_counter()
+        search_orders(endog, exog, candidates, workers, cache_dir)
+        report["cached_s"] = time.perf_counter() - start
+
+    top = board.iloc[0]
+    report["search_best"] = [list(top["order"]), list(top["seasonal_order"]), top["aic"]]
+    report["full_fits"] = int((board["stage"] == "full").sum())
+    report["pruned"] = int((board["stage"] == "pruned").sum())
+    return report
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    endog, exog = weekly_series()
+    if argv and argv[0] == "compare":
+        candidates = candidate_orders(max_p=2, max_d=1, max_q=2, max_P=1, max_D=0, max_Q=1)
+        print(json.dumps(compare(endog, exog, candidates), indent=2))
+        return
+
+    board = search_orders(endog, exog)
+    print(board.head(15).to_string())
+    order, seasonal_order = best_order(board)
+    print(f"Best order: {order}")
+    print(f"Best seasonal_order: {seasonal_order}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import json
+import os
+import pickle
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+from model.compact import CompactSARIMAX, export_compact
+
+REGISTRY_DIR = Path(__file__).resolve().parent / "registry"
+
+
+def series_key(hospital_id, ward_code):
+    return f"{int(hospital_id)}_{ward_code}"
+
+
+class ModelRegistry:
+    """On-disk store of one fitted SARIMAX per (hospital_id, ward_code) series.
+
+    Layout::
+
+        registry/index.json          # key -> path, schema, size and fit metadata
+        registry/<hospital>_<ward>/sarimax_model.pkl
+        registry/<hospital>_<ward>/compact/        # forecast-only arrays, preferred by load()
+    """
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = Path(root)
+        self.index_path = self.root / "index.json"
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            if self.index_path.exists():
+                with open(self.index_path, "r") as f:
+                    self._index = json.load(f)
+            else:
+                self._index = {}
+        return self._index
+
+    def reload(self):
+        self._index = None
+        return self.index
+
+    def __contains__(self, key):
+        return series_key(*key) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def entry(self, hospital_id, ward_code):
+        return self.index.get(series_key(hospital_id, ward_code))
+
+    def save(self, hospital_id, ward_code, results, schema, **metadata):
+        """Pickle a fitted model for one series, export its compact form and record both in the index."""
+        key = series_key(hospital_id, ward_code)
+        model_dir = self.root / key
+        model_dir.mkdir(parents=True, exist_ok=True)
+        model_path = model_dir / "sarimax_model.pkl"
+
+        with open(model_path, "wb") as f:
+            pickle.dump(results, f)
+
+        compact = None
+        try:
+            export_compact(results, schema, model_dir / "compact")
+            compact = f"{key}/compact"
+        except ValueError as e:
+            print(f"Compact export skipped for {key}: {e}")
+
+        # nbytes is the footprint of whatever load() returns, for cache budgeting.
+        pickle_nbytes = model_path.stat().st_size
+        nbytes = sum(p.stat().st_size for p in (model_dir / "compact").iterdir()) if compact else pickle_nbytes
+
+        self.index[key] = {
+            "hospital_id": int(hospital_id),
+            "ward_code": ward_code,
+            "path": f"{key}/sarimax_model.pkl",
+            "compact": compact,
+            "schema": list(schema),
+            "nbytes": nbytes,
+            "pickle_nbytes": pickle_nbytes,
+            "trained_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            **metadata,
+        }
+        self._write_index()
+        return self.index[key]
+
+    def load(self, hospital_id, ward_code):
+        """Return (model, schema) for a series, or raise KeyError if it is not registered.
+
+        The compact artifact is used when present; the full pickle otherwise.
+        """
+        entry = self.entry(hospital_id, ward_code)
+        if entry is None:
+            raise KeyError(series_key(hospital_id, ward_code))
+
+        if entry.get("compact"):
+            return CompactSARIMAX.load(self.root / entry["compact"]), entry["schema"]
+
+        with open(self.root / entry["path"], "rb") as f:
+            model = pickle.load(f)
+        return model, entry["schema"]
+
+    def record_observations(self, hospital_id, ward_code, last_date, nobs):
+        """Note in the index that a series' state was advanced to ``last_date`` without a refit."""
+        entry = self.entry(hospital_id, ward_code)
+        if entry is None:
+            raise KeyError(series_key(hospital_id, ward_code))
+        if last_date is not None:
+            entry["last_date"] = str(pd.Timestamp(last_date).date())
+        entry["nobs_observed"] = int(nobs)
+        entry["observed_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self._write_index()
+        return entry
+
+    def _write_index(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
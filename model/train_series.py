@@ -0,0 +1,94 @@
+import warnings
+from pathlib import Path
+
+import pandas as pd
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from database import dataset, store
+from model.compact import load_schema
+from model.registry import ModelRegistry
+
+MODEL_DIR = Path(__file__).resolve().parent
+DATA_PATH = MODEL_DIR.parent / "Data" / "cleaned_data.csv"
+SCHEMA_PATH = MODEL_DIR / "sarimax_schema.json"
+
+
+def load_cleaned_data(columns=None, start=None, end=None, hospital_id=None, ward_code=None, compact=False):
+    """Cleaned features from the Parquet store when it has them, else from cleaned_data.csv.
+
+    Filters are pushed down to the store; the CSV fallback applies them after loading.
+    With ``compact``, columns get the small types of ``database.dataset``.
+    """
+    if store.exists("cleaned"):
+        if compact:
+            return dataset.read_arrow(store.read_arrow("cleaned", columns, start, end, hospital_id, ward_code))
+        return store.read_table("cleaned", columns, start, end, hospital_id, ward_code)
+
+    if compact:
+        data = dataset.read_csv(DATA_PATH, columns)
+    else:
+        data = pd.read_csv(DATA_PATH, parse_dates=["date"], usecols=columns)
+    if start is not None:
+        data = data[data["date"] >= pd.Timestamp(start)]
+    if end is not None:
+        data = data[data["date"] <= pd.Timestamp(end)]
+    if hospital_id is not None:
+        data = data[data["hospital_id"] == hospital_id]
+    if ward_code is not None:
+        data = data[data["ward_code"] == ward_code]
+    return data.reset_index(drop=True)
+
+
+def series_features(schema):
+    """Drop the hospital/ward identity columns; a per-series model does not need them."""
+    return [f for f in schema if f != "hospital_id" and not f.startswith("ward_code_")]
+
+
+def series_frames(data, features, freq="D"):
+    """Yield (hospital_id, ward_code, endog, exog) resampled per series.
+
+    Days without data stay missing in ``endog`` (the Kalman filter skips them);
+    exog is carried forward so the regression term is always defined. It is
+    never filled backwards: the resample starts on the series' first day with
+    data, and a later row must not leak into an earlier one.
+    """
+    for (hospital_id, ward_code), group in data.groupby(["hospital_id", "ward_code"]):
+        resampled = group.set_index("date")[["admissions"] + features].resample(freq).mean()
+        exog = resampled[features].ffill()
+        exog = exog.loc[:, exog.std() > 0]
+        yield hospital_id, ward_code, resampled["admissions"], exog
+
+
+def fit_series_models(data, registry, features, order=(1, 1, 1), seasonal_order=(2, 0, 2, 7),
+                      freq="D", min_obs=60):
+    """Fit one SARIMAX per (hospital_id, ward_code) and write each to ``registry``."""
+    fitted = []
+    for hospital_id, ward_code, endog, exog in series_frames(data, features, freq):
+        n_obs = int(endog.notna().sum())
+        if n_obs < min_obs:
+            print(f"Skipping {hospital_id}/{ward_code}: {n_obs} observations (< {min_obs})")
+            continue
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            results = SARIMAX(endog=endog, exog=exog, order=order, seasonal_order=seasonal_order).fit(disp=False)
+
+        registry.save(
+            hospital_id, ward_code, results, list(exog.columns),
+            order=list(order), seasonal_order=list(seasonal_order), freq=freq,
+            n_obs=n_obs, aic=float(results.aic), last_date=str(endog.index[-1].date()),
+        )
+        fitted.append((hospital_id, ward_code))
+        print(f"Fitted {hospital_id}/{ward_code}: {n_obs} observations, AIC {results.aic:.1f}")
+    return fitted
+
+
+def main():
+    data = load_cleaned_data().sort_values("date")
+    features = series_features(load_schema(SCHEMA_PATH))
+
+    fit_series_models(data, ModelRegistry(), features)
+
+
+if __name__ == "__main__":
+    main()
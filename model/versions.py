@@ -0,0 +1,179 @@
+"""Versioned global-model directories and the pointer that says which one is served.
+
+Layout::
+
+    versions/serving.json        # {"current": "v3", "candidate": "v4", "updated_at": ...}
+    versions/v3/sarimax_model.pkl
+    versions/v3/sarimax_compact/    # forecast-only arrays, preferred by load_model
+    versions/v3/sarimax_schema.json
+    versions/v3/version.json     # source and publish time
+    versions/observed/v3/        # v3's state as advanced by /observe (filtered state and manifest)
+
+A published version is never modified afterwards. State that /observe
+advances is saved under ``observed/`` and read back over the published
+arrays when the version loads (``observed_dir``). A version is copied into a
+scratch directory and renamed into place, so a reader never sees a partial
+version. ``serving.json`` is replaced atomically. The API's watcher
+(deploy/hot_reload.py) polls it and swaps the served model without a
+restart. ``candidate`` names a version to shadow-score against live traffic.
+Without ``serving.json``, the model directory itself is served, as before
+versioning.
+
+Usage::
+
+    python -m model.versions list
+    python -m model.versions publish [--source model/] [--activate | --candidate]
+    python -m model.versions activate v3
+    python -m model.versions candidate v4      # or "none" to stop shadowing
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+from model.compact import COMPACT_DIR, MODEL_DIR, PICKLE_PATH, SCHEMA_PATH
+
+VERSIONS_DIR = MODEL_DIR / "versions"
+POINTER = "serving.json"
+OBSERVED = "observed"
+ARTIFACTS = (PICKLE_PATH.name, COMPACT_DIR.name, SCHEMA_PATH.name)
+
+
+class ModelVersions:
+    def __init__(self, root=VERSIONS_DIR):
+        self.root = Path(root)
+        self.pointer_path = self.root / POINTER
+
+    def serving(self):
+        """The pointer as a dict (``current`` and ``candidate``, either may be None); {} before versioning."""
+        try:
+            with open(self.pointer_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def current(self):
+        return self.serving().get("current")
+
+    def candidate(self):
+        return self.serving().get("candidate")
+
+    def path(self, version):
+        return self.root / version
+
+    def serving_dir(self, default=MODEL_DIR):
+        """Directory of the served version, or ``default`` when nothing is versioned yet."""
+        current = self.current()
+        return self.path(current) if current else Path(default)
+
+    def list(self):
+        if not self.root.exists():
+            return []
+        versions = [p.name for p in self.root.iterdir() if (p / "version.json").exists()]
+        return sorted(versions, key=lambda v: (len(v), v))
+
+    def publish(self, source=MODEL_DIR, version=None, **metadata):
+        """Copy the artifacts in ``source`` into a new version directory; returns the version name."""
+        source = Path(source)
+        present = [name for name in ARTIFACTS if (source / name).exists()]
+        if SCHEMA_PATH.name not in present or len(present) < 2:
+            raise FileNotFoundError(f"No model and schema to publish in {source}")
+        if version is None:
+            numbers = [int(v[1:]) for v in self.list() if v[1:].isdigit()]
+            version = f"v{max(numbers, default=0) + 1}"
+        if version == OBSERVED:
+            raise ValueError(f"{OBSERVED!r} is reserved for observed state")
+        if self.path(version).exists():
+            raise FileExistsError(f"Version {version} already exists")
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        scratch = Path(tempfile.mkdtemp(prefix=f".{version}.", dir=self.root))
+        try:
+            for name in present:
+                if (source / name).is_dir():
+                    shutil.copytree(source / name, scratch / name)
+                else:
+                    shutil.copy2(source / name, scratch / name)
+            info = {"version": version, "source": str(source.resolve()), "artifacts": present,
+                    "published_at": datetime.now(timezone.utc).isoformat(timespec="seconds"), **metadata}
+            with open(scratch / "version.json", "w") as f:
+                json.dump(info, f, indent=2)
+            os.rename(scratch, self.path(version))
+        except BaseException:
+            shutil.rmtree(scratch, ignore_errors=True)
+            raise
+        return version
+
+    def set_serving(self, **changes):
+        """Update ``current`` and/or ``candidate`` in the pointer (None clears a candidate)."""
+        for version in changes.values():
+            if version is not None and version not in self.list():
+                raise KeyError(f"Unknown model version {version}")
+        serving = dict(self.serving(), **changes)
+        serving["updated_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.pointer_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(serving, f, indent=2)
+        os.replace(tmp_path, self.pointer_path)
+        return serving
+
+    def activate(self, version):
+        """Serve ``version``; a candidate that has just been promoted stops being shadowed."""
+        changes = {"current": version}
+        if self.candidate() == version:
+            changes["candidate"] = None
+        return self.set_serving(**changes)
+
+
+def observed_dir(model_dir):
+    """Where observed state for the published version in ``model_dir`` is kept; None for an unversioned directory."""
+    model_dir = Path(model_dir)
+    if not (model_dir / "version.json").exists():
+        return None
+    return model_dir.parent / OBSERVED / model_dir.name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Versioned global-model directories.")
+    parser.add_argument("--root", default=VERSIONS_DIR, type=Path)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    publish = sub.add_parser("publish")
+    publish.add_argument("--source", default=MODEL_DIR, type=Path)
+    publish.add_argument("--version", default=None)
+    role = publish.add_mutually_exclusive_group()
+    role.add_argument("--activate", action="store_true", help="serve the new version right away")
+    role.add_argument("--candidate", action="store_true", help="shadow-score the new version")
+    activate = sub.add_parser("activate")
+    activate.add_argument("version")
+    candidate = sub.add_parser("candidate")
+    candidate.add_argument("version", help='a version, or "none"')
+    args = parser.parse_args()
+
+    versions = ModelVersions(args.root)
+    if args.command == "publish":
+        version = versions.publish(args.source, args.version)
+        print(f"Published {version} to {versions.path(version)}")
+        if args.activate:
+            versions.activate(version)
+        elif args.candidate:
+            versions.set_serving(candidate=version)
+    elif args.command == "activate":
+        versions.activate(args.version)
+    elif args.command == "candidate":
+        versions.set_serving(candidate=None if args.version == "none" else args.version)
+
+    serving = versions.serving()
+    for version in versions.list():
+        role = {serving.get("current"): "serving", serving.get("candidate"): "candidate"}.get(version, "")
+        print(f"{version:8s} {role}")
+    if not serving.get("current"):
+        print(f"No version is active; serving {MODEL_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from deploy.batching import MicroBatcher
+
+
+def test_failing_item_does_not_fail_its_batch():
+    calls = []
+
+    def handler(items):
+        calls.append(list(items))
+        if "bad" in items:
+            raise ValueError("bad item")
+        return [item.upper() for item in items]
+
+    async def run():
+        batcher = MicroBatcher(handler, max_wait_ms=50)
+        try:
+            return await asyncio.gather(*(batcher.submit(item) for item in ("a", "bad", "b")),
+                                        return_exceptions=True)
+        finally:
+            await batcher.close()
+
+    results = asyncio.run(run())
+    assert results[0] == "A" and results[2] == "B"
+    assert isinstance(results[1], ValueError)
+    # Scored together first, then one at a time after the failure.
+    assert calls[0] == ["a", "bad", "b"]
+    assert sorted(map(tuple, calls[1:])) == [("a",), ("b",), ("bad",)]
+
+
+def test_single_failure_is_raised():
+    def handler(items):
+        raise ValueError("broken")
+
+    async def run():
+        batcher = MicroBatcher(handler, max_wait_ms=1)
+        try:
+            return await batcher.submit("x")
+        finally:
+            await batcher.close()
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())